@@ -10,12 +10,24 @@ import re
 import traceback
 import io
 import csv
+import hashlib
 # ------------------------------------------------
 
 # --- PDF DRAWING ANALYSIS ---
-from pdf_drawing_analyzer import PDFDrawingAnalyzer, analyze_pdf_drawing
+from pdf_drawing_analyzer import analyze_pdf_drawing, load_drawing_analysis
 # ---------------------------
 
+# --- PRICE BOOK PARSING & INDEXING ---
+from price_index import find_option_record, find_prices_for_sku, quote_lines
+from price_parser import load_sheets
+from pdf_text_cache import load_pdf_text
+from text_search import DEFAULT_MAX_RESULTS, load_cell_index, search_pdf
+from indexing_jobs import classify_file
+from cache_utils import file_content_hash
+from data_store import DEFAULT_NAMESPACE
+from upload_store import link_upload, save_upload
+# -------------------------------------
+
 # load .env
 load_dotenv()
 
@@ -49,9 +61,32 @@ app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50 MB
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# --- GLOBAL DATA STORE FOR ALL INDEXED FILES ---
-# This dictionary will store all processed DataFrames, keyed by filename.
-DATA_STORE = {}
+# Memory budget for compiled price indexes shared across requests
+app.config['PRICE_INDEX_CACHE_BYTES'] = int(os.getenv('PRICE_INDEX_CACHE_MB', '256')) * 1024 * 1024
+# Write compiled indexes to disk so other workers can memory-map them instead of re-parsing
+app.config['PRICE_INDEX_SNAPSHOTS'] = os.getenv('PRICE_INDEX_SNAPSHOTS', 'true').lower() == 'true'
+# Most recently used price indexes restored when each worker process starts serving (0 disables),
+# in the background or, with WARM_START_MODE=blocking, before its first request is answered
+app.config['WARM_START_FILES'] = int(os.getenv('WARM_START_FILES', '20'))
+app.config['WARM_START_MODE'] = os.getenv('WARM_START_MODE', 'background')
+# Worker processes for parsing price books (0 = one per CPU, up to 8)
+app.config['PARSE_WORKERS'] = int(os.getenv('PARSE_WORKERS', '0'))
+# Background threads that index uploads, and how long a question waits for one still in progress
+app.config['INDEXING_WORKERS'] = int(os.getenv('INDEXING_WORKERS', '2'))
+app.config['INDEXING_WAIT_SECONDS'] = int(os.getenv('INDEXING_WAIT_SECONDS', '120'))
+# Memory budget for cached answers to repeated pricing questions
+app.config['ANSWER_CACHE_BYTES'] = int(os.getenv('ANSWER_CACHE_MB', '16')) * 1024 * 1024
+# Memory ceiling for the DataFrames /api/analyze keeps indexed (least recently used are evicted)
+app.config['DATA_STORE_BYTES'] = int(os.getenv('DATA_STORE_MB', '512')) * 1024 * 1024
+
+# Parse pool workers are spawned processes, which re-import the main script (as __mp_main__)
+# when the app is started with `python app.py`. They only run parsing functions from other
+# modules, so they skip extension and database setup (and with it the warm start).
+PARSE_POOL_WORKER = __name__ == '__mp_main__'
+
+# --- DATA STORE FOR ALL INDEXED FILES ---
+# Processed DataFrames live in the managed `data_store` extension (see data_store.py),
+# namespaced per project and bounded by DATA_STORE_BYTES.
 # -----------------------------------------------
 
 # The Material Map is now used for *natural language matching* and is dynamic
@@ -69,14 +104,19 @@ MATERIAL_MAP = {
 
 # ---- Extensions import and init (expects extensions.py) --------------------
 try:
-    from extensions import db, login_manager, cors
-    db.init_app(app)
-    # ... (rest of extensions init) ...
-    login_manager.init_app(app)
-    login_manager.login_view = 'auth.login'
-    login_manager.login_message = 'Please log in to access this page.'
-    login_manager.login_message_category = 'info'
-    cors.init_app(app)
+    from extensions import db, login_manager, cors, price_index_cache, indexing_jobs, answer_cache, data_store
+    if not PARSE_POOL_WORKER:
+        db.init_app(app)
+        # ... (rest of extensions init) ...
+        login_manager.init_app(app)
+        login_manager.login_view = 'auth.login'
+        login_manager.login_message = 'Please log in to access this page.'
+        login_manager.login_message_category = 'info'
+        cors.init_app(app)
+        price_index_cache.init_app(app)
+        indexing_jobs.init_app(app)
+        answer_cache.init_app(app)
+        data_store.init_app(app)
 except Exception as e:
     print("Warning: extensions import failed. Make sure extensions.py exists and defines db, login_manager, cors.")
     print(e)
@@ -211,9 +251,9 @@ def test():
 # Dynamic Data Analysis Functions
 # ---------------------------
 
-def clean_and_index_data(file_content, filename):
+def clean_and_index_data(file_content, filename, namespace=DEFAULT_NAMESPACE):
     """
-    Dynamically cleans and indexes the uploaded file content into the global DATA_STORE.
+    Dynamically cleans and indexes the uploaded file content into the data store namespace.
     This function intelligently skips rows to find the correct header.
     """
     try:
@@ -240,11 +280,14 @@ def clean_and_index_data(file_content, filename):
         # Clean the primary key column
         df['CODE'] = df['CODE'].astype(str).str.strip().str.upper()
         
-        # Store the processed data
-        DATA_STORE[filename] = {
+        # Store the processed data (the content hash versions answers cached for this store)
+        # along with a CODE -> row positions hash index for O(1) SKU lookups
+        data_store.put(namespace, filename, {
             'df': df,
-            'original_cols': df.columns.tolist()
-        }
+            'original_cols': df.columns.tolist(),
+            'content_hash': hashlib.sha256(file_content).hexdigest(),
+            'code_index': df.groupby('CODE', sort=False).indices
+        })
         return True
     except Exception as e:
         print(f"Error processing {filename}: {e}")
@@ -281,8 +324,8 @@ def extract_entities(question):
     return {'sku': sku, 'material': material}
 
 
-def get_dynamic_answer(question):
-    """Answers the question by querying the dynamic data store."""
+def get_dynamic_answer(question, snapshot):
+    """Answers the question by querying one project's data store snapshot."""
     entities = extract_entities(question)
     sku = entities['sku']
     material = entities['material']
@@ -290,15 +333,13 @@ def get_dynamic_answer(question):
     if not sku:
         return "I could not identify a valid SKU or Option Code in your question. Please verify the code and try again."
 
-    # Search all files in the data store for the SKU
-    for filename, data in DATA_STORE.items():
+    # Look up the SKU in the project's CODE index; files are checked in indexing order
+    for filename, data, positions in snapshot.lookup(sku):
         df = data['df']
         
-        # Look for a row matching the extracted SKU
-        sku_row = df[df['CODE'] == sku]
-
-        if not sku_row.empty:
-            prices = sku_row.iloc[0]
+        # First row matching the extracted SKU
+        if len(positions):
+            prices = df.iloc[positions[0]]
             
             # --- Scenario 1: Option Pricing (MI, APC, etc.) ---
             if 'Option Pricing' in filename:
@@ -385,17 +426,14 @@ def read_file():
         filename = file.filename
         _, ext = os.path.splitext(filename.lower())
 
-        # save temp
-        tmp = os.path.join(app.config['UPLOAD_FOLDER'], f"{int(pd.Timestamp.now().timestamp())}_{filename}")
-        file.save(tmp)
+        # save once per content (later uploads of the same file reuse its cached text and
+        # sheets); the timestamped name /api/ask looks files up by is a link to it
+        stored_name, _, _ = save_upload(file, app.config['UPLOAD_FOLDER'], filename)
+        tmp = link_upload(app.config['UPLOAD_FOLDER'], stored_name, f"{int(pd.Timestamp.now().timestamp())}_{filename}")
 
         if ext == '.pdf':
-            # extract text with PyMuPDF
-            import fitz # PyMuPDF
-            text = ""
-            with fitz.open(tmp) as doc:
-                for page in doc:
-                    text += page.get_text("text") + "\n"
+            # extract text with PyMuPDF; the per-page text is cached for /api/ask
+            text = load_pdf_text(tmp).text()
 
             # If PDF has no extractable text, we could add OCR later (tesseract)
             data = {
@@ -406,15 +444,16 @@ def read_file():
             return jsonify({"status": "success", "data": data}), 200
 
         elif ext in ('.xls', '.xlsx'):
-            # read all sheets with pandas
-            try:
-                sheets = pd.read_excel(tmp, sheet_name=None)
-            except Exception as e:
-                return jsonify({"error": f"Failed to read Excel: {str(e)}"}, 500)
+            # read all sheets (in parallel, with header detection on each); this also
+            # writes the parsed-sheet sidecar that /api/ask reads for this upload
+            sheets = load_sheets(tmp, filename)
+            if sheets is None:
+                return jsonify({"error": "Failed to read Excel file."}), 500
 
             sheet_summaries = {}
             for sheet_name, df in sheets.items():
-                df = df.dropna(how='all')
+                # blank cells are read as '' rather than NaN
+                df = df[(df.astype(str).apply(lambda col: col.str.strip()) != '').any(axis=1)]
                 # clean column names to strings
                 df.columns = [str(c).strip() for c in df.columns]
                 sheet_summaries[sheet_name] = {
@@ -453,7 +492,7 @@ def ask_about_file():
         saved_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         if not os.path.exists(saved_path):
             # try matching with substring (in case timestamp prefix used)
-            candidates = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if filename in f]
+            candidates = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if filename in f and not f.startswith('.')]
             if candidates:
                 saved_path = os.path.join(app.config['UPLOAD_FOLDER'], candidates[0])
             else:
@@ -464,49 +503,29 @@ def ask_about_file():
         q = question.lower()
 
         if ext == '.pdf':
-            import fitz # PyMuPDF
-            text = ""
-            with fitz.open(saved_path) as doc:
-                for page in doc:
-                    text += page.get_text("text") + "\n"
-            # simple keyword search
-            lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-            matches = [ln for ln in lines if q in ln.lower()]
+            # ranked keyword/phrase search over the PDF's line index (built once per file)
+            total, matches = search_pdf(saved_path, question, limit=int(body.get('max_results', DEFAULT_MAX_RESULTS)))
             if matches:
-                answer = " ".join(matches[:5])
+                answer = " ".join(match['text'] for match in matches[:5])
                 return jsonify({
                     "answer": answer,
-                    "explanation": f"Found {len(matches)} matching lines in PDF (showing up to 5)."
+                    "explanation": f"Found {total} matching lines in PDF (showing up to 5).",
+                    "matches": matches
                 })
             else:
                 # fuzzy fallback: show first 2000 chars
                 return jsonify({
                     "answer": "No exact match found inside PDF text.",
                     "hint": "Try asking for a keyword such as 'FROSTED' or 'W1842', or upload the correct sheet.",
-                    "text_sample": text[:2000]
+                    "text_sample": load_pdf_text(saved_path).text()[:2000]
                 }), 200
 
         elif ext in ('.xls', '.xlsx'):
-            sheets = pd.read_excel(saved_path, sheet_name=None)
-            found = []
-            for sheet_name, df in sheets.items():
-                # normalize columns to str
-                df.columns = [str(c) for c in df.columns]
-                # search across all columns
-                try:
-                    mask = pd.DataFrame(False, index=df.index, columns=df.columns)
-                    for col in df.columns:
-                        mask_col = df[col].astype(str).str.contains(question, case=False, na=False)
-                        if mask_col.any():
-                            matches = df[mask_col]
-                            found.append({
-                                "sheet": sheet_name,
-                                "column": col,
-                                "rows": matches.head(5).to_dict(orient='records')
-                            })
-                except Exception:
-                    # ignore problematic column casts
-                    continue
+            # search across all cells through the workbook's cell index (built once per file)
+            cell_index = load_cell_index(saved_path, saved_path)
+            if cell_index is None:
+                return jsonify({"error": "Failed to read Excel file."}), 500
+            found = cell_index.search(question)
 
             if found:
                 # Build a friendly natural answer summarizing the top match
@@ -555,202 +574,14 @@ def ask_about_file():
 # 🛠️ SMART PRICING ANALYSIS (NEW CODE TO FIX THE CHAT)
 # ---------------------------
 
-# Map for converting header codes/descriptions to natural material names
-MATERIAL_ID_MAP = {
-    '763': 'ELITE CHERRY / ELITE DURAFORM (TEXTURED)',
-    '682': 'PREMIUM CHERRY / PREMIUM DURAFORM (TEXTURED) / ELITE MAPLE / ELITE PAINTED',
-    '608': 'PRIME CHERRY / PREMIUM MAPLE / PREMIUM PAINTED / PREMIUM DURAFORM (NON-TEXTURED)',
-    '543': 'PRIME MAPLE / PRIME PAINTED / PRIME DURAFORM',
-    '485': 'CHOICE DURAFORM / CHOICE MAPLE / CHOICE PAINTED',
-    'BASE': 'BASE / STANDARD',
-    'STANDARD': 'BASE / STANDARD',
-    'N/A': 'BASE / STANDARD',
-    '753': 'ELITE CHERRY / ELITE DURAFORM (TEXTURED)',
-    '672': 'PREMIUM CHERRY / ELITE MAPLE / ELITE PAINTED',
-    '600': 'PRIME CHERRY / PREMIUM MAPLE / PREMIUM PAINTED / PREMIUM DURAFORM (NON-TEXTURED)',
-    '536': 'PRIME MAPLE / PRIME PAINTED / PRIME DURAFORM',
-    '479': 'CHOICE DURAFORM / CHOICE MAPLE / CHOICE PAINTED',
-}
-
-def extract_material_name(raw_header):
-    """Translates raw header to a standard material name using the map."""
-    if not raw_header:
-        return ''
-    
-    material_name = str(raw_header).strip().upper()
-    
-    # 1. Check Hardcoded ID Map
-    numeric_code_match = re.search(r'\b\d{3}\b', material_name)
-    if numeric_code_match and numeric_code_match.group() in MATERIAL_ID_MAP:
-        return MATERIAL_ID_MAP[numeric_code_match.group()]
-    
-    for key, value in MATERIAL_ID_MAP.items():
-        if key in material_name:
-             return value
-
-    # 2. Check Keywords
-    if 'ELITE CHERRY' in material_name or 'ELITE DURAFORM' in material_name:
-        return 'ELITE CHERRY / ELITE DURAFORM (TEXTURED)'
-    if 'PREMIUM CHERRY' in material_name or 'PREMIUM DURAFORM' in material_name or 'ELITE MAPLE' in material_name:
-        return 'PREMIUM CHERRY / PREMIUM DURAFORM (TEXTURED) / ELITE MAPLE / ELITE PAINTED'
-    if 'PRIME CHERRY' in material_name or 'PRIME MAPLE' in material_name:
-        return 'PRIME CHERRY / PREMIUM MAPLE / PREMIUM PAINTED / PREMIUM DURAFORM (NON-TEXTURED)'
-    if 'BASE' in material_name or 'STANDARD' in material_name:
-        return 'BASE / STANDARD'
-    
-    return material_name
-
-def parse_data_file(file_path, filename):
-    """Reads a file into a pandas DataFrame, trying to detect the header row."""
-    df = None
-    try:
-        # Check if the file is an Excel file
-        if filename.lower().endswith(('.xlsx', '.xls')):
-            xls = pd.ExcelFile(file_path)
-            sheet_name = xls.sheet_names[0]
-            df_check = pd.read_excel(xls, sheet_name=sheet_name, header=None, nrows=10, keep_default_na=False)
-            
-            # Simple header detection
-            best_header_row = 0
-            max_score = -1
-            
-            for i in range(len(df_check)):
-                row = df_check.iloc[i]
-                score = row.apply(lambda x: 1 if isinstance(x, str) and len(str(x).strip()) > 0 and not re.match(r'^-?\d+(\.\d+)?$', str(x).strip()) else 0).sum()
-                if score > max_score and str(row.iloc[0]).strip().upper() in ['SKU', 'OPTION', 'W942', 'DDF24', 'DOOR STYLES', 'WRH3024 RP', 'CONSTRUCTION OPTIONS']:
-                    max_score = score
-                    best_header_row = i
-            
-            df = pd.read_excel(xls, sheet_name=sheet_name, header=best_header_row, keep_default_na=False)
-
-        # Check if the file is a CSV
-        elif filename.lower().endswith('.csv'):
-             df_check = pd.read_csv(file_path, header=None, nrows=10, keep_default_na=False)
-            
-             best_header_row = 0
-             max_score = -1
-             for i in range(len(df_check)):
-                 row = df_check.iloc[i]
-                 score = row.apply(lambda x: 1 if isinstance(x, str) and len(str(x).strip()) > 0 and not re.match(r'^-?\d+(\.\d+)?$', str(x).strip()) else 0).sum()
-                 if score > max_score and str(row.iloc[0]).strip().upper() in ['SKU', 'OPTION', 'W942', 'DDF24', 'DOOR STYLES', 'WRH3024 RP', 'CONSTRUCTION OPTIONS']:
-                     max_score = score
-                     best_header_row = i
-            
-             df = pd.read_csv(file_path, header=best_header_row, keep_default_na=False)
-        
-        if df is not None:
-            df = df.dropna(axis=1, how='all')
-            df.columns = [str(col).strip() if not str(col).startswith('Unnamed:') else '' for col in df.columns]
-
-        return df
-
-    except Exception as e:
-        app.logger.error(f"Error parsing file {filename}: {e}")
-        return None
-
-def build_data_index(data_frames, filename_map):
-    """Builds a flattened index map: SKU -> List of Price Records."""
-    data_index = {}
-    
-    for filename, df in data_frames.items():
-        if df is None or df.empty:
-            continue
-
-        raw_headers = list(df.columns)
-        sku_col_name = next((col for col in raw_headers if col.strip()), None)
-        
-        if not sku_col_name:
-            continue
-
-        for index, row in df.iterrows():
-            sku_raw = row[sku_col_name]
-            if pd.isna(sku_raw) or not str(sku_raw).strip():
-                continue
-
-            sku = str(sku_raw).strip().upper().replace(' ', '')
-            
-            if not re.match(r'^[A-Z]{1,4}\d{2,6}|MI$', sku):
-                 continue
-
-            record = {
-                'sku': sku,
-                'source': f"{filename_map.get(filename, filename)} > Row {index + 1}",
-                'prices': []
-            }
-            
-            for i, raw_header in enumerate(raw_headers):
-                if raw_header == sku_col_name or raw_header.startswith('Unnamed:') or not raw_header.strip():
-                    continue
-                
-                cell_value = row.iloc[i]
-                if pd.isna(cell_value) or not str(cell_value).strip():
-                    continue
-                
-                # Special handling for Option Pricing sheet MI code
-                if sku == 'MI' and raw_header.upper() == 'PRICING':
-                    if sku not in data_index:
-                        data_index[sku] = []
-                    data_index[sku].append({
-                        'sku': sku,
-                        'source': record['source'],
-                        'option_pricing': str(cell_value).strip()
-                    })
-                    continue
-
-                try:
-                    price_str = re.sub(r'[$,]', '', str(cell_value)).strip()
-                    price = float(price_str)
-                    
-                    if 50 <= price <= 20000:
-                        material_name = extract_material_name(raw_header)
-                        if material_name.strip():
-                             record['prices'].append({
-                                'material': material_name,
-                                'price': price
-                            })
-                except ValueError:
-                    pass
-            
-            if record['prices']:
-                if sku not in data_index:
-                    data_index[sku] = []
-                data_index[sku].append(record)
-
-    return data_index
-
-def find_prices_for_sku(sku, data_index):
-    """Finds all price points for a normalized SKU from the data index."""
-    normalized_sku = sku.strip().upper().replace(' ', '')
-    
-    all_prices = []
-    seen_materials = set()
-    
-    if normalized_sku in data_index:
-        for record in data_index[normalized_sku]:
-            for price_data in record['prices']:
-                material = price_data['material']
-                price = price_data['price']
-                
-                key = f"{material}:{price}"
-                if key not in seen_materials:
-                    all_prices.append({
-                        'sku': normalized_sku,
-                        'material': material,
-                        'price': price,
-                        'source': record['source']
-                    })
-                    seen_materials.add(key)
-    
-    return sorted(all_prices, key=lambda x: x['price'])
-
 def process_question(question, data_index):
     """Answers the user question based on the indexed data."""
     q = question.strip().lower()
 
     # 1. Handle Non-SKU Option Questions (e.g., MI Option)
     if 'matching interior option' in q or 'mi option' in q:
-        if 'MI' in data_index and data_index['MI']:
-            mi_record = data_index['MI'][0]
+        mi_record = find_option_record('MI', data_index)
+        if mi_record:
             mi_pricing = mi_record.get('option_pricing', '20% Over List Price')
             return {
                 'success': True,
@@ -841,15 +672,60 @@ def get_file_path_from_id(file_id):
             
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename_id)
     
+    # Project files (ProjectFile.to_dict) carry the URL of their stored upload, which is
+    # named by content hash rather than by file name
+    url = file_id.get('url') if isinstance(file_id, dict) else None
+    if not os.path.exists(file_path) and isinstance(url, str) and url.startswith('/static/uploads/'):
+        stored_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(url))
+        if os.path.exists(stored_path):
+            return stored_path
+    
     # Try matching with substring (in case file has a timestamp prefix)
     if not os.path.exists(file_path):
-        candidates = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if filename_id in f]
+        candidates = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if filename_id in f and not f.startswith('.')]
         if candidates:
             return os.path.join(app.config['UPLOAD_FOLDER'], candidates[0])
     
     return file_path
 
 
+def upload_file_path(file_path):
+    """Real path of a client-supplied file path, or None if it is outside the upload folder."""
+    upload_folder = os.path.realpath(app.config['UPLOAD_FOLDER'])
+    real_path = os.path.realpath(file_path)
+    if os.path.commonpath([upload_folder, real_path]) != upload_folder:
+        return None
+    return real_path
+
+
+def resolve_selected_files(file_ids):
+    """Maps the frontend's file objects to unique (file_path, display name) pairs that exist on disk."""
+    files = []
+    seen_paths = set()
+    
+    for file_id in file_ids:
+        # The frontend passes the full file object if files were selected previously.
+        file_name_for_map = file_id.get('name') or file_id.get('filename') or str(file_id)
+        file_path = get_file_path_from_id(file_id)
+
+        if not os.path.exists(file_path):
+            app.logger.warning(f"File not found: {file_path}")
+            continue
+
+        if file_path in seen_paths:
+            continue
+        seen_paths.add(file_path)
+        files.append((file_path, file_name_for_map))
+
+    return files
+
+
+def selected_price_view(files):
+    """Merged price index over the selected files, waiting for any still being indexed in the background."""
+    indexing_jobs.wait_for([file_path for file_path, _ in files])
+    return price_index_cache.view(files)
+
+
 # ----------------------------------------------------
 # NEW ROUTE: /api/projects/analyze-files
 # (This route handles the chat component's request)
@@ -863,40 +739,74 @@ def analyze_files_route():
     if not file_ids or not question:
         return jsonify(error="Missing file IDs or question."), 400
 
-    data_frames = {}
-    filename_map = {}
-    
-    # 1. Parse Files
-    for file_id in file_ids:
-        # The frontend passes the full file object if files were selected previously.
-        file_name_for_map = file_id.get('name') or file_id.get('filename') or str(file_id)
-        file_path = get_file_path_from_id(file_id)
-
-        if not os.path.exists(file_path):
-            app.logger.warning(f"File not found: {file_path}")
-            continue
+    # 1. Repeated questions about unchanged files are answered from the answer cache
+    files = resolve_selected_files(file_ids)
+    answer_key = answer_cache.key('pricing', question, price_index_cache.fingerprint(files))
+    result = answer_cache.get(answer_key)
+    if result is not None:
+        return jsonify(analysis=result['message'], success=result['success'])
 
-        # file_path[-25:] is a simple way to get a unique identifier for the dataframe key
-        df_key = os.path.basename(file_path) 
+    # 2. Query all of the files' segments through one merged view
+    # (segments are prebuilt by the upload's background indexing job, or parsed on first use)
+    data_index = selected_price_view(files)
 
-        df = parse_data_file(file_path, file_name_for_map)
-        if df is not None:
-            data_frames[df_key] = df
-            filename_map[df_key] = file_name_for_map
-            
-    if not data_frames:
+    if not data_index.segments:
         return jsonify(error="No valid Excel or CSV files could be parsed. Analysis failed."), 400
-
-    # 2. Build Index and Process Question
-    data_index = build_data_index(data_frames, filename_map)
     
     if not data_index:
         return jsonify(error="Could not extract any SKU pricing data from the files. Check that files contain SKU codes and pricing columns."), 400
 
+    # 3. Process Question
     result = process_question(question, data_index)
+    answer_cache.put(answer_key, result)
 
     return jsonify(analysis=result['message'], success=result['success'])
 
+
+# ----------------------------------------------------
+# NEW ROUTE: /api/projects/quote
+# (Prices a whole cabinet schedule in one request)
+# ----------------------------------------------------
+MAX_QUOTE_LINES = 5000
+
+@app.route('/api/projects/quote', methods=['POST'])
+def quote_route():
+    """
+    Bulk quote pricing.
+    Expects JSON with 'file_ids', 'lines' ([{sku, material, qty}, ...]) and an optional
+    default 'material' for lines that don't specify one.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        file_ids = data.get('file_ids', [])
+        lines = data.get('lines', [])
+
+        if not file_ids or not lines or not isinstance(lines, list):
+            return jsonify(error="Missing file IDs or quote lines."), 400
+
+        if len(lines) > MAX_QUOTE_LINES:
+            return jsonify(error=f"Quotes are limited to {MAX_QUOTE_LINES} lines."), 400
+
+        if not all(isinstance(line, dict) for line in lines):
+            return jsonify(error="Each quote line must be an object with 'sku', 'material' and 'qty'."), 400
+
+        data_index = selected_price_view(resolve_selected_files(file_ids))
+        if not data_index.segments:
+            return jsonify(error="No valid Excel or CSV files could be parsed. Analysis failed."), 400
+
+        priced_lines, totals = quote_lines(lines, data_index, default_material=data.get('material', ''))
+
+        return jsonify(
+            success=True,
+            lines=priced_lines,
+            misses=[line for line in priced_lines if line['status'] != 'ok'],
+            totals=totals
+        )
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify(error=f"Quote pricing failed: {str(e)}"), 500
+
 # ---------------------------
 # END NEW ANALYSIS CODE
 # ---------------------------
@@ -909,43 +819,55 @@ def analyze_files_route():
 @app.route('/api/analyze', methods=['POST'])
 def analyze_question():
     """
-    Main endpoint for dynamic pricing analysis using the DATA_STORE.
-    Expects JSON with 'question' and optionally 'file_ids' to index files.
+    Main endpoint for dynamic pricing analysis using the data store.
+    Expects JSON with 'question' and optionally 'file_ids' to index files and
+    'project_id' to scope the indexed files to one project.
     """
     try:
         data = request.json
         question = data.get('question', '')
         file_ids = data.get('file_ids', [])
+        namespace = data_store.namespace_for(data.get('project_id'))
         
-        # If file_ids are provided, index them first
-        if file_ids and not DATA_STORE:
+        # If file_ids are provided, index the ones not already in the store (or changed since)
+        file_names = []
+        if file_ids:
             for file_id in file_ids:
                 file_name = file_id.get('name') or file_id.get('filename') or str(file_id)
+                file_names.append(file_name)
                 file_path = get_file_path_from_id(file_id)
                 
-                if os.path.exists(file_path):
+                if not os.path.exists(file_path):
+                    continue
+                indexed = data_store.get(namespace, file_name)
+                if indexed is None or indexed.get('content_hash') != file_content_hash(file_path):
                     try:
                         # Read file content
                         with open(file_path, 'rb') as f:
                             file_content = f.read()
                         
                         # Index the file
-                        clean_and_index_data(file_content, file_name)
+                        clean_and_index_data(file_content, file_name, namespace)
                     except Exception as e:
                         app.logger.warning(f"Failed to index file {file_name}: {e}")
         
-        # Check if DATA_STORE has data
-        if not DATA_STORE:
+        # Answer from one immutable snapshot of the project's data, so concurrent
+        # re-indexing or clearing can't change the files mid-answer. When files were
+        # given, only those are searched (other callers' files may share the namespace)
+        snapshot = data_store.snapshot(namespace)
+        if file_ids:
+            snapshot = snapshot.select(file_names)
+        if not snapshot.files:
             return jsonify({
                 'error': 'No indexed files found. Please ensure files are successfully uploaded and parsed.'
             }), 400
 
-        # Generate dynamic answer
-        answer = get_dynamic_answer(question)
+        # Generate dynamic answer (repeated questions against the same indexed files are cached)
+        answer = answer_cache.get_or_compute('dynamic', question, snapshot.fingerprint, lambda: get_dynamic_answer(question, snapshot))
         
         return jsonify({
             'answer': answer,
-            'source_files': list(DATA_STORE.keys()),
+            'source_files': list(snapshot.files.keys()),
             'success': True
         })
 
@@ -960,12 +882,13 @@ def analyze_question():
 @app.route('/api/analyze/index-files', methods=['POST'])
 def index_files_endpoint():
     """
-    Endpoint to manually trigger file indexing into DATA_STORE.
+    Endpoint to manually trigger file indexing into the data store.
     Useful for pre-indexing files before analysis.
     """
     try:
         data = request.json
         file_ids = data.get('file_ids', [])
+        namespace = data_store.namespace_for(data.get('project_id'))
         
         if not file_ids:
             return jsonify({'error': 'No file IDs provided'}), 400
@@ -987,7 +910,7 @@ def index_files_endpoint():
                     file_content = f.read()
                 
                 # Index the file
-                success = clean_and_index_data(file_content, file_name)
+                success = clean_and_index_data(file_content, file_name, namespace)
                 if success:
                     indexed_files.append(file_name)
                 else:
@@ -1000,7 +923,7 @@ def index_files_endpoint():
             'success': True,
             'indexed_files': indexed_files,
             'failed_files': failed_files,
-            'total_indexed': len(DATA_STORE)
+            'total_indexed': len(data_store.snapshot(namespace))
         })
     
     except Exception as e:
@@ -1014,10 +937,14 @@ def index_files_endpoint():
 @app.route('/api/analyze/clear-cache', methods=['POST'])
 def clear_data_store():
     """
-    Clears the DATA_STORE cache. Useful for testing or resetting the analysis state.
+    Clears the data store (one project's files if 'project_id' is given, otherwise all).
+    Useful for testing or resetting the analysis state.
     """
     try:
-        DATA_STORE.clear()
+        data = request.get_json(silent=True) or {}
+        project_id = data.get('project_id')
+        data_store.clear(data_store.namespace_for(project_id) if project_id is not None else None)
+        answer_cache.clear()
         return jsonify({
             'success': True,
             'message': 'Data store cleared successfully'
@@ -1028,6 +955,21 @@ def clear_data_store():
         }), 500
 
 
+@app.route('/api/analyze/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss counters and occupancy of the answer and price index caches and the data store,
+    plus the progress of the startup warm start.
+    """
+    return jsonify({
+        'success': True,
+        'answers': answer_cache.stats(),
+        'price_indexes': price_index_cache.stats(),
+        'warm_start': price_index_cache.warm_status,
+        'data_store': data_store.stats()
+    })
+
+
 # ============================================
 # PDF DRAWING ANALYSIS ENDPOINTS
 # ============================================
@@ -1046,6 +988,12 @@ def analyze_drawing():
         if not file_path:
             return jsonify({'error': 'No file path provided'}), 400
         
+        # Only uploads are analyzed: the analysis caches are written next to the file
+        label = os.path.basename(file_path)
+        file_path = upload_file_path(file_path)
+        if file_path is None:
+            return jsonify({'error': 'File is not in the upload folder'}), 403
+        
         # Check if file exists and is a PDF
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found'}), 404
@@ -1053,9 +1001,10 @@ def analyze_drawing():
         if not file_path.lower().endswith('.pdf'):
             return jsonify({'error': 'Only PDF files are supported for drawing analysis'}), 400
         
-        # Analyze the drawing
-        analyzer = PDFDrawingAnalyzer(file_path)
-        analysis_result = analyzer.analyze()
+        # Analyze the drawing (once per content; follow-up questions reuse the cached analysis)
+        analyzer = load_drawing_analysis(file_path)
+        price_index_cache.note_drawing_used(file_path, label)
+        analysis_result = analyzer.report
         
         # If a question was asked, answer it
         answer = None
@@ -1090,64 +1039,14 @@ def check_file_type():
         if not file_path or not os.path.exists(file_path):
             return jsonify({'error': 'File not found'}), 404
         
-        # Check PDF content
-        if file_path.lower().endswith('.pdf'):
-            try:
-                import fitz
-                doc = fitz.open(file_path)
-                text = ""
-                for page in doc[:2]:  # Check first 2 pages
-                    text += page.get_text()
-                doc.close()
-                
-                text_lower = text.lower()
-                
-                # Check for pricing indicators
-                pricing_indicators = ['price', 'cost', '$', 'material', 'finish', 'prime maple', 'elite cherry', 'list price']
-                has_pricing = sum(indicator in text_lower for indicator in pricing_indicators)
-                
-                # Check for drawing indicators
-                drawing_indicators = ['elevation', 'el ', 'drawing', 'scale', 'designed:', 'kitchen layout']
-                has_drawing = sum(indicator in text_lower for indicator in drawing_indicators)
-                
-                # Check for SKU patterns
-                sku_pattern = r'\b([WBSPFRLD][A-Z]*\d{2,4}(?:\s*BUTT?)?)\b'
-                skus_found = len(re.findall(sku_pattern, text, re.IGNORECASE))
-                
-                # Determine file type
-                if has_drawing > has_pricing and skus_found > 5:
-                    file_type = 'engineering_drawing'
-                elif has_pricing > has_drawing:
-                    file_type = 'pricing_sheet'
-                else:
-                    file_type = 'unknown'
-                
-                return jsonify({
-                    'success': True,
-                    'file_type': file_type,
-                    'indicators': {
-                        'pricing_score': has_pricing,
-                        'drawing_score': has_drawing,
-                        'skus_found': skus_found
-                    }
-                })
-                
-            except Exception as e:
-                return jsonify({'error': f'Failed to analyze PDF: {str(e)}'}), 500
-        
-        # Excel files are always pricing sheets
-        elif file_path.lower().endswith(('.xlsx', '.xls', '.csv')):
-            return jsonify({
-                'success': True,
-                'file_type': 'pricing_sheet'
-            })
-        
-        else:
-            return jsonify({
-                'success': True,
-                'file_type': 'unknown'
-            })
-            
+        # Check PDF content (first 2 pages); Excel files are always pricing sheets
+        try:
+            classification = classify_file(file_path)
+        except Exception as e:
+            return jsonify({'error': f'Failed to analyze PDF: {str(e)}'}), 500
+
+        return jsonify({'success': True, **classification})
+
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -1174,31 +1073,32 @@ def file_too_large(e):
 
 
 # Database init block (keeps your previous logic but guarded)
-with app.app_context():
-# ... (rest of the database init block) ...
-    try:
-        from sqlalchemy import inspect
-        inspector = inspect(db.engine)
-        existing_tables = inspector.get_table_names()
-        if not existing_tables:
-            db.create_all()
-    except Exception as e:
+if not PARSE_POOL_WORKER:
+    with app.app_context():
+        # ... (rest of the database init block) ...
         try:
-            db.create_all()
-        except Exception as e2:
-            print("Warning: database initialization failed", e2)
+            from sqlalchemy import inspect
+            inspector = inspect(db.engine)
+            existing_tables = inspector.get_table_names()
+            if not existing_tables:
+                db.create_all()
+        except Exception as e:
+            try:
+                db.create_all()
+            except Exception as e2:
+                print("Warning: database initialization failed", e2)
 
-    try:
-        # create default user if possible
-        default = User.query.filter_by(email='default@example.com').first() if 'User' in globals() else None
-        if default is None and 'User' in globals():
-            import bcrypt
-            hashed_password = bcrypt.hashpw('default123'.encode('utf-8'), bcrypt.gensalt())
-            default_user = User(name='Default User', email='default@example.com', password=hashed_password.decode('utf-8'), role='user')
-            db.session.add(default_user)
-            db.session.commit()
-    except Exception as e:
-        print("Skipping default user creation:", e)
+        try:
+            # create default user if possible
+            default = User.query.filter_by(email='default@example.com').first() if 'User' in globals() else None
+            if default is None and 'User' in globals():
+                import bcrypt
+                hashed_password = bcrypt.hashpw('default123'.encode('utf-8'), bcrypt.gensalt())
+                default_user = User(name='Default User', email='default@example.com', password=hashed_password.decode('utf-8'), role='user')
+                db.session.add(default_user)
+                db.session.commit()
+        except Exception as e:
+            print("Skipping default user creation:", e)
 
 
 if __name__ == '__main__':
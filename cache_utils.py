@@ -0,0 +1,239 @@
+"""
+Shared caching helpers
+Content hashing for uploaded files, pickled sidecar files stored next to them and a
+memory-budgeted LRU used by the analysis caches
+"""
+
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# (path, size, mtime_ns) -> sha256 hex digest, so unchanged files are only hashed once
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def file_content_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file's contents, memoized on (path, size, mtime)."""
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    with _hash_lock:
+        digest = _hash_memo.get(memo_key)
+    if digest:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _hash_lock:
+        _hash_memo[memo_key] = digest
+    return digest
+
+
+def remember_content_hash(file_path: str, digest: str):
+    """Records a hash computed while the file was written, so file_content_hash doesn't re-read it."""
+    stat = os.stat(file_path)
+    with _hash_lock:
+        _hash_memo[(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+def write_sidecar(path, value, stale_pattern):
+    """Pickles value to path atomically and removes older versions (other files matching stale_pattern)."""
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        for stale in glob.glob(os.path.join(os.path.dirname(path), stale_pattern)):
+            if stale != path and '.tmp-' not in stale:
+                os.remove(stale)
+    except OSError as e:
+        logger.warning(f"Could not write cache file {path}: {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_sidecar(path):
+    """The value pickled at path, or None if there is none (or it is unreadable)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache file {path}: {e}")
+        return None
+
+
+class KeyedLocks:
+    """
+    One lock per key (e.g. a sidecar path), so work on one file never waits for another.
+    Locks are reference counted: a key's lock stays shared for as long as any thread holds
+    or waits for it, and is dropped once the last one releases it.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, number of threads holding or waiting for it]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._locks)
+
+
+class BudgetedLRUCache:
+    """Thread-safe LRU mapping that evicts least-recently-used entries once a byte budget is exceeded"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it as most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes: int) -> bool:
+        """Insert a value, evicting old entries to stay under budget. Returns False if it cannot fit."""
+        if nbytes > self.max_bytes:
+            return False
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+        return True
+
+    def pop(self, key, default=None):
+        """Remove an entry without counting it as an eviction."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+DEFAULT_ANSWER_CACHE_BYTES = 16 * 1024 * 1024
+
+
+class AnswerCache:
+    """
+    LRU of computed answers, keyed by (kind, normalized question, file-set fingerprint).
+    Fingerprints are built from file content hashes, so a changed file produces a new
+    key and stale answers simply age out of the LRU.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_ANSWER_CACHE_BYTES):
+        self._entries = BudgetedLRUCache(max_bytes)
+
+    def init_app(self, app):
+        self._entries.max_bytes = app.config.get('ANSWER_CACHE_BYTES', DEFAULT_ANSWER_CACHE_BYTES)
+        app.extensions['answer_cache'] = self
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        # Answers are case-insensitive and ignore surrounding whitespace, nothing more
+        return question.strip().lower()
+
+    def key(self, kind, question, fingerprint):
+        return (kind, self.normalize_question(question), fingerprint)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, key, answer):
+        self._entries.put(key, answer, sys.getsizeof(repr(answer)) + sys.getsizeof(repr(key)))
+
+    def get_or_compute(self, kind, question, fingerprint, compute):
+        """Returns the cached answer, or calls compute() and caches its result."""
+        key = self.key(kind, question, fingerprint)
+        answer = self.get(key)
+        if answer is None:
+            answer = compute()
+            self.put(key, answer)
+        return answer
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
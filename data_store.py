@@ -0,0 +1,204 @@
+"""
+Managed data store for /api/analyze
+Project-scoped cleaned DataFrames with memory accounting and LRU eviction,
+published as immutable copy-on-write snapshots
+"""
+
+import sys
+import logging
+import itertools
+import threading
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_STORE_BYTES = 512 * 1024 * 1024
+DEFAULT_NAMESPACE = 'default'
+
+
+class NamespaceSnapshot:
+    """
+    Immutable view of one namespace: its files ({filename: entry}, in indexing order)
+    and the CODE hash index merged over them ({CODE: ((filename, row positions), ...)}).
+    A snapshot is never modified once published, so a request can hold on to it and
+    iterate it while the store is being written to.
+    """
+
+    __slots__ = ('files', 'code_index', 'nbytes')
+
+    def __init__(self, files=None, code_index=None):
+        self.files = MappingProxyType(dict(files or {}))
+        self.code_index = MappingProxyType(dict(code_index or {}))
+        self.nbytes = sum(entry['nbytes'] for entry in self.files.values())
+
+    def __len__(self):
+        return len(self.files)
+
+    def lookup(self, code):
+        """[(filename, entry, row positions)] for every file containing code, in indexing order."""
+        return [(filename, self.files[filename], positions) for filename, positions in self.code_index.get(code, ())
+                if filename in self.files]
+
+    def select(self, filenames):
+        """
+        Read-only view of just these files, e.g. the ones a request asked about. It shares
+        this snapshot's code index (lookups skip the other files) and is not published.
+        """
+        wanted = set(filenames)
+        selected = object.__new__(NamespaceSnapshot)
+        selected.files = MappingProxyType({filename: entry for filename, entry in self.files.items() if filename in wanted})
+        selected.code_index = self.code_index
+        selected.nbytes = sum(entry['nbytes'] for entry in selected.files.values())
+        return selected
+
+    @property
+    def fingerprint(self):
+        """(filename, content hash) pairs, versioning answers computed from this snapshot."""
+        return tuple((filename, entry.get('content_hash')) for filename, entry in self.files.items())
+
+    def with_file(self, filename, entry):
+        """New snapshot with filename added (or replaced)."""
+        files = dict(self.files)
+        code_index = self._without(files.pop(filename, None), filename)
+        files[filename] = entry
+        for code, positions in entry.get('code_index', {}).items():
+            code_index[code] = code_index.get(code, ()) + ((filename, positions),)
+        return NamespaceSnapshot(files, code_index)
+
+    def without_file(self, filename):
+        """New snapshot with filename removed."""
+        files = dict(self.files)
+        code_index = self._without(files.pop(filename, None), filename)
+        return NamespaceSnapshot(files, code_index)
+
+    def _without(self, entry, filename):
+        code_index = dict(self.code_index)
+        for code in (entry or {}).get('code_index', {}):
+            matches = tuple(match for match in code_index[code] if match[0] != filename)
+            if matches:
+                code_index[code] = matches
+            else:
+                del code_index[code]
+        return code_index
+
+
+EMPTY_SNAPSHOT = NamespaceSnapshot()
+
+
+class DataStore:
+    """
+    Replacement for the old global DATA_STORE dict.
+    Files are stored per namespace (one per project), each entry being the dict
+    clean_and_index_data builds ({'df', 'original_cols', 'content_hash', 'code_index'})
+    plus its approximate size. The entries' code indexes (CODE -> row positions) are
+    merged into one hash index per namespace, so a code is found in O(1) however many
+    files are indexed.
+
+    Each namespace is published as an immutable NamespaceSnapshot. Writers (put, clear,
+    eviction) build the replacement snapshots and swap them in with a single reference
+    assignment under a writer-only lock; readers just take the current snapshot, so they
+    never block on a re-index or see a half-built one. Recency is a logical clock stamped
+    by readers without locking, and entries are evicted least-recently-used first, across
+    all namespaces, once the total exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_DATA_STORE_BYTES):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._snapshots = MappingProxyType({})  # namespace -> NamespaceSnapshot, replaced wholesale
+        self._last_used = {}                    # (namespace, filename) -> logical time of last use
+        self._clock = itertools.count()
+        self._write_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('DATA_STORE_BYTES', DEFAULT_DATA_STORE_BYTES)
+        app.extensions['data_store'] = self
+
+    @staticmethod
+    def namespace_for(project_id):
+        return str(project_id) if project_id not in (None, '') else DEFAULT_NAMESPACE
+
+    @property
+    def current_bytes(self):
+        return sum(snapshot.nbytes for snapshot in self._snapshots.values())
+
+    def _touch(self, namespace, filenames):
+        now = next(self._clock)
+        for filename in filenames:
+            self._last_used[(namespace, filename)] = now
+
+    def _publish(self, snapshots):
+        self._snapshots = MappingProxyType({namespace: snapshot for namespace, snapshot in snapshots.items() if snapshot.files})
+
+    def put(self, namespace, filename, entry):
+        """Stores (or replaces) a file's entry, evicting older entries to stay under budget."""
+        code_index = entry.get('code_index', {})
+        index_bytes = sum(sys.getsizeof(code) + positions.nbytes for code, positions in code_index.items())
+        entry = dict(entry, nbytes=int(entry['df'].memory_usage(deep=True).sum()) + index_bytes)
+        key = (namespace, filename)
+
+        with self._write_lock:
+            snapshots = dict(self._snapshots)
+            snapshots[namespace] = snapshots.get(namespace, EMPTY_SNAPSHOT).with_file(filename, entry)
+            self._touch(namespace, [filename])
+            total_bytes = sum(snapshot.nbytes for snapshot in snapshots.values())
+
+            # The newest entry is always kept, even if it alone exceeds the budget
+            while total_bytes > self.max_bytes:
+                candidates = [(self._last_used.get((ns, fn), -1), ns, fn)
+                              for ns, snapshot in snapshots.items() for fn in snapshot.files if (ns, fn) != key]
+                if not candidates:
+                    break
+                _, evicted_namespace, evicted_filename = min(candidates)
+                total_bytes -= snapshots[evicted_namespace].files[evicted_filename]['nbytes']
+                snapshots[evicted_namespace] = snapshots[evicted_namespace].without_file(evicted_filename)
+                self._last_used.pop((evicted_namespace, evicted_filename), None)
+                self.evictions += 1
+                logger.info(f"Evicted {evicted_filename} from data store namespace {evicted_namespace}")
+
+            self._publish(snapshots)
+        return entry
+
+    def snapshot(self, namespace):
+        """The namespace's current immutable snapshot (empty if nothing is indexed); marks its files as used."""
+        snapshot = self._snapshots.get(namespace, EMPTY_SNAPSHOT)
+        self._touch(namespace, snapshot.files)
+        return snapshot
+
+    def get(self, namespace, filename):
+        entry = self._snapshots.get(namespace, EMPTY_SNAPSHOT).files.get(filename)
+        if entry is not None:
+            self._touch(namespace, [filename])
+        return entry
+
+    def lookup(self, namespace, code):
+        """[(filename, entry, row positions)] for every file in the namespace containing code, in indexing order."""
+        return self._snapshots.get(namespace, EMPTY_SNAPSHOT).lookup(code)
+
+    def files(self, namespace):
+        """Read-only {filename: entry} of a namespace in indexing order; marks them all as used."""
+        return self.snapshot(namespace).files
+
+    def clear(self, namespace=None):
+        """Clears one namespace, or everything."""
+        with self._write_lock:
+            snapshots = {} if namespace is None else {ns: snapshot for ns, snapshot in self._snapshots.items() if ns != namespace}
+            self._publish(snapshots)
+            for key in [key for key in list(self._last_used) if namespace is None or key[0] == namespace]:
+                self._last_used.pop(key, None)
+
+    def stats(self) -> dict:
+        snapshots = self._snapshots
+        return {
+            'namespaces': {
+                namespace: {
+                    'files': len(snapshot),
+                    'bytes': snapshot.nbytes
+                }
+                for namespace, snapshot in snapshots.items()
+            },
+            'entries': sum(len(snapshot) for snapshot in snapshots.values()),
+            'bytes': sum(snapshot.nbytes for snapshot in snapshots.values()),
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions
+        }
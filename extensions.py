@@ -5,9 +5,17 @@ This file prevents circular imports by centralizing extension instances
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_cors import CORS
+from cache_utils import AnswerCache
+from data_store import DataStore
+from price_index import PriceIndexCache
+from indexing_jobs import IndexingJobs
 
 # Initialize extensions (without app)
 db = SQLAlchemy()
 login_manager = LoginManager()
 cors = CORS()
+price_index_cache = PriceIndexCache()
+indexing_jobs = IndexingJobs(price_index_cache)
+answer_cache = AnswerCache()
+data_store = DataStore()
 
@@ -0,0 +1,250 @@
+"""
+Background indexing jobs
+Uploads are parsed, classified, indexed and persisted off the request thread
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from pdf_drawing_analyzer import load_drawing_analysis
+from pdf_text_cache import cached_pdf_text, extract_pdf_text
+from text_search import load_cell_index, load_line_index
+
+logger = logging.getLogger(__name__)
+
+PRICE_BOOK_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+DEFAULT_INDEXING_WORKERS = 2
+# How long a question waits for an upload that is still being indexed
+DEFAULT_INDEXING_WAIT_SECONDS = 120
+# Job records are written next to each upload, so every worker process sees the same status
+JOB_STATUS_DIR = '.indexing'
+# How often a process polls a job another process is running
+JOB_POLL_SECONDS = 0.25
+# An 'indexing' record older than this is treated as abandoned (e.g. its process was killed)
+JOB_STALE_SECONDS = 3600
+
+PRICING_INDICATORS = ['price', 'cost', '$', 'material', 'finish', 'prime maple', 'elite cherry', 'list price']
+DRAWING_INDICATORS = ['elevation', 'el ', 'drawing', 'scale', 'designed:', 'kitchen layout']
+DRAWING_SKU_PATTERN = re.compile(r'\b([WBSPFRLD][A-Z]*\d{2,4}(?:\s*BUTT?)?)\b', re.IGNORECASE)
+
+
+def classify_file(file_path):
+    """
+    Decides whether a file is a pricing sheet or an engineering drawing.
+    Returns {'file_type': 'pricing_sheet' | 'engineering_drawing' | 'unknown'}, plus the
+    indicator scores for PDFs (which are classified from the text of their first 2 pages).
+    """
+    # Excel files are always pricing sheets
+    if file_path.lower().endswith(PRICE_BOOK_EXTENSIONS):
+        return {'file_type': 'pricing_sheet'}
+
+    if not file_path.lower().endswith('.pdf'):
+        return {'file_type': 'unknown'}
+
+    # Check first 2 pages: from the cached text if the PDF was already read, otherwise just those
+    # pages (the whole document is extracted and cached by its background indexing job)
+    pdf_text = cached_pdf_text(file_path)
+    if pdf_text is None:
+        pdf_text = extract_pdf_text(file_path, 0, 2)
+    text = pdf_text.text(max_pages=2)
+
+    text_lower = text.lower()
+    has_pricing = sum(indicator in text_lower for indicator in PRICING_INDICATORS)
+    has_drawing = sum(indicator in text_lower for indicator in DRAWING_INDICATORS)
+    skus_found = len(DRAWING_SKU_PATTERN.findall(text))
+
+    if has_drawing > has_pricing and skus_found > 5:
+        file_type = 'engineering_drawing'
+    elif has_pricing > has_drawing:
+        file_type = 'pricing_sheet'
+    else:
+        file_type = 'unknown'
+
+    return {
+        'file_type': file_type,
+        'indicators': {
+            'pricing_score': has_pricing,
+            'drawing_score': has_drawing,
+            'skus_found': skus_found
+        }
+    }
+
+
+class IndexingJobs:
+    """
+    Local background job queue for uploaded files.
+    Each job parses the file (price books are converted to their sheet sidecar), classifies
+    it, builds its price index, /api/ask search index and (for drawings) drawing analysis
+    and persists them, so the first question after an upload is served from a prebuilt
+    index. Job status is tracked per file path: 'indexing' while queued or running, then
+    'ready' or 'failed'. Each job record is also written to a status file next to the
+    upload, so other worker processes report the same status, wait for the same job and
+    don't index the file a second time.
+    """
+
+    def __init__(self, price_index_cache, max_workers: int = DEFAULT_INDEXING_WORKERS):
+        self.price_index_cache = price_index_cache
+        self.max_workers = max_workers
+        self.wait_seconds = DEFAULT_INDEXING_WAIT_SECONDS
+        self._executor = None
+        self._jobs = {}  # absolute file path -> job record (jobs run by this process)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('INDEXING_WORKERS', DEFAULT_INDEXING_WORKERS)
+        self.wait_seconds = app.config.get('INDEXING_WAIT_SECONDS', DEFAULT_INDEXING_WAIT_SECONDS)
+        app.extensions['indexing_jobs'] = self
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='indexing')
+        return self._executor
+
+    @staticmethod
+    def status_path(file_path):
+        return os.path.join(os.path.dirname(file_path), JOB_STATUS_DIR, f"{os.path.basename(file_path)}.json")
+
+    def _write_status(self, file_path, job):
+        path = self.status_path(file_path)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(self._public(job), pid=os.getpid()), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write indexing status {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _read_status(self, file_path):
+        try:
+            with open(self.status_path(file_path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _running_elsewhere(record):
+        """True if a status file record is a job still in flight in another live process."""
+        if not record or record['status'] != 'indexing' or record.get('pid') == os.getpid():
+            return False
+        if time.time() - record['queued_at'] > JOB_STALE_SECONDS:
+            return False
+        try:
+            os.kill(record['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except (OSError, TypeError):
+            pass
+        return True
+
+    def submit(self, file_path, label):
+        """Queues a file for indexing (unless it is already in flight in any process) and returns its status."""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            job = self._jobs.get(path)
+            if job is None or job['status'] != 'indexing':
+                record = self._read_status(path)
+                if self._running_elsewhere(record):
+                    return {key: value for key, value in record.items() if key != 'pid'}
+                job = {
+                    'file': label,
+                    'status': 'indexing',
+                    'file_type': None,
+                    'error': None,
+                    'queued_at': time.time(),
+                    'finished_at': None
+                }
+                self._jobs[path] = job
+                self._write_status(path, job)
+                job['future'] = self._get_executor().submit(self._run, path, label, job)
+            return self._public(job)
+
+    def _run(self, file_path, label, job):
+        try:
+            is_price_book = file_path.lower().endswith(PRICE_BOOK_EXTENSIONS)
+            classification = classify_file(file_path)
+            job['file_type'] = classification['file_type']
+            job['indicators'] = classification.get('indicators')
+
+            # add_file parses into the sheet sidecar, builds the index and writes its snapshot
+            if is_price_book and not self.price_index_cache.add_file(file_path, label):
+                raise ValueError('No readable sheets in price book')
+            # /api/ask search indexes: PDF lines (extracting and caching the PDF's text)
+            # and workbook cells (from the sheet sidecar add_file just wrote)
+            if file_path.lower().endswith('.pdf'):
+                load_line_index(file_path)
+                # Drawings also get their /api/analyze/drawing analysis
+                if classification['file_type'] == 'engineering_drawing':
+                    load_drawing_analysis(file_path)
+                    self.price_index_cache.note_drawing_used(file_path, label)
+            elif file_path.lower().endswith(('.xlsx', '.xls')):
+                load_cell_index(file_path, label)
+
+            job['status'] = 'ready'
+        except Exception as e:
+            logger.error(f"Indexing failed for {label}: {e}")
+            job['error'] = str(e)
+            job['status'] = 'failed'
+        finally:
+            job['finished_at'] = time.time()
+            with self._lock:
+                # A discarded job's file is being deleted, so its status file must not come back
+                if self._jobs.get(file_path) is job:
+                    self._write_status(file_path, job)
+
+    @staticmethod
+    def _public(job):
+        return {key: value for key, value in job.items() if key != 'future'}
+
+    def status(self, file_path):
+        """
+        Status record for a file, from this process's job or the file's status file (another
+        process's job); None if it was never queued (e.g. uploaded before indexing existed).
+        """
+        path = os.path.abspath(file_path)
+        with self._lock:
+            job = self._jobs.get(path)
+            if job:
+                return self._public(job)
+        record = self._read_status(path)
+        if record is None:
+            return None
+        if record['status'] == 'indexing' and not self._running_elsewhere(record):
+            record = dict(record, status='failed', error='Indexing was interrupted')
+        return {key: value for key, value in record.items() if key != 'pid'}
+
+    def wait_for(self, file_paths, timeout=None):
+        """Blocks until any in-flight jobs for these files, in any process, finish (or the timeout passes)."""
+        deadline = time.time() + (self.wait_seconds if timeout is None else timeout)
+        paths = [os.path.abspath(path) for path in file_paths]
+        with self._lock:
+            jobs = {path: self._jobs.get(path) for path in paths}
+            futures = [job['future'] for job in jobs.values() if job and job['status'] == 'indexing']
+        if futures:
+            wait(futures, timeout=max(0, deadline - time.time()))
+
+        # Jobs run by other worker processes are followed through their status files
+        elsewhere = [path for path, job in jobs.items() if job is None]
+        while elsewhere and time.time() < deadline:
+            elsewhere = [path for path in elsewhere if self._running_elsewhere(self._read_status(path))]
+            if elsewhere:
+                time.sleep(JOB_POLL_SECONDS)
+
+    def discard(self, file_path):
+        """Forgets a file that is being deleted; a job that already started is allowed to finish first."""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            job = self._jobs.pop(path, None)
+        if job and not job['future'].cancel():
+            wait([job['future']], timeout=self.wait_seconds)
+        try:
+            os.remove(self.status_path(path))
+        except OSError:
+            pass
@@ -3,18 +3,60 @@ AI-Powered Engineering Drawing Analyzer
 Extracts and understands cabinet layouts, dimensions, and spatial relationships from PDF drawings
 """
 
+import os
 import re
-import fitz  # PyMuPDF
+import sys
+import math
+import logging
 from collections import defaultdict
 from typing import List, Dict, Tuple, Optional
 
+import fitz  # PyMuPDF
+import numpy as np
+
+import price_parser
+from cache_utils import BudgetedLRUCache, KeyedLocks, read_sidecar, write_sidecar
+from pdf_text_cache import (PDF_TEXT_CACHE_DIR, PDF_TEXT_VERSION, PdfText, cached_pdf_text, extract_pdf_text,
+                            load_pdf_text, pdf_text_cache_path, store_pdf_text)
+
+logger = logging.getLogger(__name__)
+
+# Element type codes used by DrawingElementStore.kind (index into ELEMENT_TYPES)
+ELEMENT_TYPES = ('unknown', 'sku', 'dimension', 'room')
+UNKNOWN, SKU, DIMENSION, ROOM = range(len(ELEMENT_TYPES))
+
+# Dimension units in inches (a bare "1/2"-style unit is a fraction of an inch)
+DIMENSION_UNITS = {'"': 1, "'": 12, 'ft': 12, 'mm': 1 / 25.4, 'cm': 1 / 2.54}
+
+# Drawings with at least this many pages are classified (and extracted, if their text isn't cached yet)
+# in page ranges on the parse pool
+PARALLEL_MIN_PAGES = 8
+
+# Bump whenever extraction, classification or relationships change so cached analyses are redone
+DRAWING_ANALYSIS_VERSION = '2'
+# Analysed drawings kept in memory for follow-up questions
+DEFAULT_DRAWING_MEMORY_BYTES = 64 * 1024 * 1024
+
+_analyses = BudgetedLRUCache(DEFAULT_DRAWING_MEMORY_BYTES)
+_analysis_locks = KeyedLocks()  # per sidecar path, so concurrent requests analyze a drawing only once
+
+# Largest distance matrix computed at once when relating elements (rows x columns)
+DISTANCE_BLOCK_CELLS = 1 << 22
+
+
 class DrawingElement:
     """Represents a single element extracted from a drawing"""
-    def __init__(self, text: str, bbox: Tuple[float, float, float, float], page: int, element_type: str = 'unknown'):
+    __slots__ = ('text', 'bbox', 'page', 'element_type', 'code', 'dimension', 'center_x', 'center_y',
+                 'nearby_dimensions', 'room', 'adjacent_to')
+    
+    def __init__(self, text: str, bbox: Tuple[float, float, float, float], page: int, element_type: str = 'unknown',
+                 code: Optional[str] = None, dimension: Optional[float] = None):
         self.text = text
         self.bbox = bbox  # (x0, y0, x1, y1)
         self.page = page
         self.element_type = element_type  # 'sku', 'dimension', 'label', 'room', etc.
+        self.code = code  # matched SKU code, dimension or room label (uppercase)
+        self.dimension = dimension  # dimensions only: the measurement in inches
         self.center_x = (bbox[0] + bbox[2]) / 2
         self.center_y = (bbox[1] + bbox[3]) / 2
     
@@ -38,118 +80,322 @@ class DrawingElement:
         }
 
 
+class DrawingElementStore:
+    """
+    All text elements of a drawing as parallel NumPy arrays (struct of arrays):
+    page, x0, y0, x1, y1, cx, cy, kind (an ELEMENT_TYPES code) and dimension (inches,
+    NaN unless a dimension), with the texts and matched codes in parallel lists.
+    Element i is row i of every array.
+    """
+    def __init__(self, texts: List[str], pages, bboxes, kinds=None, codes=None, dimensions=None):
+        self.texts = texts
+        self.page = np.asarray(pages, dtype=np.int32).reshape(-1)
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.x0, self.y0, self.x1, self.y1 = (np.ascontiguousarray(bboxes[:, i]) for i in range(4))
+        self.cx = (self.x0 + self.x1) / 2
+        self.cy = (self.y0 + self.y1) / 2
+        self.kind = np.zeros(len(texts), dtype=np.int8) if kinds is None else np.asarray(kinds, dtype=np.int8)
+        self.codes = [None] * len(texts) if codes is None else codes
+        self.dimension = np.full(len(texts), np.nan) if dimensions is None else np.asarray(dimensions, dtype=np.float64)
+    
+    @classmethod
+    def from_blocks(cls, blocks_by_page, first_page: int = 1) -> 'DrawingElementStore':
+        """Store of the non-empty text blocks of every page (fitz block tuples, page first_page+i at index i)"""
+        texts, pages, bboxes = [], [], []
+        for page_num, blocks in enumerate(blocks_by_page, first_page):
+            for x0, y0, x1, y1, text, *_ in blocks:
+                text = text.strip()
+                if text:
+                    texts.append(text)
+                    pages.append(page_num)
+                    bboxes.append((x0, y0, x1, y1))
+        return cls(texts, pages, bboxes)
+    
+    @classmethod
+    def from_elements(cls, elements: List[DrawingElement]) -> 'DrawingElementStore':
+        return cls([e.text for e in elements], [e.page for e in elements], [e.bbox for e in elements],
+                   [ELEMENT_TYPES.index(e.element_type) if e.element_type in ELEMENT_TYPES else UNKNOWN for e in elements],
+                   [e.code for e in elements], [np.nan if e.dimension is None else e.dimension for e in elements])
+    
+    @classmethod
+    def concatenate(cls, stores: List['DrawingElementStore']) -> 'DrawingElementStore':
+        """One store of several stores' elements, in order"""
+        if not stores:
+            return cls([], [], [])
+        bboxes = np.column_stack([np.concatenate([getattr(store, c) for store in stores]) for c in ('x0', 'y0', 'x1', 'y1')])
+        return cls([text for store in stores for text in store.texts], np.concatenate([store.page for store in stores]),
+                   bboxes, np.concatenate([store.kind for store in stores]), [code for store in stores for code in store.codes],
+                   np.concatenate([store.dimension for store in stores]))
+    
+    def __len__(self):
+        return len(self.texts)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.page, self.x0, self.y0, self.x1, self.y1, self.cx, self.cy, self.kind, self.dimension))
+    
+    def indices(self, kind: int) -> np.ndarray:
+        """Indices of the elements of one type, in element order"""
+        return np.flatnonzero(self.kind == kind)
+    
+    def elements(self, indices) -> List[DrawingElement]:
+        """DrawingElement objects for the given indices"""
+        indices = np.asarray(indices, dtype=np.intp)
+        dimensions = [None if math.isnan(d) else d for d in self.dimension[indices].tolist()]
+        columns = zip(self.page[indices].tolist(), self.x0[indices].tolist(), self.y0[indices].tolist(),
+                      self.x1[indices].tolist(), self.y1[indices].tolist(), self.kind[indices].tolist(), dimensions)
+        return [DrawingElement(self.texts[i], (x0, y0, x1, y1), page, ELEMENT_TYPES[kind], self.codes[i], dimension)
+                for i, (page, x0, y0, x1, y1, kind, dimension) in zip(indices.tolist(), columns)]
+    
+    def by_page(self, indices: np.ndarray) -> Dict[int, np.ndarray]:
+        """{page: positions into indices of the elements on that page}, positions in ascending order"""
+        pages = self.page[indices]
+        order = np.argsort(pages, kind='stable')
+        unique_pages, starts = np.unique(pages[order], return_index=True)
+        return dict(zip(unique_pages.tolist(), np.split(order, starts[1:])))
+    
+    def distances(self, rows: np.ndarray, columns: np.ndarray):
+        """Center distances between element rows and element columns, in row blocks of bounded size"""
+        step = max(1, DISTANCE_BLOCK_CELLS // max(len(columns), 1))
+        cx, cy = self.cx[columns], self.cy[columns]
+        for start in range(0, len(rows), step):
+            block = rows[start:start + step]
+            dx = self.cx[block, None] - cx
+            dy = self.cy[block, None] - cy
+            yield start, np.sqrt(dx * dx + dy * dy)
+
+
+class SpatialGrid:
+    """
+    Uniform grid over one page's elements of a DrawingElementStore (bucketed by center) for radius
+    queries. Queries are answered one occupied grid cell at a time, with one distance matrix between
+    the elements in that cell and the candidates in the cells around it.
+    """
+    def __init__(self, store: DrawingElementStore, ids: np.ndarray, cell_size: float):
+        self.store = store
+        self.ids = ids  # store indices of the grid's elements, in element order
+        self.cell_size = cell_size
+        self.cells = {cell: positions for cell, positions in self._bucket(ids)}
+    
+    def _bucket(self, ids: np.ndarray):
+        """(cell, positions into ids of the elements centered in it), positions in ascending order"""
+        cells = np.floor(np.column_stack((self.store.cx[ids], self.store.cy[ids])) / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        keys, starts = np.unique(cells[order], axis=0, return_index=True)
+        return zip(map(tuple, keys.tolist()), np.split(order, starts[1:]))
+    
+    def distances(self, ids: np.ndarray, radius: float):
+        """
+        Yields (positions into ids, positions into the grid's ids, distance matrix) covering every
+        grid element that could be closer than radius to each queried element (store indices ids).
+        Grid positions are in ascending (element) order.
+        """
+        reach = math.ceil(radius / self.cell_size)
+        no_positions = np.empty(0, dtype=np.intp)
+        for (col, row), queries in self._bucket(ids):
+            around = [self.cells[cell] for cell in ((c, r) for c in range(col - reach, col + reach + 1)
+                                                    for r in range(row - reach, row + reach + 1)) if cell in self.cells]
+            candidates = np.sort(np.concatenate(around)) if around else no_positions
+            for start, distances in self.store.distances(ids[queries], self.ids[candidates]):
+                yield queries[start:start + len(distances)], candidates, distances
+
+
 class PDFDrawingAnalyzer:
     """Intelligent PDF Drawing Analyzer"""
     
+    # Relationship distances (in PDF points, between element centers)
+    DIMENSION_DISTANCE = 150
+    ROOM_DISTANCE = 300
+    ADJACENT_DISTANCE = 120
+    
     # Precise SKU patterns for cabinet codes - only matches actual SKU codes
     SKU_PATTERN = r'\b([WBSPFRLD][A-Z]*\d{2,4}(?:\s+(?:X\s+\d{2}\s+DP|BUTT?|[LR]|\d+TD))*|SB\d{2}(?:\s+BUTT)?)\b'
     
     # Dimension patterns (e.g., 108", 31 1/2", 2'-6")
-    DIMENSION_PATTERN = r'(\d+(?:\s*\d+/\d+)?(?:"|\'|mm|cm|ft|\s*1/[248]))'
+    DIMENSION_PATTERN = r'((?P<whole>\d+)(?:\s*(?P<numerator>\d+)/(?P<denominator>\d+))?(?P<unit>"|\'|mm|cm|ft|\s*1/[248]))'
     
     # Room/zone patterns
     ROOM_PATTERN = r'(EL(?:EVATION)?\s*\d+|KITCHEN|GARAGE|BEDROOM|BATHROOM|LIVING|DINING)'
     
-    def __init__(self, pdf_path: str):
+    # For questions
+    SKU_REGEX = re.compile(SKU_PATTERN, re.IGNORECASE)
+    ROOM_REGEX = re.compile(ROOM_PATTERN, re.IGNORECASE)
+    
+    # Element classifier: one match per (uppercased) text. Each alternative looks ahead through the
+    # whole text, so a SKU anywhere wins over a dimension, and a dimension over a room label;
+    # lastgroup names the type and the group holds the leftmost match of that pattern.
+    CLASSIFIER = re.compile(rf'(?=.*?(?P<sku>(?i:{SKU_PATTERN})))'
+                            rf'|(?=.*?(?P<dimension>{DIMENSION_PATTERN}))'
+                            rf'|(?=.*?(?P<room>(?i:{ROOM_PATTERN})))', re.DOTALL)
+    
+    def __init__(self, pdf_path: str, parallel: bool = True):
         self.pdf_path = pdf_path
-        self.doc = None
-        self.elements: List[DrawingElement] = []
+        self.parallel = parallel
+        self.pdf_text = None
+        self.store: Optional[DrawingElementStore] = None
         self.skus: List[DrawingElement] = []
         self.dimensions: List[DrawingElement] = []
         self.rooms: List[DrawingElement] = []
         self.sku_counts: Dict[str, int] = defaultdict(int)
         self.sku_locations: Dict[str, List[DrawingElement]] = defaultdict(list)
+        self.report: Optional[Dict] = None
         
     def analyze(self) -> Dict:
         """Main analysis method - extracts and understands drawing"""
-        try:
-            self.doc = fitz.open(self.pdf_path)
+        # Page text blocks are extracted once per file and shared with the other PDF readers
+        self.store = None
+        self.sku_counts.clear()
+        self.sku_locations.clear()
+        self.pdf_text = cached_pdf_text(self.pdf_path)
+        if self.parallel:
+            self._analyze_pages_in_parallel()
+        if self.store is None:
+            if self.pdf_text is None:
+                self.pdf_text = load_pdf_text(self.pdf_path)
             self._extract_all_elements()
             self._classify_elements()
-            self._build_relationships()
-            self._count_skus()
-            
-            return self._generate_analysis_report()
-        finally:
-            if self.doc:
-                self.doc.close()
+        self._collect_elements()
+        self._build_relationships()
+        self._count_skus()
+        
+        self.report = self._generate_analysis_report()
+        return self.report
+    
+    def state(self) -> Tuple:
+        """Everything answer_question needs after analyze(), as persisted by load_drawing_analysis"""
+        return (self.report, self.store, self.skus, self.dimensions, self.rooms, dict(self.sku_counts), dict(self.sku_locations))
+    
+    @classmethod
+    def from_state(cls, pdf_path: str, state: Tuple) -> 'PDFDrawingAnalyzer':
+        """An analyzed session restored from state(), without reading the PDF"""
+        analyzer = cls(pdf_path)
+        analyzer.report, analyzer.store, analyzer.skus, analyzer.dimensions, analyzer.rooms, sku_counts, sku_locations = state
+        analyzer.sku_counts.update(sku_counts)
+        analyzer.sku_locations.update(sku_locations)
+        return analyzer
+    
+    @property
+    def nbytes(self) -> int:
+        """Approximate in-memory size of an analyzed session"""
+        classified = len(self.skus) + len(self.dimensions) + len(self.rooms)
+        return self.store.nbytes + sum(sys.getsizeof(text) for text in self.store.texts) + 512 * classified
+    
+    def _analyze_pages_in_parallel(self):
+        """
+        Large drawings: worker processes each classify a page range and the ranges' elements are
+        merged here. On the first read of a drawing the workers also extract their range's text;
+        when the text is already cached (uploads are classified from it first) they are sent the
+        range's cached blocks instead. Leaves store unset when the drawing is too small or the
+        pool can't be used, so the caller falls back to the serial path.
+        """
+        workers = price_parser.MAX_PARSE_WORKERS
+        if self.pdf_text is None:
+            with fitz.open(self.pdf_path) as doc:
+                page_count = doc.page_count
+        else:
+            page_count = len(self.pdf_text.blocks)
+        if workers < 2 or page_count < PARALLEL_MIN_PAGES:
+            return
+        
+        # A few ranges per worker, so one slow range doesn't hold up the rest
+        step = math.ceil(page_count / (workers * 2))
+        if self.pdf_text is None:
+            job = extract_and_classify_pages
+            jobs = [(self.pdf_path, start, start + step) for start in range(0, page_count, step)]
+        else:
+            job = classify_page_blocks
+            jobs = [(self.pdf_path, self.pdf_text.blocks[start:start + step], start + 1) for start in range(0, page_count, step)]
+        results = price_parser.run_in_parse_pool(job, jobs, f"{page_count} drawing pages of {self.pdf_path}")
+        if results is None:
+            return
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Parallel drawing analysis of {self.pdf_path} failed, analyzing serially: {result}")
+                return
+        
+        if self.pdf_text is None:
+            self.pdf_text = PdfText.concatenate([pdf_text for pdf_text, _ in results])
+            store_pdf_text(self.pdf_path, self.pdf_text)
+            results = [store for _, store in results]
+        self.store = DrawingElementStore.concatenate(results)
     
     def _extract_all_elements(self):
         """Extract all text elements with positions"""
-        for page_num in range(len(self.doc)):
-            page = self.doc[page_num]
-            
-            # Extract text blocks with positions
-            blocks = page.get_text("blocks")
-            for block in blocks:
-                x0, y0, x1, y1, text, block_no, block_type = block
-                text = text.strip()
-                
-                if text and len(text) > 0:
-                    element = DrawingElement(
-                        text=text,
-                        bbox=(x0, y0, x1, y1),
-                        page=page_num + 1
-                    )
-                    self.elements.append(element)
+        self.store = DrawingElementStore.from_blocks(self.pdf_text.blocks)
     
     def _classify_elements(self):
         """Classify elements as SKUs, dimensions, rooms, etc."""
-        for element in self.elements:
-            text = element.text.upper()
-            
-            # Check if it's a SKU
-            if re.search(self.SKU_PATTERN, text, re.IGNORECASE):
-                element.element_type = 'sku'
-                self.skus.append(element)
+        store = self.store
+        for i, text in enumerate(store.texts):
+            match = self.CLASSIFIER.match(text.upper())
+            if match is None:
+                continue
             
-            # Check if it's a dimension
-            elif re.search(self.DIMENSION_PATTERN, text):
-                element.element_type = 'dimension'
-                self.dimensions.append(element)
-            
-            # Check if it's a room/zone label
-            elif re.search(self.ROOM_PATTERN, text, re.IGNORECASE):
-                element.element_type = 'room'
-                self.rooms.append(element)
+            # Keep what matched (the SKU code, dimension or room label), so nothing re-parses the text
+            store.kind[i] = ELEMENT_TYPES.index(match.lastgroup)
+            store.codes[i] = match.group(match.lastgroup)
+            if match.lastgroup == 'dimension':
+                store.dimension[i] = dimension_inches(match)
+    
+    def _collect_elements(self):
+        """Element objects for the classified elements only (unclassified text stays in the store)"""
+        self.skus = self.store.elements(self.store.indices(SKU))
+        self.dimensions = self.store.elements(self.store.indices(DIMENSION))
+        self.rooms = self.store.elements(self.store.indices(ROOM))
     
     def _build_relationships(self):
-        """Build spatial relationships between elements"""
-        for sku in self.skus:
+        """Build spatial relationships between elements on the same page"""
+        # Per-page grids, so each SKU is only measured against the elements in the grid cells around it
+        store = self.store
+        sku_ids, dimension_ids, room_ids = store.indices(SKU), store.indices(DIMENSION), store.indices(ROOM)
+        dimension_pages, room_pages = store.by_page(dimension_ids), store.by_page(room_ids)
+        
+        for page, skus in store.by_page(sku_ids).items():
+            rows = sku_ids[skus]
+            for position in skus.tolist():
+                self.skus[position].nearby_dimensions = []
+                self.skus[position].room = "Unknown"
+            
             # Find nearby dimensions
-            nearby_dims = [d for d in self.dimensions if sku.is_near(d, threshold=150)]
-            sku.nearby_dimensions = nearby_dims
+            dimensions = dimension_pages.get(page)
+            if dimensions is not None:
+                grid = SpatialGrid(store, dimension_ids[dimensions], self.DIMENSION_DISTANCE)
+                for queries, candidates, distances in grid.distances(rows, self.DIMENSION_DISTANCE):
+                    for query, near in zip(queries.tolist(), distances < self.DIMENSION_DISTANCE):
+                        self.skus[skus[query]].nearby_dimensions = [self.dimensions[d] for d in dimensions[candidates[near]].tolist()]
             
-            # Find nearest room/zone
-            if self.rooms:
-                nearest_room = min(self.rooms, key=lambda r: sku.distance_to(r))
-                if sku.distance_to(nearest_room) < 300:  # Within reasonable distance
-                    sku.room = nearest_room.text
-                else:
-                    sku.room = "Unknown"
-            else:
-                sku.room = "Unknown"
+            # Find nearest room/zone (within reasonable distance; ties go to the first room)
+            rooms = room_pages.get(page)
+            if rooms is not None:
+                grid = SpatialGrid(store, room_ids[rooms], self.ROOM_DISTANCE)
+                for queries, candidates, distances in grid.distances(rows, self.ROOM_DISTANCE):
+                    if not len(candidates):
+                        continue
+                    nearest = distances.argmin(axis=1)
+                    in_reach = distances[np.arange(len(nearest)), nearest] < self.ROOM_DISTANCE
+                    for query, room in zip(queries[in_reach].tolist(), rooms[candidates[nearest[in_reach]]].tolist()):
+                        self.skus[skus[query]].room = self.rooms[room].text
             
             # Find nearby SKUs (adjacent cabinets)
-            nearby_skus = [s for s in self.skus if s != sku and sku.is_near(s, threshold=120)]
-            sku.adjacent_to = [s.text for s in nearby_skus[:3]]  # Top 3 nearest
+            grid = SpatialGrid(store, rows, self.ADJACENT_DISTANCE)
+            for queries, candidates, distances in grid.distances(rows, self.ADJACENT_DISTANCE):
+                for query, near in zip(queries.tolist(), distances < self.ADJACENT_DISTANCE):
+                    sku = skus[query]
+                    nearby_skus = [s for s in skus[candidates[near]].tolist() if s != sku]
+                    self.skus[sku].adjacent_to = [self.skus[s].text for s in nearby_skus[:3]]  # Top 3 nearest
     
     def _count_skus(self):
         """Count occurrences of each SKU"""
         for sku in self.skus:
-            # Extract the actual SKU code
-            match = re.search(self.SKU_PATTERN, sku.text, re.IGNORECASE)
-            if match:
-                sku_code = match.group(1).upper()
-                self.sku_counts[sku_code] += 1
-                self.sku_locations[sku_code].append(sku)
+            self.sku_counts[sku.code] += 1
+            self.sku_locations[sku.code].append(sku)
     
     def _generate_analysis_report(self) -> Dict:
         """Generate comprehensive analysis report"""
         return {
             'file_type': 'engineering_drawing',
-            'total_pages': len(self.doc),
-            'total_elements': len(self.elements),
+            'total_pages': len(self.pdf_text),
+            'total_elements': len(self.store),
             'skus_found': len(self.skus),
             'unique_skus': len(self.sku_counts),
             'dimensions_found': len(self.dimensions),
@@ -162,11 +408,8 @@ class PDFDrawingAnalyzer:
     
     def _format_sku_detail(self, sku: DrawingElement) -> Dict:
         """Format detailed information about a SKU"""
-        match = re.search(self.SKU_PATTERN, sku.text, re.IGNORECASE)
-        sku_code = match.group(1).upper() if match else sku.text
-        
         return {
-            'sku': sku_code,
+            'sku': sku.code or sku.text,
             'page': sku.page,
             'location': getattr(sku, 'room', 'Unknown'),
             'position': {'x': sku.center_x, 'y': sku.center_y},
@@ -229,7 +472,7 @@ class PDFDrawingAnalyzer:
     def _answer_count_question(self, question: str) -> str:
         """Answer 'how many' type questions"""
         # Extract SKU from question
-        match = re.search(self.SKU_PATTERN, question, re.IGNORECASE)
+        match = self.SKU_REGEX.search(question)
         if match:
             sku_code = match.group(1).upper()
             count = self.sku_counts.get(sku_code, 0)
@@ -255,7 +498,7 @@ class PDFDrawingAnalyzer:
     
     def _answer_location_question(self, question: str) -> str:
         """Answer 'where is' type questions"""
-        match = re.search(self.SKU_PATTERN, question, re.IGNORECASE)
+        match = self.SKU_REGEX.search(question)
         if match:
             sku_code = match.group(1).upper()
             locations = self.sku_locations.get(sku_code, [])
@@ -289,14 +532,14 @@ class PDFDrawingAnalyzer:
     def _answer_list_question(self, question: str) -> str:
         """Answer 'list all' type questions"""
         # Check if asking about a specific room
-        room_match = re.search(self.ROOM_PATTERN, question, re.IGNORECASE)
+        room_match = self.ROOM_REGEX.search(question)
         
         if room_match:
             room_name = room_match.group(1).upper()
             room_skus = [s for s in self.skus if getattr(s, 'room', '').upper() == room_name]
             
             if room_skus:
-                sku_list = [re.search(self.SKU_PATTERN, s.text, re.IGNORECASE).group(1) for s in room_skus]
+                sku_list = [s.code for s in room_skus]
                 return f"📋 Cabinets in **{room_name}**:\n\n" + '\n'.join(f"• {sku}" for sku in sku_list)
             else:
                 return f"❌ No cabinets found in {room_name}"
@@ -322,15 +565,71 @@ class PDFDrawingAnalyzer:
         return self._generate_summary()
 
 
+def dimension_inches(match) -> float:
+    """The measurement in inches of a DIMENSION_PATTERN match (e.g. 31 1/2" -> 31.5, 2' -> 24)"""
+    value = int(match.group('whole'))
+    if match.group('numerator') and int(match.group('denominator')):
+        value += int(match.group('numerator')) / int(match.group('denominator'))
+    unit = match.group('unit').strip()
+    if '/' in unit:
+        return value + 1 / int(unit.split('/')[1])
+    return value * DIMENSION_UNITS[unit]
+
+
+def extract_and_classify_pages(pdf_path: str, start: int, stop: int) -> Tuple[PdfText, DrawingElementStore]:
+    """Parse pool job: the text and classified element store of pages start..stop-1"""
+    pdf_text = extract_pdf_text(pdf_path, start, stop)
+    return pdf_text, classify_page_blocks(pdf_path, pdf_text.blocks, start + 1)
+
+
+def classify_page_blocks(pdf_path: str, blocks_by_page, first_page: int) -> DrawingElementStore:
+    """Parse pool job: the classified element store of already extracted pages (blocks, from first_page)"""
+    analyzer = PDFDrawingAnalyzer(pdf_path, parallel=False)
+    analyzer.store = DrawingElementStore.from_blocks(blocks_by_page, first_page)
+    analyzer._classify_elements()
+    return analyzer.store
+
+
+def drawing_analysis_path(pdf_path: str) -> str:
+    # Lives next to (and is removed with) the PDF's text in the PDF text cache
+    content_hash = os.path.basename(pdf_text_cache_path(pdf_path)).split('-v')[0]
+    return os.path.join(os.path.dirname(os.path.abspath(pdf_path)), PDF_TEXT_CACHE_DIR,
+                        f"{content_hash}-drawing-v{PDF_TEXT_VERSION}.{DRAWING_ANALYSIS_VERSION}.pkl")
+
+
+def load_drawing_analysis(pdf_path: str) -> PDFDrawingAnalyzer:
+    """
+    An analyzed PDFDrawingAnalyzer session for the PDF, from memory or its sidecar (keyed by
+    content hash). The drawing is only analyzed (and the sidecar written) the first time this
+    content is seen, so follow-up questions skip extraction, classification and relationships.
+    Sessions are shared between requests and must be treated as read-only.
+    """
+    path = drawing_analysis_path(pdf_path)
+    analyzer = _analyses.get(path)
+    if analyzer is not None:
+        return analyzer
+
+    with _analysis_locks.hold(path):
+        analyzer = _analyses.get(path)
+        if analyzer is None:
+            state = read_sidecar(path)
+            if state is not None:
+                analyzer = PDFDrawingAnalyzer.from_state(pdf_path, state)
+        if analyzer is None:
+            analyzer = PDFDrawingAnalyzer(pdf_path)
+            analyzer.analyze()
+            content_hash = os.path.basename(path).split('-drawing-')[0]
+            write_sidecar(path, analyzer.state(), f"{content_hash}-drawing-*.pkl")
+        _analyses.put(path, analyzer, analyzer.nbytes)
+    return analyzer
+
+
 def analyze_pdf_drawing(pdf_path: str) -> Dict:
     """Main entry point for PDF drawing analysis"""
-    analyzer = PDFDrawingAnalyzer(pdf_path)
-    return analyzer.analyze()
+    return load_drawing_analysis(pdf_path).report
 
 
 def answer_drawing_question(pdf_path: str, question: str) -> str:
     """Answer questions about a PDF drawing"""
-    analyzer = PDFDrawingAnalyzer(pdf_path)
-    analyzer.analyze()
-    return analyzer.answer_question(question)
+    return load_drawing_analysis(pdf_path).answer_question(question)
 
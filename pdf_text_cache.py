@@ -0,0 +1,123 @@
+"""
+PDF text cache
+Per-page text and text block positions, extracted once per PDF and shared by every PDF consumer
+"""
+
+import os
+import sys
+import glob
+
+import fitz  # PyMuPDF
+
+from cache_utils import BudgetedLRUCache, KeyedLocks, file_content_hash, read_sidecar, write_sidecar
+
+# Bump whenever extraction output changes so cached text is extracted again
+PDF_TEXT_VERSION = '1'
+
+# Extracted text is stored next to each upload, keyed by content hash + version
+PDF_TEXT_CACHE_DIR = '.pdf_text'
+# Recently read documents are also kept in memory, so repeated questions skip the sidecar
+DEFAULT_PDF_TEXT_MEMORY_BYTES = 64 * 1024 * 1024
+
+_documents = BudgetedLRUCache(DEFAULT_PDF_TEXT_MEMORY_BYTES)
+_extract_locks = KeyedLocks()  # per sidecar path, so concurrent requests extract a PDF only once
+
+
+class PdfText:
+    """
+    Extracted text of one PDF.
+    pages[i] is page i+1's text (as fitz get_text("text") returns it) and blocks[i] its
+    text blocks as fitz (x0, y0, x1, y1, text, block_no, block_type) tuples.
+    """
+
+    __slots__ = ('pages', 'blocks')
+
+    def __init__(self, pages, blocks):
+        self.pages = pages
+        self.blocks = blocks
+
+    def __len__(self):
+        return len(self.pages)
+
+    def text(self, max_pages=None):
+        """The text of the first max_pages pages (all by default), one page after another."""
+        return ''.join(page + '\n' for page in self.pages[:max_pages])
+
+    @classmethod
+    def concatenate(cls, parts):
+        """One PdfText of consecutive page ranges' PdfTexts, in order."""
+        return cls([page for part in parts for page in part.pages], [blocks for part in parts for blocks in part.blocks])
+
+    @property
+    def nbytes(self):
+        return (sum(sys.getsizeof(page) for page in self.pages)
+                + sum(sys.getsizeof(block[4]) + 64 for page_blocks in self.blocks for block in page_blocks))
+
+
+def extract_pdf_text(file_path, start=0, stop=None):
+    """Reads the text and text blocks of pages start..stop-1 (all by default) with PyMuPDF (no caching)."""
+    pages, blocks = [], []
+    with fitz.open(file_path) as doc:
+        for page_num in range(start, doc.page_count if stop is None else min(stop, doc.page_count)):
+            page = doc[page_num]
+            pages.append(page.get_text("text"))
+            blocks.append([tuple(block) for block in page.get_text("blocks")])
+    return PdfText(pages, blocks)
+
+
+def pdf_text_cache_path(file_path):
+    content_hash = file_content_hash(file_path)
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), PDF_TEXT_CACHE_DIR, f"{content_hash}-v{PDF_TEXT_VERSION}.pkl")
+
+
+def cached_pdf_text(file_path):
+    """The PDF's PdfText if it was already extracted (from memory or its sidecar), else None."""
+    path = pdf_text_cache_path(file_path)
+    pdf_text = _documents.get(path)
+    if pdf_text is None:
+        cached = read_sidecar(path)
+        if cached is not None:
+            pdf_text = PdfText(*cached)
+            _documents.put(path, pdf_text, pdf_text.nbytes)
+    return pdf_text
+
+
+def store_pdf_text(file_path, pdf_text):
+    """Caches text extracted elsewhere (e.g. page ranges extracted in parallel) as the PDF's PdfText."""
+    path = pdf_text_cache_path(file_path)
+    content_hash = os.path.basename(path).split('-v')[0]
+    write_sidecar(path, (pdf_text.pages, pdf_text.blocks), f"{content_hash}-v*.pkl")
+    _documents.put(path, pdf_text, pdf_text.nbytes)
+
+
+def load_pdf_text(file_path):
+    """
+    The PDF's PdfText, from memory or its sidecar. The PDF itself is only opened (and
+    the sidecar written) the first time this content is read. Raises if it can't be opened.
+    """
+    path = pdf_text_cache_path(file_path)
+    pdf_text = _documents.get(path)
+    if pdf_text is not None:
+        return pdf_text
+
+    with _extract_locks.hold(path):
+        pdf_text = cached_pdf_text(file_path)
+        if pdf_text is None:
+            pdf_text = extract_pdf_text(file_path)
+            store_pdf_text(file_path, pdf_text)
+    return pdf_text
+
+
+def remove_pdf_text_cache(file_path):
+    """Removes the file's cached text and everything derived from it (e.g. its text_search line index)."""
+    try:
+        path = pdf_text_cache_path(file_path)
+    except OSError:
+        return
+    _documents.pop(path)
+    content_hash = os.path.basename(path).split('-v')[0]
+    for cached in glob.glob(os.path.join(os.path.dirname(path), f"{content_hash}-*")):
+        try:
+            os.remove(cached)
+        except OSError:
+            pass
@@ -0,0 +1,928 @@
+"""
+Compiled price index
+Flattens parsed price books into SKU -> price record indexes and caches them per file
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import math
+import shutil
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+from cache_utils import BudgetedLRUCache, file_content_hash
+from pdf_drawing_analyzer import load_drawing_analysis
+from price_parser import PARSER_VERSION, configure_parse_pool, ensure_sheet_cache, load_sheets, normalize_columns, remove_sheet_cache, run_in_parse_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+# How many of the most recently used price books are restored at startup
+DEFAULT_WARM_START_FILES = 20
+
+# Map for converting header codes/descriptions to natural material names
+MATERIAL_ID_MAP = {
+    '763': 'ELITE CHERRY / ELITE DURAFORM (TEXTURED)',
+    '682': 'PREMIUM CHERRY / PREMIUM DURAFORM (TEXTURED) / ELITE MAPLE / ELITE PAINTED',
+    '608': 'PRIME CHERRY / PREMIUM MAPLE / PREMIUM PAINTED / PREMIUM DURAFORM (NON-TEXTURED)',
+    '543': 'PRIME MAPLE / PRIME PAINTED / PRIME DURAFORM',
+    '485': 'CHOICE DURAFORM / CHOICE MAPLE / CHOICE PAINTED',
+    'BASE': 'BASE / STANDARD',
+    'STANDARD': 'BASE / STANDARD',
+    'N/A': 'BASE / STANDARD',
+    '753': 'ELITE CHERRY / ELITE DURAFORM (TEXTURED)',
+    '672': 'PREMIUM CHERRY / ELITE MAPLE / ELITE PAINTED',
+    '600': 'PRIME CHERRY / PREMIUM MAPLE / PREMIUM PAINTED / PREMIUM DURAFORM (NON-TEXTURED)',
+    '536': 'PRIME MAPLE / PRIME PAINTED / PRIME DURAFORM',
+    '479': 'CHOICE DURAFORM / CHOICE MAPLE / CHOICE PAINTED',
+}
+
+def extract_material_name(raw_header):
+    """Translates raw header to a standard material name using the map."""
+    if not raw_header:
+        return ''
+    
+    material_name = str(raw_header).strip().upper()
+    
+    # 1. Check Hardcoded ID Map
+    numeric_code_match = re.search(r'\b\d{3}\b', material_name)
+    if numeric_code_match and numeric_code_match.group() in MATERIAL_ID_MAP:
+        return MATERIAL_ID_MAP[numeric_code_match.group()]
+    
+    for key, value in MATERIAL_ID_MAP.items():
+        if key in material_name:
+             return value
+
+    # 2. Check Keywords
+    if 'ELITE CHERRY' in material_name or 'ELITE DURAFORM' in material_name:
+        return 'ELITE CHERRY / ELITE DURAFORM (TEXTURED)'
+    if 'PREMIUM CHERRY' in material_name or 'PREMIUM DURAFORM' in material_name or 'ELITE MAPLE' in material_name:
+        return 'PREMIUM CHERRY / PREMIUM DURAFORM (TEXTURED) / ELITE MAPLE / ELITE PAINTED'
+    if 'PRIME CHERRY' in material_name or 'PRIME MAPLE' in material_name:
+        return 'PRIME CHERRY / PREMIUM MAPLE / PREMIUM PAINTED / PREMIUM DURAFORM (NON-TEXTURED)'
+    if 'BASE' in material_name or 'STANDARD' in material_name:
+        return 'BASE / STANDARD'
+    
+    return material_name
+
+# Rows whose normalized first column matches this are treated as SKUs
+SKU_ROW_PATTERN = r'^[A-Z]{1,4}\d{2,6}|MI$'
+
+# Cells outside this range are quantities, widths, etc. rather than list prices
+MIN_LIST_PRICE = 50
+MAX_LIST_PRICE = 20000
+
+def _coerce_prices(values):
+    """Vectorized float(re.sub(r'[$,]', '', str(cell))) for a column; unparseable cells become NaN."""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+
+    # Numbers and plain numeric strings convert in C; only formatted text like "$1,250.00" needs cleaning
+    prices = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan, copy=True)
+    needs_cleaning = np.isnan(prices) & values.notna().to_numpy(dtype=bool)
+    if needs_cleaning.any():
+        cleaned = values[needs_cleaning].astype(str).str.replace(r'[$,]', '', regex=True).str.strip()
+        prices[needs_cleaning] = pd.to_numeric(cleaned, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return prices
+
+def extract_price_entries(df):
+    """
+    Columnar core of the index build for one DataFrame.
+    Returns None if the frame has no SKU column, otherwise a dict of:
+      skus / source_rows   - normalized SKU and 1-based row number per matching row
+      materials            - material name per priced column (resolved once per header)
+      entry_row / entry_material / entry_price - one entry per in-range price, row-major
+      options              - (row position, text) for MI option pricing cells
+    """
+    raw_headers = list(df.columns)
+    sku_pos = next((i for i, col in enumerate(raw_headers) if col.strip()), None)
+    if sku_pos is None:
+        return None
+    sku_col_name = raw_headers[sku_pos]
+
+    # 1. Normalize and filter the SKU column in bulk
+    sku_values = df.iloc[:, sku_pos]
+    sku_text = sku_values.astype(str).str.strip()
+    skus = sku_text.str.upper().str.replace(' ', '', regex=False)
+    valid = (
+        sku_values.notna().to_numpy(dtype=bool)
+        & (sku_text != '').to_numpy(dtype=bool)
+        & skus.str.match(SKU_ROW_PATTERN).fillna(False).to_numpy(dtype=bool)
+    )
+    valid_pos = np.flatnonzero(valid)
+    skus = skus.to_numpy(dtype=object)[valid_pos]
+    source_rows = np.asarray(df.index)[valid_pos] + 1
+    is_mi = skus == 'MI'
+
+    # 2. Resolve each header once and coerce every price column at once
+    materials = []
+    price_columns = []
+    keep_columns = []
+    options = []
+    for i, raw_header in enumerate(raw_headers):
+        if raw_header == sku_col_name or raw_header.startswith('Unnamed:') or not raw_header.strip():
+            continue
+
+        values = df.iloc[valid_pos, i]
+        is_option_col = raw_header.upper() == 'PRICING'
+
+        # Special handling for Option Pricing sheet MI code
+        if is_option_col and is_mi.any():
+            for row_pos in np.flatnonzero(is_mi):
+                cell_value = values.iloc[row_pos]
+                if not pd.isna(cell_value) and str(cell_value).strip():
+                    options.append((row_pos, str(cell_value).strip()))
+
+        material_name = extract_material_name(raw_header)
+        if not material_name.strip():
+            continue
+
+        prices = _coerce_prices(values)
+        keep = (prices >= MIN_LIST_PRICE) & (prices <= MAX_LIST_PRICE)
+        if is_option_col:
+            keep &= ~is_mi
+
+        materials.append(material_name)
+        price_columns.append(prices)
+        keep_columns.append(keep)
+
+    if price_columns:
+        price_matrix = np.column_stack(price_columns)
+        entry_row, entry_material = np.nonzero(np.column_stack(keep_columns))
+        entry_price = price_matrix[entry_row, entry_material]
+    else:
+        entry_row = entry_material = np.empty(0, dtype=np.intp)
+        entry_price = np.empty(0, dtype=float)
+
+    options.sort(key=lambda option: option[0])
+    return {
+        'skus': skus,
+        'source_rows': source_rows,
+        'materials': materials,
+        'entry_row': entry_row,
+        'entry_material': entry_material,
+        'entry_price': entry_price,
+        'options': options
+    }
+
+def build_data_index(data_frames, filename_map):
+    """Builds a flattened index map: SKU -> List of Price Records."""
+    data_index = {}
+    
+    for filename, df in data_frames.items():
+        if df is None or df.empty:
+            continue
+
+        entries = extract_price_entries(df)
+        if entries is None:
+            continue
+
+        label = filename_map.get(filename, filename)
+        skus = entries['skus']
+        materials = entries['materials']
+        entry_row = entries['entry_row']
+        entry_material = entries['entry_material']
+        entry_price = entries['entry_price']
+
+        # Entries are row-major, so each row's prices form one contiguous slice
+        price_rows, starts = np.unique(entry_row, return_index=True)
+        ends = np.append(starts[1:], len(entry_row))
+        price_slices = dict(zip(price_rows.tolist(), zip(starts.tolist(), ends.tolist())))
+
+        row_options = {}
+        for row_pos, option_text in entries['options']:
+            row_options.setdefault(row_pos, []).append(option_text)
+
+        for row_pos in sorted(price_slices.keys() | row_options.keys()):
+            sku = skus[row_pos]
+            source = f"{label} > Row {entries['source_rows'][row_pos]}"
+
+            for option_text in row_options.get(row_pos, []):
+                data_index.setdefault(sku, []).append({
+                    'sku': sku,
+                    'source': source,
+                    'option_pricing': option_text
+                })
+
+            if row_pos in price_slices:
+                start, end = price_slices[row_pos]
+                data_index.setdefault(sku, []).append({
+                    'sku': sku,
+                    'source': source,
+                    'prices': [
+                        {'material': materials[m], 'price': float(p)}
+                        for m, p in zip(entry_material[start:end].tolist(), entry_price[start:end].tolist())
+                    ]
+                })
+
+    return data_index
+
+def normalize_sku(sku):
+    return sku.strip().upper().replace(' ', '')
+
+def find_prices_for_sku(sku, data_index):
+    """Finds all price points for a normalized SKU from the data index."""
+    if not isinstance(data_index, dict):
+        return data_index.find_prices(sku)
+
+    normalized_sku = normalize_sku(sku)
+    
+    all_prices = []
+    seen_materials = set()
+    
+    if normalized_sku in data_index:
+        for record in data_index[normalized_sku]:
+            for price_data in record.get('prices', []):
+                material = price_data['material']
+                price = price_data['price']
+                
+                key = f"{material}:{price}"
+                if key not in seen_materials:
+                    all_prices.append({
+                        'sku': normalized_sku,
+                        'material': material,
+                        'price': price,
+                        'source': record['source']
+                    })
+                    seen_materials.add(key)
+    
+    return sorted(all_prices, key=lambda x: x['price'])
+
+def find_option_record(sku, data_index):
+    """Returns the first record for an option code such as MI, or None."""
+    if not isinstance(data_index, dict):
+        return data_index.option_record(sku)
+
+    records = data_index.get(normalize_sku(sku))
+    return records[0] if records else None
+
+
+# Arrays persisted in (and memory-mapped from) an index snapshot directory
+SNAPSHOT_ARRAYS = ('sku_offsets', 'material_ids', 'prices', 'source_rows', 'source_sheets')
+SNAPSHOT_DIR = '.price_index'
+# Recently used price books (and analyzed drawings) per upload folder, read back by warm_start
+MANIFEST_NAME = 'manifest.json'
+PRICE_BOOK = 'price_book'
+DRAWING = 'drawing'
+MANIFEST_MAX_FILES = 200
+MANIFEST_WRITE_SECONDS = 30
+
+
+class CompactPriceIndex:
+    """
+    Array-backed price index for a single price book.
+    SKU and material names are interned once; every price is one row of parallel
+    NumPy arrays (material_id, price, source_sheet, source_row), grouped by SKU through
+    an offsets array and pre-sorted by price, so a lookup is a dict hit plus an array slice.
+    """
+
+    def __init__(self, label, skus, sku_offsets, materials, material_ids, prices, source_rows, options,
+                 sheets=None, source_sheets=None):
+        self.label = label
+        self.skus = skus                    # sku_id -> SKU
+        self.sku_offsets = sku_offsets      # entries for sku_id live in [offsets[id], offsets[id + 1])
+        self.materials = materials          # material_id -> material name
+        self.material_ids = material_ids
+        self.prices = prices
+        self.source_rows = source_rows
+        self.options = options              # SKU -> [(sheet_id, source_row, option_pricing)]
+        self.sheets = sheets if sheets is not None else ['']  # sheet_id -> sheet name ('' for single-sheet books)
+        self.source_sheets = source_sheets if source_sheets is not None else np.zeros(len(prices), dtype=np.int16)
+        self._sku_ids = {sku: i for i, sku in enumerate(skus)}
+        self._source_labels = [f"{label} > {sheet}" if sheet else label for sheet in self.sheets]
+
+    @classmethod
+    def from_frame(cls, df, label):
+        """Builds the compact index for one parsed price book DataFrame."""
+        return cls.from_frames([('', df)], label)
+
+    @classmethod
+    def from_frames(cls, frames, label):
+        """
+        Builds the compact index for a price book from its parsed sheets, given as
+        [(sheet_name, df), ...] in workbook order. Sources read "label > sheet > Row n"
+        (just "label > Row n" when the sheet name is '').
+        """
+        sheets = []
+        parts = []
+        for sheet_name, df in frames:
+            entries = extract_price_entries(df) if df is not None and not df.empty else None
+            if entries is not None:
+                sheets.append(sheet_name)
+                parts.append(entries)
+        if not parts:
+            return cls.empty(label)
+
+        # Concatenate the sheets, shifting row and material positions past the previous sheets
+        row_offsets = np.cumsum([0] + [len(entries['skus']) for entries in parts])
+        material_offsets = np.cumsum([0] + [len(entries['materials']) for entries in parts])
+        row_skus = np.concatenate([entries['skus'] for entries in parts])
+        row_source_rows = np.concatenate([entries['source_rows'] for entries in parts])
+        row_sheets = np.repeat(np.arange(len(parts)), np.diff(row_offsets))
+        entry_row = np.concatenate([entries['entry_row'] + row_offsets[i] for i, entries in enumerate(parts)])
+        entry_material = np.concatenate([entries['entry_material'] + material_offsets[i] for i, entries in enumerate(parts)])
+        prices = np.concatenate([entries['entry_price'] for entries in parts])
+        row_options = [(row_pos + row_offsets[i], text) for i, entries in enumerate(parts) for row_pos, text in entries['options']]
+
+        # Intern materials (different headers can map to the same material name)
+        materials, column_material_ids = np.unique(np.array([m for entries in parts for m in entries['materials']], dtype=object), return_inverse=True)
+        sku_table, row_sku_ids = np.unique(row_skus, return_inverse=True) if len(row_skus) else (np.empty(0, dtype=object), np.empty(0, dtype=np.intp))
+
+        sku_ids = row_sku_ids[entry_row]
+        material_ids = column_material_ids[entry_material] if len(entry_row) else entry_row
+        source_rows = row_source_rows[entry_row]
+        source_sheets = row_sheets[entry_row]
+
+        # Group by SKU, cheapest first; lexsort is stable so ties keep sheet/row/column order
+        order = np.lexsort((prices, sku_ids))
+        sku_ids, material_ids, prices, source_rows, source_sheets = (
+            sku_ids[order], material_ids[order], prices[order], source_rows[order], source_sheets[order])
+
+        # Keep the first occurrence of each (SKU, material, price), like find_prices_for_sku
+        duplicated = pd.DataFrame({'s': sku_ids, 'm': material_ids, 'p': prices}).duplicated().to_numpy()
+        keep = ~duplicated
+        sku_ids, material_ids, prices, source_rows, source_sheets = (
+            sku_ids[keep], material_ids[keep], prices[keep], source_rows[keep], source_sheets[keep])
+
+        # Drop SKUs that ended up without prices or options, then rebuild offsets
+        option_skus = {row_skus[row_pos] for row_pos, _ in row_options}
+        used = np.zeros(len(sku_table), dtype=bool)
+        used[sku_ids] = True
+        used |= np.isin(sku_table, list(option_skus))
+        remap = np.cumsum(used) - 1
+        sku_table = sku_table[used]
+        sku_ids = remap[sku_ids]
+        sku_offsets = np.zeros(len(sku_table) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sku_ids, minlength=len(sku_table)), out=sku_offsets[1:])
+
+        options = {}
+        for row_pos, option_text in row_options:
+            options.setdefault(row_skus[row_pos], []).append((int(row_sheets[row_pos]), int(row_source_rows[row_pos]), option_text))
+
+        return cls(
+            label=label,
+            skus=[str(sku) for sku in sku_table],
+            sku_offsets=sku_offsets,
+            materials=[str(material) for material in materials],
+            material_ids=material_ids.astype(np.int32 if len(materials) > np.iinfo(np.int16).max else np.int16),
+            prices=prices.astype(np.float64),
+            source_rows=source_rows.astype(np.int32),
+            options=options,
+            sheets=sheets,
+            source_sheets=source_sheets.astype(np.int16)
+        )
+
+    @classmethod
+    def empty(cls, label):
+        return cls(label, [], np.zeros(1, dtype=np.int64), [], np.empty(0, dtype=np.int16),
+                   np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int32), {})
+
+    def relabeled(self, label):
+        """Returns a copy sharing all arrays but reporting a different source label."""
+        clone = object.__new__(CompactPriceIndex)
+        clone.__dict__.update(self.__dict__)
+        clone.label = label
+        clone._source_labels = [f"{label} > {sheet}" if sheet else label for sheet in self.sheets]
+        return clone
+
+    def save(self, path):
+        """
+        Writes the index as a snapshot directory: one .npy file per array plus meta.json.
+        The directory is renamed into place, so readers never see a partial snapshot.
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_path)
+        try:
+            for name in SNAPSHOT_ARRAYS:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump({
+                    'label': self.label,
+                    'skus': self.skus,
+                    'materials': self.materials,
+                    'sheets': self.sheets,
+                    'options': self.options
+                }, f)
+            os.rename(tmp_path, path)
+        finally:
+            # Still present if the rename failed, e.g. another worker wrote it first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        """Opens a snapshot written by save(). The arrays are read-only memory maps, so
+        every worker process that loads the same snapshot shares one physical copy."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in SNAPSHOT_ARRAYS}
+        options = {sku: [tuple(option) for option in options] for sku, options in meta['options'].items()}
+        return cls(label=meta['label'], skus=meta['skus'], materials=meta['materials'], options=options,
+                   sheets=meta['sheets'], **arrays)
+
+    def __len__(self):
+        return len(self.skus)
+
+    def __contains__(self, sku):
+        return normalize_sku(sku) in self._sku_ids
+
+    @property
+    def nbytes(self):
+        """Approximate memory footprint, used for the cache memory budget."""
+        arrays = sum(getattr(self, name).nbytes for name in SNAPSHOT_ARRAYS)
+        tables = sum(sys.getsizeof(sku) for sku in self.skus) + sys.getsizeof(self._sku_ids) + sys.getsizeof(self.skus)
+        tables += sum(sys.getsizeof(material) for material in self.materials)
+        tables += sum(sys.getsizeof(text) + 64 for options in self.options.values() for _, _, text in options)
+        return arrays + tables
+
+    def source(self, sheet_id, source_row):
+        return f"{self._source_labels[sheet_id]} > Row {source_row}"
+
+    def find_prices(self, sku):
+        """Same result as find_prices_for_sku on the equivalent dict index."""
+        normalized_sku = normalize_sku(sku)
+        sku_id = self._sku_ids.get(normalized_sku)
+        if sku_id is None:
+            return []
+
+        start, end = self.sku_offsets[sku_id], self.sku_offsets[sku_id + 1]
+        return [
+            {
+                'sku': normalized_sku,
+                'material': self.materials[material_id],
+                'price': price,
+                'source': self.source(sheet_id, source_row)
+            }
+            for material_id, price, sheet_id, source_row in zip(
+                self.material_ids[start:end].tolist(), self.prices[start:end].tolist(),
+                self.source_sheets[start:end].tolist(), self.source_rows[start:end].tolist()
+            )
+        ]
+
+    def option_record(self, sku):
+        """
+        Same record as find_option_record on the equivalent dict index: the code's first row in
+        sheet/row order, with its option text if that row has one (option cells come before
+        the row's prices), otherwise just its source (callers fall back to a default).
+        """
+        normalized_sku = normalize_sku(sku)
+        options = self.options.get(normalized_sku)
+        first_option = options[0] if options else None
+
+        # First priced row; dropped duplicate prices always have an earlier kept row
+        first_priced = None
+        sku_id = self._sku_ids.get(normalized_sku)
+        if sku_id is not None:
+            start, end = self.sku_offsets[sku_id], self.sku_offsets[sku_id + 1]
+            if end > start:
+                sheets, rows = self.source_sheets[start:end], self.source_rows[start:end]
+                first = np.lexsort((rows, sheets))[0]
+                first_priced = (int(sheets[first]), int(rows[first]))
+
+        if first_option and (first_priced is None or first_option[:2] <= first_priced):
+            sheet_id, source_row, option_text = first_option
+            return {'sku': normalized_sku, 'source': self.source(sheet_id, source_row), 'option_pricing': option_text}
+        if first_priced:
+            return {'sku': normalized_sku, 'source': self.source(*first_priced)}
+        return None
+
+    def price_table(self, skus):
+        """
+        Batched find_prices for many normalized SKUs.
+        Returns a DataFrame (sku, material, price, label, source_row) ordered by SKU then price,
+        where label is the file (and sheet) the price came from.
+        """
+        skus = np.asarray(skus, dtype=object)
+        sku_ids = np.array([self._sku_ids.get(sku, -1) for sku in skus], dtype=np.int64)
+        found = sku_ids >= 0
+        starts = self.sku_offsets[sku_ids[found]]
+        counts = self.sku_offsets[sku_ids[found] + 1] - starts
+
+        # Gather every [start, end) slice at once: start of each run + offset within the run
+        run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        positions = run_starts + np.arange(counts.sum())
+
+        return pd.DataFrame({
+            'sku': np.repeat(skus[found], counts),
+            'material': np.asarray(self.materials, dtype=object)[self.material_ids[positions]] if len(positions) else np.empty(0, dtype=object),
+            'price': self.prices[positions],
+            'label': np.asarray(self._source_labels, dtype=object)[self.source_sheets[positions]],
+            'source_row': self.source_rows[positions]
+        })
+
+
+class MergedPriceIndex:
+    """Read-only view answering queries across several per-file indexes, in file order."""
+
+    def __init__(self, segments):
+        self.segments = list(segments)
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def __contains__(self, sku):
+        return any(sku in segment for segment in self.segments)
+
+    def find_prices(self, sku):
+        all_prices = []
+        seen_materials = set()
+        for segment in self.segments:
+            for price_data in segment.find_prices(sku):
+                key = (price_data['material'], price_data['price'])
+                if key not in seen_materials:
+                    all_prices.append(price_data)
+                    seen_materials.add(key)
+
+        # Stable sort keeps file order for equal prices
+        return sorted(all_prices, key=lambda x: x['price'])
+
+    def option_record(self, sku):
+        return next((record for record in (segment.option_record(sku) for segment in self.segments) if record), None)
+
+    def price_table(self, skus):
+        """Batched find_prices across all segments, with the same de-duplication and ordering."""
+        tables = [segment.price_table(skus) for segment in self.segments]
+        if not tables:
+            return CompactPriceIndex.empty('').price_table([])
+
+        table = pd.concat(tables, ignore_index=True)
+        table = table[~table.duplicated(subset=['sku', 'material', 'price'])]
+        return table.sort_values(['sku', 'price'], kind='stable', ignore_index=True)
+
+
+def quote_lines(lines, price_index, default_material=''):
+    """
+    Prices a whole quote in one batched pass.
+    lines: [{'sku', 'material', 'qty'}, ...]. A line's material is matched against the
+    index's material names like process_question does (case-insensitive substring,
+    cheapest match wins); lines without a material get the cheapest option, and lines
+    without a qty count as 1. A qty that is not a finite number above 0 makes the line invalid_qty.
+    Returns (priced_lines, totals).
+    """
+    quote = pd.DataFrame({
+        'sku': [str(line.get('sku') or '') for line in lines],
+        'material': [str(line.get('material') or default_material or '') for line in lines],
+        'qty': pd.to_numeric(pd.Series([1 if line.get('qty') is None else line.get('qty') for line in lines], dtype=object), errors='coerce')
+    })
+    quote['sku'] = quote['sku'].str.strip().str.upper().str.replace(' ', '', regex=False)
+    quote['material_key'] = quote['material'].str.strip().str.lower()
+
+    # 1. All price rows for the distinct SKUs on the quote
+    candidates = price_index.price_table(quote['sku'].unique())
+    candidates['material_key'] = candidates['material'].str.lower()
+
+    # 2. Resolve each distinct (SKU, material) pair once
+    pairs = quote[['sku', 'material_key']].drop_duplicates()
+    matched = pairs.merge(candidates, on='sku', how='inner', suffixes=('', '_candidate'))
+    matched = matched.loc[np.array([
+        wanted in offered
+        for wanted, offered in zip(matched['material_key'], matched['material_key_candidate'])
+    ], dtype=bool)]
+    best = matched.drop_duplicates(subset=['sku', 'material_key'], keep='first')  # candidates are cheapest-first
+
+    priced = quote.merge(best[['sku', 'material_key', 'material', 'price', 'label', 'source_row']],
+                         on=['sku', 'material_key'], how='left', suffixes=('_requested', ''))
+    known_skus = set(candidates['sku'])
+    valid_qty = np.isfinite(priced['qty'].to_numpy(dtype=np.float64)) & (priced['qty'] > 0)
+    priced['status'] = np.where(
+        ~valid_qty, 'invalid_qty',
+        np.where(
+            priced['price'].notna(), 'ok',
+            np.where(priced['sku'].isin(known_skus), 'material_not_found', 'sku_not_found')
+        )
+    )
+    priced['extended_price'] = (priced['price'] * priced['qty']).round(2)
+
+    priced_lines = []
+    for i, row in enumerate(priced.itertuples(index=False), start=1):
+        found = row.status == 'ok'
+        priced_lines.append({
+            'line': i,
+            'sku': row.sku,
+            'material': row.material if found else row.material_requested,
+            'qty': float(row.qty) if math.isfinite(row.qty) else None,  # inf is not valid JSON
+            'unit_price': float(row.price) if found else None,
+            'extended_price': float(row.extended_price) if found else None,
+            'source': f"{row.label} > Row {int(row.source_row)}" if found else None,
+            'status': row.status
+        })
+
+    ok = priced['status'] == 'ok'
+    totals = {
+        'lines': len(priced),
+        'priced_lines': int(ok.sum()),
+        'missing_lines': int((~ok).sum()),
+        'quantity': float(priced.loc[ok, 'qty'].sum()),
+        'subtotal': round(float(priced.loc[ok, 'extended_price'].sum()), 2)
+    }
+    return priced_lines, totals
+
+
+def build_price_index(file_path, label, parallel=True):
+    """
+    Parses a price book and compiles its index; None if the file cannot be parsed.
+    Module-level so the parse pool can run it. Pool workers pass parallel=False
+    (they parse their file's sheets serially instead of nesting pools).
+    """
+    sheets = load_sheets(file_path, label, parallel=parallel)
+    if not sheets:
+        return None
+
+    # Sheet names only appear in sources when the book has more than one sheet
+    frames = [(sheet_name if len(sheets) > 1 else '', normalize_columns(df)) for sheet_name, df in sheets.items()]
+    return CompactPriceIndex.from_frames(frames, label)
+
+
+class PriceIndexCache:
+    """
+    Process-wide cache of compiled per-file price indexes.
+    Entries are keyed by file content hash + parser version, so re-uploads of an
+    unchanged price book reuse the index and parser changes invalidate it.
+    Each index is also written as an on-disk snapshot next to the upload, which
+    other worker processes memory-map instead of parsing the file again.
+    The snapshot folder also keeps a manifest of the most recently used price books and
+    analyzed drawings, so a freshly started process can restore them (warm_start) before users ask.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES, snapshots: bool = True):
+        self._entries = BudgetedLRUCache(max_bytes)
+        self.snapshots = snapshots
+        self.warm_status = {'status': 'idle', 'total': 0, 'restored': 0, 'failed': 0}
+        self._recent = {}  # absolute file path -> (label, last used time, kind), not yet in a manifest
+        self._manifest_written = 0
+        self._manifest_lock = threading.Lock()
+        self._warm_config = None  # (folder, limit, background) once init_app enabled warm starts
+        self._warm_pid = None     # process that started its warm start
+        self._warm_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._entries.max_bytes = app.config.get('PRICE_INDEX_CACHE_BYTES', DEFAULT_CACHE_BYTES)
+        self.snapshots = app.config.get('PRICE_INDEX_SNAPSHOTS', True)
+        if app.config.get('PARSE_WORKERS'):
+            configure_parse_pool(app.config['PARSE_WORKERS'])
+        app.extensions['price_index_cache'] = self
+
+        # Restore the most recently used indexes, so the first questions after a deploy or
+        # worker recycle don't wait for re-indexing. The app is often imported by a process
+        # that then forks the workers (e.g. the gunicorn master), so nothing starts here:
+        # each serving process starts its own warm start on its first request.
+        warm_files = app.config.get('WARM_START_FILES', DEFAULT_WARM_START_FILES)
+        if warm_files and self.snapshots and app.config.get('UPLOAD_FOLDER'):
+            self._warm_config = (app.config['UPLOAD_FOLDER'], warm_files,
+                                 app.config.get('WARM_START_MODE', 'background') != 'blocking')
+            app.before_request(self.warm_start_once)
+
+    def warm_start_once(self):
+        """Starts this process's warm start if it hasn't been started yet (called before each request)."""
+        if self._warm_config is None or self._warm_pid == os.getpid():
+            return
+        with self._warm_lock:
+            if self._warm_pid == os.getpid():
+                return
+            self._warm_pid = os.getpid()
+        folder, limit, background = self._warm_config
+        self.warm_start(folder, limit, background=background)
+
+    @staticmethod
+    def cache_key(file_path):
+        return (file_content_hash(file_path), PARSER_VERSION)
+
+    @staticmethod
+    def snapshot_path(file_path, key):
+        content_hash, parser_version = key
+        return os.path.join(os.path.dirname(os.path.abspath(file_path)), SNAPSHOT_DIR, f"{content_hash}-v{parser_version}")
+
+    def _load_snapshot(self, file_path, key):
+        path = self.snapshot_path(file_path, key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            return CompactPriceIndex.load(path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable price index snapshot {path}: {e}")
+            return None
+
+    def _save_snapshot(self, file_path, key, price_index):
+        path = self.snapshot_path(file_path, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not os.path.isdir(path):
+                price_index.save(path)
+            # Snapshots written by older parser versions are never read again
+            for stale in glob.glob(os.path.join(os.path.dirname(path), f"{key[0]}-v*")):
+                if stale != path and '.tmp-' not in stale:
+                    shutil.rmtree(stale, ignore_errors=True)
+        except OSError as e:
+            logger.warning(f"Could not write price index snapshot {path}: {e}")
+
+    def _lookup(self, file_path, key):
+        """Compiled index from memory or an on-disk snapshot, or None."""
+        price_index = self._entries.get(key)
+        if price_index is None and self.snapshots:
+            price_index = self._load_snapshot(file_path, key)
+        return price_index
+
+    def _store(self, file_path, key, price_index, built):
+        if built and self.snapshots:
+            self._save_snapshot(file_path, key, price_index)
+        if key not in self._entries:
+            self._entries.put(key, price_index, price_index.nbytes)
+
+    @staticmethod
+    def _labeled(price_index, label):
+        # The same content may be uploaded under different names
+        return price_index if price_index.label == label else price_index.relabeled(label)
+
+    def get_index(self, file_path, label):
+        """Returns the compiled index for one file, parsing it only if it is neither
+        cached in memory nor snapshotted on disk. Returns None if the file cannot be parsed."""
+        key = self.cache_key(file_path)
+        price_index = self._lookup(file_path, key)
+        built = price_index is None
+        if built:
+            price_index = build_price_index(file_path, label)
+            if price_index is None:
+                return None
+
+        self._store(file_path, key, price_index, built)
+        return self._labeled(price_index, label)
+
+    def add_file(self, file_path, label):
+        """
+        Converts a newly uploaded price book to its parsed-sheet sidecar and indexes it as
+        its own segment, so no later request has to open the workbook. Returns True on success.
+        """
+        try:
+            ensure_sheet_cache(file_path, label)
+            if self.get_index(file_path, label) is None:
+                return False
+        except Exception as e:
+            logger.error(f"Error indexing file {label}: {e}")
+            return False
+        self._note_used([(file_path, label)])
+        return True
+
+    def drop_file(self, file_path):
+        """Drops the segment (and its snapshot and sheet sidecar) for a file that is about to be deleted."""
+        try:
+            key = self.cache_key(file_path)
+        except OSError:
+            return
+        self._entries.pop(key)
+        shutil.rmtree(self.snapshot_path(file_path, key), ignore_errors=True)
+        remove_sheet_cache(file_path)
+        with self._manifest_lock:
+            self._recent.pop(os.path.abspath(file_path), None)
+
+    def get_indexes(self, files):
+        """
+        get_index for [(file_path, label), ...], returning one index (or None) per file.
+        When several files miss the cache they are parsed and compiled concurrently in the
+        parse pool, so latency follows the slowest file rather than the sum.
+        """
+        keys = [self.cache_key(file_path) for file_path, _ in files]
+        indexes = [self._lookup(file_path, key) for (file_path, _), key in zip(files, keys)]
+        missing = [i for i, price_index in enumerate(indexes) if price_index is None]
+
+        built = None
+        if len(missing) > 1:
+            jobs = [(files[i][0], files[i][1], False) for i in missing]
+            built = run_in_parse_pool(build_price_index, jobs, f"{len(missing)} price books")
+        if built is None:
+            # Like the pool, a book that fails to build is reported per file instead of failing the rest
+            built = []
+            for i in missing:
+                try:
+                    built.append(build_price_index(*files[i]))
+                except Exception as e:
+                    built.append(e)
+
+        for i, result in zip(missing, built):
+            if isinstance(result, Exception):
+                logger.error(f"Error indexing file {files[i][1]}: {result}")
+                result = None
+            indexes[i] = result
+
+        results = []
+        for i, ((file_path, label), key, price_index) in enumerate(zip(files, keys, indexes)):
+            if price_index is None:
+                results.append(None)
+                continue
+            self._store(file_path, key, price_index, i in missing)
+            results.append(self._labeled(price_index, label))
+        return results
+
+    def fingerprint(self, files):
+        """Version of a file selection: changes whenever a file's content, the parser or a label changes."""
+        return tuple((self.cache_key(file_path), label) for file_path, label in files)
+
+    def view(self, files):
+        """Merged, queryable view over the segments for [(file_path, label), ...]."""
+        segments = self.get_indexes(files)
+        self._note_used([file for file, segment in zip(files, segments) if segment is not None])
+        return MergedPriceIndex(segment for segment in segments if segment is not None)
+
+    @staticmethod
+    def manifest_path(folder):
+        return os.path.join(os.path.abspath(folder), SNAPSHOT_DIR, MANIFEST_NAME)
+
+    @classmethod
+    def read_manifest(cls, folder):
+        """
+        [{'file', 'label', 'last_used', 'kind'}] for a folder's price books and drawings, most
+        recently used first. kind is PRICE_BOOK or DRAWING.
+        """
+        try:
+            with open(cls.manifest_path(folder)) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return []
+        # Manifests written before drawings were recorded only list price books
+        entries = [dict(entry, kind=entry.get('kind', PRICE_BOOK)) for entry in entries]
+        return sorted(entries, key=lambda entry: entry['last_used'], reverse=True)
+
+    def note_drawing_used(self, file_path, label):
+        """Records that a drawing was analyzed, so warm_start restores its analysis."""
+        self._note_used([(file_path, label)], DRAWING)
+
+    def _note_used(self, files, kind=PRICE_BOOK):
+        """Records that files were used; manifests are rewritten at most every MANIFEST_WRITE_SECONDS."""
+        if not self.snapshots:
+            return
+        now = time.time()
+        with self._manifest_lock:
+            new_file = False
+            for file_path, label in files:
+                path = os.path.abspath(file_path)
+                new_file = new_file or path not in self._recent
+                self._recent[path] = (label, now, kind)
+            if not new_file and now - self._manifest_written < MANIFEST_WRITE_SECONDS:
+                return
+            self._manifest_written = now
+            self.write_manifests()
+
+    def write_manifests(self):
+        """Merges the recently used files into their folders' manifests (other workers write them too)."""
+        folders = {}
+        for path, (label, last_used, kind) in self._recent.items():
+            folders.setdefault(os.path.dirname(path), {})[os.path.basename(path)] = (label, last_used, kind)
+
+        for folder, used in folders.items():
+            entries = {entry['file']: entry for entry in self.read_manifest(folder)}
+            for name, (label, last_used, kind) in used.items():
+                if last_used >= entries.get(name, {}).get('last_used', 0):
+                    entries[name] = {'file': name, 'label': label, 'last_used': last_used, 'kind': kind}
+            entries = [entry for entry in entries.values() if os.path.exists(os.path.join(folder, entry['file']))]
+            entries.sort(key=lambda entry: entry['last_used'], reverse=True)
+
+            path = self.manifest_path(folder)
+            tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries[:MANIFEST_MAX_FILES], f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write price index manifest {path}: {e}")
+
+    def warm_start(self, folder, limit=DEFAULT_WARM_START_FILES, background=True):
+        """
+        Loads the folder's `limit` most recently used files into memory: price book indexes
+        from their snapshots (or by re-indexing if a snapshot is missing), and drawing analyses
+        from their sidecars (or by analyzing the drawing again). Runs in a daemon
+        thread unless background is False, in which case it returns once they are loaded.
+        """
+        entries = [entry for entry in self.read_manifest(folder)
+                   if os.path.exists(os.path.join(folder, entry['file']))][:limit]
+        self.warm_status = {'status': 'warming', 'total': len(entries), 'restored': 0, 'failed': 0}
+        if not background:
+            self._warm(folder, entries)
+            return
+        threading.Thread(target=self._warm, args=(folder, entries), name='price-index-warm-start', daemon=True).start()
+
+    def _warm(self, folder, entries):
+        started = time.time()
+        for entry in entries:
+            try:
+                file_path = os.path.join(folder, entry['file'])
+                if entry['kind'] == DRAWING:
+                    restored = load_drawing_analysis(file_path) is not None
+                else:
+                    restored = self.get_index(file_path, entry['label']) is not None
+            except Exception as e:
+                logger.warning(f"Warm start could not restore {entry['label']}: {e}")
+                restored = False
+            self.warm_status['restored' if restored else 'failed'] += 1
+        self.warm_status['status'] = 'done'
+        logger.info(f"Warm start restored {self.warm_status['restored']} of {len(entries)} price indexes and drawings in {time.time() - started:.2f}s")
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
@@ -0,0 +1,323 @@
+"""
+Price book parsing
+Reads uploaded Excel/CSV price books into DataFrames, detecting the real header row
+"""
+
+import os
+import re
+import glob
+import logging
+import threading
+import multiprocessing
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+from cache_utils import file_content_hash, read_sidecar, write_sidecar
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever parsing or indexing output changes so cached indexes are rebuilt
+PARSER_VERSION = '2'
+
+# Sheets (and whole files, see price_index) are parsed in parallel by up to this many worker processes
+MAX_PARSE_WORKERS = min(8, os.cpu_count() or 1)
+
+_parse_pool = None
+_parse_pool_pid = None  # process that created _parse_pool
+_parse_pool_lock = threading.Lock()
+
+# Parsed sheets are stored next to each upload, keyed by content hash + parser version
+SHEET_CACHE_DIR = '.sheets'
+
+
+HEADER_SCAN_ROWS = 10
+HEADER_ROW_MARKERS = ['SKU', 'OPTION', 'W942', 'DDF24', 'DOOR STYLES', 'WRH3024 RP', 'CONSTRUCTION OPTIONS']
+NUMERIC_TEXT_PATTERN = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+def _detect_header_row(df_check):
+    """Pick the leading row that looks most like a header (most non-numeric text cells)."""
+    best_header_row = 0
+    max_score = -1
+
+    for i in range(len(df_check)):
+        row = df_check.iloc[i]
+        score = sum(1 for x in row if isinstance(x, str) and len(x.strip()) > 0 and not NUMERIC_TEXT_PATTERN.match(x.strip()))
+        if score > max_score and str(row.iloc[0]).strip().upper() in HEADER_ROW_MARKERS:
+            max_score = score
+            best_header_row = i
+
+    return best_header_row
+
+
+def _convert_cell(cell):
+    """Convert an openpyxl cell the same way pandas' openpyxl reader does."""
+    if cell.value is None:
+        return ''
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def _iter_sheet_rows(ws):
+    """Yield converted rows with trailing empty cells trimmed."""
+    for row in ws.rows:
+        converted_row = [_convert_cell(cell) for cell in row]
+        while converted_row and converted_row[-1] == '':
+            converted_row.pop()
+        yield converted_row
+
+
+def _rows_to_frame(rows, header):
+    """Build a DataFrame from raw sheet rows exactly as pd.read_excel would."""
+    last_row_with_data = -1
+    for i, row in enumerate(rows):
+        if row:
+            last_row_with_data = i
+    rows = rows[:last_row_with_data + 1]
+    if not rows:
+        return pd.DataFrame()
+
+    max_width = max(len(row) for row in rows)
+    rows = [row + [''] * (max_width - len(row)) if len(row) < max_width else row for row in rows]
+
+    try:
+        return TextParser(rows, header=header, skip_blank_lines=False, keep_default_na=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def _read_xlsx_single_pass(file_path, sheet_name=None):
+    """Read one worksheet (default: the first) once, detecting the header from the buffered leading rows."""
+    wb = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0] if sheet_name is None else wb[sheet_name]
+        ws.reset_dimensions()
+        row_stream = _iter_sheet_rows(ws)
+        leading_rows = list(islice(row_stream, HEADER_SCAN_ROWS))
+        best_header_row = _detect_header_row(_rows_to_frame(leading_rows, header=None))
+        rows = leading_rows + list(row_stream)
+    finally:
+        wb.close()
+
+    return _rows_to_frame(rows, header=best_header_row)
+
+
+def _read_excel_two_pass(file_path, sheet_name=None):
+    """Generic pandas path (used for .xls and as a fallback): scan the leading rows, then re-read."""
+    xls = pd.ExcelFile(file_path)
+    if sheet_name is None:
+        sheet_name = xls.sheet_names[0]
+    df_check = pd.read_excel(xls, sheet_name=sheet_name, header=None, nrows=HEADER_SCAN_ROWS, keep_default_na=False)
+    best_header_row = _detect_header_row(df_check)
+    return pd.read_excel(xls, sheet_name=sheet_name, header=best_header_row, keep_default_na=False)
+
+
+def read_sheet(file_path, filename, sheet_name=None):
+    """
+    Reads one sheet (default: the first; CSV files have a single sheet) with header
+    detection. Columns keep their pandas names ('Unnamed: 3', 'Price.1', ...).
+    Raises on unreadable files; returns None for unsupported extensions.
+    """
+    # Check if the file is an Excel file
+    if filename.lower().endswith('.xlsx'):
+        try:
+            return _read_xlsx_single_pass(file_path, sheet_name)
+        except Exception as e:
+            logger.warning(f"Single-pass read failed for {filename}, falling back to pandas: {e}")
+            return _read_excel_two_pass(file_path, sheet_name)
+
+    elif filename.lower().endswith('.xls'):
+        return _read_excel_two_pass(file_path, sheet_name)
+
+    # Check if the file is a CSV
+    elif filename.lower().endswith('.csv'):
+        df_check = pd.read_csv(file_path, header=None, nrows=HEADER_SCAN_ROWS, keep_default_na=False)
+        best_header_row = _detect_header_row(df_check)
+        return pd.read_csv(file_path, header=best_header_row, keep_default_na=False)
+
+    return None
+
+
+def normalize_columns(df):
+    """Pricing view of a parsed sheet: drop all-NaN columns, strip headers and blank out 'Unnamed:' ones."""
+    df = df.dropna(axis=1, how='all')
+    df.columns = [str(col).strip() if not str(col).startswith('Unnamed:') else '' for col in df.columns]
+    return df
+
+
+def parse_data_file(file_path, filename):
+    """Reads a file into a pandas DataFrame, trying to detect the header row."""
+    try:
+        df = read_sheet(file_path, filename)
+        return normalize_columns(df) if df is not None else None
+
+    except Exception as e:
+        logger.error(f"Error parsing file {filename}: {e}")
+        return None
+
+
+def list_sheets(file_path, filename):
+    """Worksheet names in workbook order (the same ones pandas exposes)."""
+    if filename.lower().endswith('.csv'):
+        return [os.path.splitext(os.path.basename(filename))[0]]
+    if filename.lower().endswith('.xlsx'):
+        wb = load_workbook(file_path, read_only=True, keep_links=False)
+        try:
+            return [ws.title for ws in wb.worksheets]
+        finally:
+            wb.close()
+    return pd.ExcelFile(file_path).sheet_names
+
+
+def configure_parse_pool(max_workers):
+    """Sets the pool size; an existing pool of a different size is replaced on next use."""
+    global MAX_PARSE_WORKERS
+    max_workers = max(1, int(max_workers))
+    if max_workers != MAX_PARSE_WORKERS:
+        MAX_PARSE_WORKERS = max_workers
+        shutdown_parse_pool()
+
+
+def get_parse_pool():
+    """Shared process pool for parsing work, created on first use (and again in a forked child)."""
+    global _parse_pool, _parse_pool_pid
+    with _parse_pool_lock:
+        # A pool inherited through fork has no manager thread in this process, so it is never used
+        if _parse_pool is None or _parse_pool_pid != os.getpid():
+            # spawn rather than fork: the web server is multi-threaded
+            _parse_pool = ProcessPoolExecutor(max_workers=MAX_PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _parse_pool_pid = os.getpid()
+        return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None and _parse_pool_pid == os.getpid():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_in_parse_pool(fn, jobs, description):
+    """
+    Runs fn(*args) for every args tuple in jobs on the parse pool.
+    Returns one result or exception per job, in order, or None if the pool itself is
+    unusable (callers then do the work serially). fn must be a module-level function.
+    """
+    try:
+        futures = [get_parse_pool().submit(fn, *args) for args in jobs]
+    except (BrokenProcessPool, RuntimeError, OSError) as e:
+        logger.warning(f"Parse pool unavailable, parsing {description} serially: {e}")
+        shutdown_parse_pool()
+        return None
+
+    results = []
+    for future in futures:
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            logger.warning(f"Parse pool broke while parsing {description}, parsing serially")
+            shutdown_parse_pool()
+            return None
+        results.append(error if error is not None else future.result())
+    return results
+
+
+def parse_workbook(file_path, filename, parallel=True):
+    """
+    Reads every sheet of a workbook with header detection on each (CSV files count as one sheet).
+    Sheets are parsed concurrently in the shared process pool, so wall-clock time follows the
+    largest sheet rather than the sum. Returns {sheet_name: DataFrame} in workbook order with
+    pandas column names; sheets that fail to parse are logged and left out.
+    Returns None if the workbook cannot be opened at all.
+    """
+    try:
+        sheet_names = list_sheets(file_path, filename)
+    except Exception as e:
+        logger.error(f"Error parsing file {filename}: {e}")
+        return None
+
+    results = None
+    if parallel and len(sheet_names) > 1 and MAX_PARSE_WORKERS > 1:
+        results = run_in_parse_pool(read_sheet, [(file_path, filename, name) for name in sheet_names], filename)
+
+    if results is None:
+        results = []
+        for name in sheet_names:
+            try:
+                results.append(read_sheet(file_path, filename, name))
+            except Exception as e:
+                results.append(e)
+
+    sheets = {}
+    for name, result in zip(sheet_names, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error parsing sheet {name} of {filename}: {result}")
+        elif result is not None:
+            sheets[name] = result
+    return sheets
+
+
+def sheet_cache_path(file_path):
+    content_hash = file_content_hash(file_path)
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), SHEET_CACHE_DIR, f"{content_hash}-v{PARSER_VERSION}.pkl")
+
+
+def write_sheet_cache(file_path, filename, parallel=True):
+    """
+    Parses a workbook and stores the parsed sheets as a sidecar file, replacing any
+    sidecar written by another parser version. Returns the sheets like parse_workbook.
+    """
+    sheets = parse_workbook(file_path, filename, parallel=parallel)
+    if sheets is None:
+        return None
+
+    path = sheet_cache_path(file_path)
+    content_hash = os.path.basename(path).split('-v')[0]
+    write_sidecar(path, sheets, f"{content_hash}-v*.pkl")
+    return sheets
+
+
+def load_sheets(file_path, filename, parallel=True):
+    """
+    parse_workbook served from the file's sidecar. The workbook itself is only parsed
+    (and the sidecar written) when there is no sidecar for this content and parser version.
+    """
+    sheets = read_sidecar(sheet_cache_path(file_path))
+    if sheets is not None:
+        return sheets
+    return write_sheet_cache(file_path, filename, parallel=parallel)
+
+
+def ensure_sheet_cache(file_path, filename):
+    """Upload-time conversion: writes the sidecar unless it already exists. Returns True if one exists."""
+    if os.path.exists(sheet_cache_path(file_path)):
+        return True
+    return write_sheet_cache(file_path, filename) is not None
+
+
+def remove_sheet_cache(file_path):
+    """Removes the file's sidecar and everything derived from it (e.g. its text_search cell index)."""
+    try:
+        path = sheet_cache_path(file_path)
+    except OSError:
+        return
+    content_hash = os.path.basename(path).split('-v')[0]
+    for cached in glob.glob(os.path.join(os.path.dirname(path), f"{content_hash}-*")):
+        try:
+            os.remove(cached)
+        except OSError:
+            pass
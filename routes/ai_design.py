@@ -2,8 +2,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from extensions import db
 from models import Project, ProjectFile, User
+from pdf_text_cache import load_pdf_text
 import os
-import PyPDF2
 import threading
 from datetime import datetime
 
@@ -36,17 +36,9 @@ def get_grok_client():
         return None
 
 def extract_text_from_pdf(file_path, max_pages=10):
-    """Extract text from PDF file for analysis"""
+    """Extract text from PDF file for analysis (from the shared per-page text cache)"""
     try:
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            num_pages = min(len(pdf_reader.pages), max_pages)
-            
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
-        
+        text = load_pdf_text(file_path).text(max_pages=max_pages)
         return text[:10000]  # Limit to 10k characters
     except Exception as e:
         print(f"Error extracting PDF text: {e}")
@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
-from extensions import db
+from extensions import db, price_index_cache, indexing_jobs
+from pdf_text_cache import remove_pdf_text_cache
+from upload_store import storing_upload, upload_lock
 from models import Project, ProjectFile, User
 import os
-from datetime import datetime
 
 projects_no_auth_bp = Blueprint('projects_no_auth', __name__)
 
@@ -139,32 +140,38 @@ def upload_file(project_id):
         
         # Secure filename
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        unique_filename = f"{timestamp}_{filename}"
-        
-        # Save file
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
-        
-        # Get file type
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        file_type = 'pdf' if file_ext == 'pdf' else 'excel'
-        
-        # Create file record
-        project_file = ProjectFile(
-            name=filename,
-            file_type=file_type,
-            file_path=unique_filename,
-            file_size=os.path.getsize(file_path),
-            project_id=project_id
-        )
         
-        db.session.add(project_file)
-        db.session.commit()
+        # Save file, once per content: re-uploading the same catalog (into this or another
+        # project) costs no extra disk and shares its sidecars and indexes. The stored file stays
+        # locked until its record is committed, so deleting another project can't remove it meanwhile
+        with storing_upload(file, current_app.config['UPLOAD_FOLDER'], filename) as (stored_name, file_size, _):
+            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], stored_name)
+            
+            # Get file type
+            file_ext = filename.rsplit('.', 1)[1].lower()
+            file_type = 'pdf' if file_ext == 'pdf' else 'excel'
+            
+            # Create file record
+            project_file = ProjectFile(
+                name=filename,
+                file_type=file_type,
+                file_path=stored_name,
+                file_size=file_size,
+                project_id=project_id
+            )
+            
+            db.session.add(project_file)
+            db.session.commit()
+        
+        # Parse, classify and index the file in the background (price books become a
+        # sheet sidecar plus their own index segment), so the first question is served
+        # from the prebuilt index; progress is reported by the files/status endpoint
+        index_status = indexing_jobs.submit(file_path, filename)
         
         return jsonify({
             'message': 'File uploaded successfully',
-            'file': project_file.to_dict()
+            'file': project_file.to_dict(),
+            'index_status': index_status['status']
         }), 201
         
     except Exception as e:
@@ -172,6 +179,37 @@ def upload_file(project_id):
         print(f"Error uploading file: {str(e)}")
         return jsonify({'error': f'Failed to upload file: {str(e)}'}), 500
 
+@projects_no_auth_bp.route('/<int:project_id>/files/status', methods=['GET'])
+def get_files_status(project_id):
+    """Get the background indexing status of a project's files without authentication"""
+    try:
+        user = get_or_create_default_user()
+        if not user:
+            return jsonify({'error': 'Could not create default user'}), 500
+        
+        project = Project.query.filter_by(id=project_id, user_id=user.id).first()
+        
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        # 'indexing', 'ready' or 'failed'; 'not_indexed' files (e.g. uploaded before a restart)
+        # are indexed on first use
+        files = []
+        for file in project.files:
+            job = indexing_jobs.status(os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)) or {'status': 'not_indexed'}
+            files.append({
+                **file.to_dict(),
+                'index_status': job['status'],
+                'detected_type': job.get('file_type'),
+                'index_error': job.get('error')
+            })
+        
+        return jsonify({'files': files}), 200
+        
+    except Exception as e:
+        print(f"Error getting file status: {str(e)}")
+        return jsonify({'error': f'Failed to get file status: {str(e)}'}), 500
+
 @projects_no_auth_bp.route('/<int:project_id>', methods=['DELETE'])
 def delete_project(project_id):
     """Delete a project without authentication"""
@@ -185,11 +223,20 @@ def delete_project(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        # Delete associated files
+        # Delete associated files (uploads are shared by content, so only those no other
+        # project references)
         for file in project.files:
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # Checked and removed under the upload's lock, so a concurrent upload of the same
+            # content either is counted as a reference or stores the file again afterwards
+            with upload_lock(file.file_path):
+                if ProjectFile.query.filter(ProjectFile.file_path == file.file_path, ProjectFile.project_id != project.id).count():
+                    continue
+                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
+                if os.path.exists(file_path):
+                    indexing_jobs.discard(file_path)
+                    price_index_cache.drop_file(file_path)
+                    remove_pdf_text_cache(file_path)
+                    os.remove(file_path)
         
         db.session.delete(project)
         db.session.commit()
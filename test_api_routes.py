@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Tests for the analysis API routes, through the Flask test client
+"""
+
+import io
+import os
+import csv
+import tempfile
+import threading
+from contextlib import contextmanager
+from unittest import mock
+
+from openpyxl import Workbook
+
+# In memory, so the tests never touch the app's database (read when the app is imported)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+import indexing_jobs as indexing_jobs_module
+import pdf_drawing_analyzer
+from app import app
+from extensions import db, indexing_jobs, price_index_cache
+from models import Project, User
+from price_index import DRAWING, PriceIndexCache
+from test_pdf_text_cache import write_pdf
+from test_price_index import PRICE_BOOK_CSV, write_price_book
+
+
+@contextmanager
+def upload_folder():
+    """The app with its upload folder pointed at a fresh temporary directory"""
+    original = app.config['UPLOAD_FOLDER']
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['UPLOAD_FOLDER'] = tmp
+        try:
+            yield tmp, app.test_client()
+        finally:
+            app.config['UPLOAD_FOLDER'] = original
+            pdf_drawing_analyzer._analyses.clear()
+            price_index_cache._recent.clear()  # its manifests would recreate the removed folder
+
+
+def test_drawing_analysis_only_for_uploads():
+    with upload_folder() as (uploads, client), tempfile.TemporaryDirectory() as elsewhere:
+        drawing = write_pdf(uploads, [['KITCHEN', 'W3030 BUTT', '31 1/2"']], 'Kitchen.pdf')
+        response = client.post('/api/analyze/drawing', json={'file_path': drawing, 'question': 'Where is W3030 BUTT?'})
+        assert response.status_code == 200 and response.json['analysis']['sku_counts'] == {'W3030 BUTT': 1}
+        price_index_cache.write_manifests()
+        assert [(entry['file'], entry['kind']) for entry in PriceIndexCache.read_manifest(uploads)] == [('Kitchen.pdf', DRAWING)]
+
+        # Files outside the upload folder are refused before anything is written next to them
+        outside = write_pdf(elsewhere, [['KITCHEN', 'W3030 BUTT']], 'Kitchen.pdf')
+        for file_path in (outside, os.path.join(uploads, os.path.relpath(outside, uploads))):
+            response = client.post('/api/analyze/drawing', json={'file_path': file_path})
+            assert response.status_code == 403 and 'error' in response.json
+        os.symlink(outside, os.path.join(uploads, 'Linked.pdf'))
+        assert client.post('/api/analyze/drawing', json={'file_path': os.path.join(uploads, 'Linked.pdf')}).status_code == 403
+        assert os.listdir(elsewhere) == ['Kitchen.pdf']
+
+
+def workbook_bytes():
+    workbook = Workbook()
+    for row in csv.reader(io.StringIO(PRICE_BOOK_CSV)):
+        workbook.active.append(row)
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def logged_in_project(client):
+    """A new user's project, with the test client logged in as that user"""
+    with app.app_context():
+        user = User(name='Route Tests', email=f'routes-{os.urandom(4).hex()}@example.com', password='unused')
+        db.session.add(user)
+        db.session.flush()
+        project = Project(name='Kitchen', user_id=user.id)
+        db.session.add(project)
+        db.session.commit()
+        user_id, project_id = user.id, project.id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return project_id
+
+
+def test_files_status_transitions():
+    with upload_folder() as (uploads, client):
+        project_id = logged_in_project(client)
+        release = threading.Event()
+        classify_file = indexing_jobs_module.classify_file
+
+        def slow_classify(file_path):
+            release.wait(10)
+            return classify_file(file_path)
+
+        def upload(content, filename):
+            response = client.post(f'/api/projects/{project_id}/upload', content_type='multipart/form-data',
+                                   data={'file': (io.BytesIO(content), filename)})
+            assert response.status_code == 201
+            return response.json
+
+        def statuses():
+            response = client.get(f'/api/projects/{project_id}/files/status')
+            assert response.status_code == 200
+            return {file['name']: (file['index_status'], file['detected_type']) for file in response.json['files']}
+
+        with mock.patch.object(indexing_jobs_module, 'classify_file', slow_classify):
+            assert upload(workbook_bytes(), 'Catalog.xlsx')['index_status'] == 'indexing'
+            upload(b'not a workbook', 'Broken.xlsx')
+            assert statuses() == {'Catalog.xlsx': ('indexing', None), 'Broken.xlsx': ('indexing', None)}
+            release.set()
+            indexing_jobs.wait_for([os.path.join(uploads, name) for name in os.listdir(uploads) if not name.startswith('.')])
+
+        files = {file['name']: file for file in client.get(f'/api/projects/{project_id}/files/status').json['files']}
+        assert (files['Catalog.xlsx']['index_status'], files['Catalog.xlsx']['detected_type']) == ('ready', 'pricing_sheet')
+        assert files['Broken.xlsx']['index_status'] == 'failed' and files['Broken.xlsx']['index_error'] == 'No readable sheets in price book'
+
+        # Files with no job (e.g. uploaded before the status files were kept) are indexed on first use
+        for name in os.listdir(uploads):
+            if not name.startswith('.'):
+                indexing_jobs.discard(os.path.join(uploads, name))
+        assert set(statuses().values()) == {('not_indexed', None)}
+        assert client.get('/api/projects/999999/files/status').status_code == 404
+
+
+def test_quote_and_cache_stats():
+    with upload_folder() as (uploads, client):
+        write_price_book(uploads)
+        file_ids = [{'name': 'SKU Pricing.csv'}]
+        response = client.post('/api/projects/quote', json={'file_ids': file_ids, 'lines': [
+            {'sku': 'W3030', 'material': 'Prime Maple', 'qty': 2},
+            {'sku': 'B24', 'qty': -3},
+            {'sku': 'Z999'}
+        ]})
+        assert response.status_code == 200
+        quote = response.json
+        assert set(quote) == {'success', 'lines', 'misses', 'totals'} and quote['success'] is True
+        assert quote['lines'][0] == {'line': 1, 'sku': 'W3030', 'material': 'PRIME MAPLE / PRIME PAINTED / PRIME DURAFORM', 'qty': 2.0, 'unit_price': 980.0,
+                                     'extended_price': 1960.0, 'source': 'SKU Pricing.csv > Row 1', 'status': 'ok'}
+        assert [(line['line'], line['status']) for line in quote['misses']] == [(2, 'invalid_qty'), (3, 'sku_not_found')]
+        assert quote['totals'] == {'lines': 3, 'priced_lines': 1, 'missing_lines': 2, 'quantity': 2.0, 'subtotal': 1960.0}
+
+        # Bad requests and failures are JSON errors
+        assert client.post('/api/projects/quote', json={'file_ids': file_ids}).status_code == 400
+        assert client.post('/api/projects/quote', json={'file_ids': file_ids, 'lines': ['B24']}).status_code == 400
+        with mock.patch.object(app_module, 'quote_lines', side_effect=ValueError('boom')):
+            response = client.post('/api/projects/quote', json={'file_ids': file_ids, 'lines': [{'sku': 'B24'}]})
+        assert response.status_code == 500 and 'boom' in response.json['error']
+
+        response = client.get('/api/analyze/cache-stats')
+        assert response.status_code == 200
+        stats = response.json
+        assert set(stats) == {'success', 'answers', 'price_indexes', 'warm_start', 'data_store'}
+        assert stats['price_indexes']['entries'] >= 1 and stats['warm_start']['status'] in ('idle', 'warming', 'done')
+        assert {'hits', 'misses'} <= set(stats['answers'])
+
+
+if __name__ == '__main__':
+    test_drawing_analysis_only_for_uploads()
+    test_files_status_transitions()
+    test_quote_and_cache_stats()
+    print("✅ API route tests passed")
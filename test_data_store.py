@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for the managed, project-scoped data store
+"""
+
+import threading
+
+import pandas as pd
+
+from data_store import DEFAULT_NAMESPACE, DataStore
+
+
+def make_entry(rows, code='W3030'):
+    df = pd.DataFrame({'CODE': [code] * rows, 'PRICE': range(rows)})
+    return {
+        'df': df,
+        'original_cols': df.columns.tolist(),
+        'content_hash': f'{code}-{rows}',
+        'code_index': df.groupby('CODE', sort=False).indices
+    }
+
+
+def test_data_store_namespaces():
+    store = DataStore()
+    store.put('1', 'SKU Pricing.csv', make_entry(3))
+    store.put('2', 'SKU Pricing.csv', make_entry(5, 'B24'))
+
+    assert list(store.files('1')) == ['SKU Pricing.csv']
+    assert store.get('2', 'SKU Pricing.csv')['df']['CODE'].iloc[0] == 'B24'
+    assert store.files(DEFAULT_NAMESPACE) == {}
+    assert DataStore.namespace_for(None) == DEFAULT_NAMESPACE and DataStore.namespace_for(7) == '7'
+
+    stats = store.stats()
+    assert stats['entries'] == 2 and stats['namespaces']['1']['files'] == 1
+    assert stats['bytes'] == sum(ns['bytes'] for ns in stats['namespaces'].values()) > 0
+
+    store.clear('1')
+    assert store.files('1') == {} and store.stats()['entries'] == 1
+
+
+def test_data_store_evicts_least_recently_used():
+    entry_bytes = DataStore().put('1', 'a.csv', make_entry(100))['nbytes']
+    store = DataStore(max_bytes=entry_bytes * 2)
+    store.put('1', 'a.csv', make_entry(100))
+    store.put('1', 'b.csv', make_entry(100))
+    store.files('1')            # uses a.csv and b.csv
+    store.get('1', 'a.csv')     # a.csv is now the most recently used
+    store.put('2', 'c.csv', make_entry(100))
+
+    assert list(store.files('1')) == ['a.csv']
+    assert store.stats()['evictions'] == 1
+    assert store.stats()['bytes'] <= store.max_bytes
+
+    # Replacing an entry does not double count it
+    store.put('2', 'c.csv', make_entry(100))
+    assert store.stats()['bytes'] == entry_bytes * 2
+
+
+def test_data_store_code_lookup():
+    store = DataStore()
+    df = pd.DataFrame({'CODE': ['B24', 'W3030', 'B24'], 'PRICE': [1, 2, 3]})
+    store.put('1', 'a.csv', {'df': df, 'code_index': df.groupby('CODE', sort=False).indices})
+    store.put('1', 'b.csv', make_entry(2, 'B24'))
+    store.put('2', 'c.csv', make_entry(2, 'B24'))
+
+    matches = store.lookup('1', 'B24')
+    assert [(filename, positions.tolist()) for filename, _, positions in matches] == [('a.csv', [0, 2]), ('b.csv', [0, 1])]
+    assert matches[0][1]['df'].iloc[matches[0][2][0]]['PRICE'] == 1
+    assert store.lookup('1', 'ZZ99') == [] and store.lookup('3', 'B24') == []
+
+    # A request's selection only sees its own files, and fingerprints only them
+    selected = store.snapshot('1').select(['b.csv', 'missing.csv'])
+    assert list(selected.files) == ['b.csv'] and [filename for filename, _, _ in selected.lookup('B24')] == ['b.csv']
+    assert selected.fingerprint == (('b.csv', 'B24-2'),) and selected.lookup('W3030') == []
+
+    # Replaced and cleared files leave the index
+    store.put('1', 'a.csv', make_entry(1, 'W3030'))
+    assert [filename for filename, _, _ in store.lookup('1', 'B24')] == ['b.csv']
+    store.clear('1')
+    assert store.lookup('1', 'W3030') == [] and len(store.lookup('2', 'B24')) == 1
+
+
+def test_data_store_snapshots_are_isolated_from_writers():
+    store = DataStore()
+    store.put('1', 'a.csv', make_entry(2, 'B24'))
+    snapshot = store.snapshot('1')
+
+    # Writers publish new snapshots; the one a reader holds never changes
+    store.put('1', 'b.csv', make_entry(3, 'B24'))
+    store.put('1', 'a.csv', make_entry(1, 'W3030'))
+    store.clear()
+    assert list(snapshot.files) == ['a.csv'] and len(snapshot.lookup('B24')) == 1
+    assert snapshot.fingerprint == (('a.csv', 'B24-2'),)
+    assert len(store.snapshot('1')) == 0 and store.stats()['entries'] == 0
+
+    # Readers iterating snapshots while a writer re-indexes always see complete ones
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            current = store.snapshot('1')
+            matches = current.lookup('B24')
+            if [filename for filename, _, _ in matches] != [filename for filename in current.files if filename.startswith('b')]:
+                errors.append(current)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for i in range(200):
+        store.put('1', f'b{i % 5}.csv', make_entry(i % 7 + 1, 'B24'))
+        store.put('1', f'w{i % 3}.csv', make_entry(2))
+        if i % 50 == 49:
+            store.clear('1')
+    done.set()
+    for thread in readers:
+        thread.join()
+    assert not errors
+
+
+if __name__ == '__main__':
+    test_data_store_namespaces()
+    test_data_store_evicts_least_recently_used()
+    test_data_store_code_lookup()
+    test_data_store_snapshots_are_isolated_from_writers()
+    print("✅ Data store tests passed")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the background upload indexing jobs
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+from indexing_jobs import IndexingJobs, classify_file
+from price_index import PriceIndexCache
+from test_price_index import write_price_book
+
+
+def test_indexing_job_builds_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        cache = PriceIndexCache(snapshots=False)
+        jobs = IndexingJobs(cache)
+
+        assert jobs.status(path) is None
+        assert jobs.submit(path, 'SKU Pricing.csv')['status'] == 'indexing'
+        jobs.wait_for([path])
+
+        status = jobs.status(path)
+        assert status['status'] == 'ready' and status['file_type'] == 'pricing_sheet'
+        assert cache.stats()['entries'] == 1
+
+        # Questions are served from the prebuilt index
+        assert cache.view([(path, 'SKU Pricing.csv')]).find_prices('B24')[0]['price'] == 612.5
+        assert cache.stats()['hits'] == 1
+
+        jobs.discard(path)
+        assert jobs.status(path) is None
+
+
+def test_indexing_job_failure_is_reported():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp, 'broken.xlsx', 'not a workbook')
+        jobs = IndexingJobs(PriceIndexCache(snapshots=False))
+        jobs.submit(path, 'broken.xlsx')
+        jobs.wait_for([path])
+
+        status = jobs.status(path)
+        assert status['status'] == 'failed' and status['error']
+        assert classify_file(os.path.join(tmp, 'notes.txt')) == {'file_type': 'unknown'}
+
+
+def write_status(path, record):
+    # atomically, like IndexingJobs._write_status, so a concurrent poll never reads a half-written file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(record, f)
+    os.replace(path + '.tmp', path)
+
+
+def test_indexing_status_shared_between_processes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        worker_a = IndexingJobs(PriceIndexCache(snapshots=False))
+        worker_b = IndexingJobs(PriceIndexCache(snapshots=False))
+
+        # B sees A's job through the status file next to the upload
+        worker_a.submit(path, 'SKU Pricing.csv')
+        worker_a.wait_for([path])
+        assert worker_b.status(path)['status'] == 'ready'
+
+        # A job still running in another (live) process is neither repeated nor reported missing
+        record = dict(worker_b.status(path), status='indexing', finished_at=None, queued_at=time.time(), pid=os.getppid())
+        write_status(worker_b.status_path(path), record)
+        assert worker_b.submit(path, 'SKU Pricing.csv')['status'] == 'indexing'
+        assert worker_b.status(path)['status'] == 'indexing' and path not in worker_b._jobs
+
+        def finish():
+            time.sleep(0.5)
+            write_status(worker_b.status_path(path), dict(record, status='ready', finished_at=time.time()))
+        threading.Thread(target=finish).start()
+        started = time.time()
+        worker_b.wait_for([path], timeout=10)
+        assert 0.4 < time.time() - started < 5 and worker_b.status(path)['status'] == 'ready'
+
+        # A job whose process died is reported as failed instead of indexing forever
+        write_status(worker_b.status_path(path), dict(record, pid=2 ** 22 + 1))
+        assert worker_b.status(path)['status'] == 'failed'
+
+        worker_a.discard(path)
+        assert worker_b.status(path) is None
+
+
+if __name__ == '__main__':
+    test_indexing_job_builds_index()
+    test_indexing_job_failure_is_reported()
+    test_indexing_status_shared_between_processes()
+    print("✅ Indexing job tests passed")
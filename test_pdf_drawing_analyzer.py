@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for the engineering drawing analyzer
+"""
+
+import os
+import random
+import tempfile
+from unittest import mock
+
+import price_parser
+import pdf_text_cache
+import pdf_drawing_analyzer
+from pdf_drawing_analyzer import (DrawingElement, DrawingElementStore, PDFDrawingAnalyzer, answer_drawing_question,
+                                  classify_page_blocks, drawing_analysis_path, extract_and_classify_pages,
+                                  load_drawing_analysis)
+from pdf_text_cache import extract_pdf_text, load_pdf_text, remove_pdf_text_cache
+from test_pdf_text_cache import write_pdf
+
+
+def drawing(elements):
+    analyzer = PDFDrawingAnalyzer('unused.pdf')
+    analyzer.store = DrawingElementStore.from_elements(elements)
+    analyzer._collect_elements()
+    return analyzer
+
+
+def random_drawing(seed, pages=3, per_page=60):
+    rng = random.Random(seed)
+    elements = []
+    for i in range(pages * per_page):
+        # Pages interleaved, so grouping by page doesn't rely on element order
+        page = rng.randint(1, pages)
+        x, y = rng.uniform(-50, 800), rng.uniform(0, 600)
+        kind = rng.choice(['sku', 'sku', 'dimension', 'room', 'unknown'])
+        elements.append(DrawingElement(f'{kind}-{page}-{i}', (x, y, x + rng.uniform(0, 60), y + 10), page, kind))
+    return drawing(elements)
+
+
+def brute_force_relationships(analyzer, sku):
+    """The original all-pairs relationships, restricted to the SKU's page"""
+    dimensions = [d for d in analyzer.dimensions if d.page == sku.page]
+    rooms = [r for r in analyzer.rooms if r.page == sku.page]
+    skus = [s for s in analyzer.skus if s.page == sku.page]
+    nearby_dims = [d for d in dimensions if sku.is_near(d, threshold=150)]
+    room = "Unknown"
+    if rooms:
+        nearest_room = min(rooms, key=lambda r: sku.distance_to(r))
+        if sku.distance_to(nearest_room) < 300:
+            room = nearest_room.text
+    adjacent = [s.text for s in skus if s.text != sku.text and sku.is_near(s, threshold=120)][:3]
+    return nearby_dims, room, adjacent
+
+
+def test_relationships_match_all_pairs_on_same_page():
+    for seed in range(20):
+        analyzer = random_drawing(seed)
+        analyzer._build_relationships()
+        for sku in analyzer.skus:
+            nearby_dims, room, adjacent = brute_force_relationships(analyzer, sku)
+            assert ([d.text for d in sku.nearby_dimensions], sku.room, sku.adjacent_to) == ([d.text for d in nearby_dims], room, adjacent)
+
+    # Elements on other pages are never related
+    analyzer = drawing([DrawingElement('W3030', (10, 10, 40, 20), 1, 'sku'), DrawingElement('B24', (10, 10, 40, 20), 2, 'sku'),
+                        DrawingElement('KITCHEN', (20, 40, 60, 50), 2, 'room')])
+    analyzer._build_relationships()
+    assert [(sku.room, sku.adjacent_to) for sku in analyzer.skus] == [('Unknown', []), ('KITCHEN', [])]
+
+
+def test_relationships_only_measure_nearby_elements():
+    # A large, evenly filled page: each SKU is measured against its grid neighbourhood, not the whole page
+    elements = [DrawingElement(f'{kind}-{x}-{y}', (x * 80, y * 80, x * 80 + 30, y * 80 + 10), 1, kind)
+                for x in range(60) for y in range(60) for kind in ['sku', 'dimension', 'room'][(x + y) % 3:][:1]]
+    analyzer = drawing(elements)
+    measured = []
+    distances = DrawingElementStore.distances
+
+    def counted(store, rows, columns):
+        measured.append(len(rows) * len(columns))
+        return distances(store, rows, columns)
+
+    with mock.patch.object(DrawingElementStore, 'distances', counted):
+        analyzer._build_relationships()
+    assert sum(measured) < len(analyzer.skus) * 100
+    for sku in analyzer.skus[::50]:
+        nearby_dims, room, adjacent = brute_force_relationships(analyzer, sku)
+        assert ([d.text for d in sku.nearby_dimensions], sku.room, sku.adjacent_to) == ([d.text for d in nearby_dims], room, adjacent)
+
+
+
+def test_classifier_keeps_matched_codes():
+    analyzer = PDFDrawingAnalyzer('unused.pdf')
+    texts = ['w3030 butt', '31 1/2"', "2'", 'ELEVATION 2', 'B24 L 36"', 'NOTE', 'KITCHEN 12"']
+    analyzer.store = DrawingElementStore(texts, [1] * len(texts), [(0, 0, 10, 10)] * len(texts))
+    analyzer._classify_elements()
+    analyzer._collect_elements()
+    elements = {e.text: e for e in analyzer.skus + analyzer.dimensions + analyzer.rooms}
+    assert [(e.element_type, e.code, e.dimension) for e in elements.values()] == [
+        ('sku', 'W3030 BUTT', None), ('sku', 'B24 L', None), ('dimension', '31 1/2"', 31.5), ('dimension', "2'", 24),
+        ('dimension', '12"', 12), ('room', 'ELEVATION 2', None)]
+    assert 'NOTE' not in elements
+
+    analyzer._count_skus()
+    assert dict(analyzer.sku_counts) == {'W3030 BUTT': 1, 'B24 L': 1}
+    assert analyzer._format_sku_detail(analyzer.skus[0])['sku'] == 'W3030 BUTT'
+
+
+def test_parallel_analysis_matches_serial():
+    rng = random.Random(7)
+    pages = [[rng.choice(['W3030', 'B24 BUTT', '31 1/2"', 'KITCHEN', 'ELEVATION 2', 'SB36', 'NOTE']) for _ in range(6)]
+             for _ in range(11)]
+    default_workers = price_parser.MAX_PARSE_WORKERS
+    price_parser.configure_parse_pool(2)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_pdf(tmp, pages)
+            parallel = PDFDrawingAnalyzer(path).analyze()
+            assert [len(blocks) for blocks in load_pdf_text(path).blocks] == [len(blocks) for blocks in extract_pdf_text(path).blocks]
+            assert load_pdf_text(path).pages == extract_pdf_text(path).pages
+
+            remove_pdf_text_cache(path)
+            serial = PDFDrawingAnalyzer(path, parallel=False).analyze()
+            assert parallel == serial and parallel['total_pages'] == 11 and parallel['skus_found'] > 0
+            assert {detail['page'] for detail in parallel['sku_details']} == set(range(1, 12))
+
+            # Indexing jobs read the text for the line index before analyzing a drawing; the workers
+            # then classify ranges of the cached blocks instead of falling back to the serial path
+            remove_pdf_text_cache(path)
+            load_pdf_text(path)
+            with mock.patch.object(price_parser, 'run_in_parse_pool', wraps=price_parser.run_in_parse_pool) as pool:
+                assert PDFDrawingAnalyzer(path).analyze() == serial
+            assert [call.args[0] for call in pool.call_args_list] == [classify_page_blocks]
+            assert [job[2] for job in pool.call_args.args[1]] == [1, 4, 7, 10]
+
+            remove_pdf_text_cache(path)
+            with mock.patch.object(price_parser, 'run_in_parse_pool', wraps=price_parser.run_in_parse_pool) as pool:
+                PDFDrawingAnalyzer(path).analyze()
+            assert [call.args[0] for call in pool.call_args_list] == [extract_and_classify_pages]
+    finally:
+        price_parser.configure_parse_pool(default_workers)
+        price_parser.shutdown_parse_pool()
+        pdf_text_cache._documents.clear()
+
+
+def test_drawing_analysis_persisted_by_content():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_pdf(tmp, [['KITCHEN', 'W3030 BUTT', '31 1/2"'], ['ELEVATION 2', 'B24', 'W3030 BUTT']])
+        report = load_drawing_analysis(path).report
+        answer = answer_drawing_question(path, 'Where is W3030 BUTT?')
+        assert report['sku_counts'] == {'W3030 BUTT': 2, 'B24': 1} and 'KITCHEN' in answer
+
+        # Follow-up questions, even after a restart, reuse the analysis instead of reading the PDF
+        pdf_drawing_analyzer._analyses.clear()
+        with mock.patch.object(PDFDrawingAnalyzer, 'analyze', side_effect=AssertionError('re-analyzed')):
+            session = load_drawing_analysis(path)
+            assert session.report == report and load_drawing_analysis(path) is session
+            assert session.answer_question('Where is W3030 BUTT?') == answer
+            assert session.sku_locations['W3030 BUTT'][0].nearby_dimensions[0].text == '31 1/2"'
+        assert len(pdf_drawing_analyzer._analysis_locks) == 0
+
+        remove_pdf_text_cache(path)
+        assert not os.path.exists(drawing_analysis_path(path))
+        pdf_drawing_analyzer._analyses.clear()
+
+
+if __name__ == '__main__':
+    test_relationships_match_all_pairs_on_same_page()
+    test_relationships_only_measure_nearby_elements()
+    test_classifier_keeps_matched_codes()
+    test_parallel_analysis_matches_serial()
+    test_drawing_analysis_persisted_by_content()
+    print("✅ Drawing analyzer tests passed")
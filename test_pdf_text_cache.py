@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared per-page PDF text cache
+"""
+
+import os
+import time
+import tempfile
+import threading
+from unittest import mock
+
+import fitz
+
+import indexing_jobs
+import pdf_text_cache
+from indexing_jobs import classify_file
+from pdf_drawing_analyzer import PDFDrawingAnalyzer
+from pdf_text_cache import load_pdf_text, pdf_text_cache_path, remove_pdf_text_cache
+
+
+def write_pdf(directory, pages, name='drawing.pdf'):
+    path = os.path.join(directory, name)
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        for i, line in enumerate(lines):
+            page.insert_text((72, 72 + 40 * i), line)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_pdf_text_extracted_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_pdf(tmp, [['KITCHEN LAYOUT', 'W3030'], ['ELEVATION 2', 'B24 BUTT'], ['PRICE LIST']])
+
+        with mock.patch.object(pdf_text_cache, 'extract_pdf_text', wraps=pdf_text_cache.extract_pdf_text) as extract:
+            pdf_text = load_pdf_text(path)
+            assert len(pdf_text) == 3 and 'W3030' in pdf_text.pages[0]
+            assert pdf_text.text(max_pages=2).count('\n') >= 4 and 'PRICE LIST' not in pdf_text.text(max_pages=2)
+            assert any('B24 BUTT' in block[4] for block in pdf_text.blocks[1])
+
+            # Every consumer reads the same extraction, from memory or the sidecar
+            classify_file(path)
+            analysis = PDFDrawingAnalyzer(path).analyze()
+            assert analysis['total_pages'] == 3
+            pdf_text_cache._documents.clear()
+            assert load_pdf_text(path).pages == pdf_text.pages
+            assert extract.call_count == 1
+
+        assert os.path.exists(pdf_text_cache_path(path))
+        remove_pdf_text_cache(path)
+        assert not os.path.exists(pdf_text_cache_path(path))
+
+
+def test_classify_file_reads_first_pages_only():
+    with tempfile.TemporaryDirectory() as tmp:
+        drawing = ['KITCHEN LAYOUT', 'ELEVATION 1', 'SCALE: 1/4"', 'W3030 B24 SB36 W1842 B15 W2430']
+        path = write_pdf(tmp, [drawing, ['NOTES']] + [['PRICE LIST', 'COST $', 'MATERIAL']] * 4)
+
+        # On a cold cache only the 2 classified pages are read, and nothing is cached
+        with mock.patch.object(indexing_jobs, 'extract_pdf_text', wraps=indexing_jobs.extract_pdf_text) as extract:
+            assert classify_file(path)['file_type'] == 'engineering_drawing'
+            assert [call.args for call in extract.call_args_list] == [(path, 0, 2)]
+            assert not os.path.exists(pdf_text_cache_path(path))
+
+            # Once the PDF has been read in full, its cached text is used
+            load_pdf_text(path)
+            assert classify_file(path)['file_type'] == 'engineering_drawing' and extract.call_count == 1
+        remove_pdf_text_cache(path)
+
+
+def test_concurrent_readers_extract_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_pdf(tmp, [['KITCHEN LAYOUT', 'W3030']])
+        extract = pdf_text_cache.extract_pdf_text
+
+        def slow_extract(file_path):
+            time.sleep(0.2)
+            return extract(file_path)
+
+        with mock.patch.object(pdf_text_cache, 'extract_pdf_text', side_effect=slow_extract) as patched, \
+                mock.patch.object(pdf_text_cache._documents, 'max_bytes', 0):
+            # Nothing fits in memory, so late readers rely on the sidecar written under the lock
+            def read(delay):
+                time.sleep(delay)
+                load_pdf_text(path)
+            threads = [threading.Thread(target=read, args=(i * 0.05,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert patched.call_count == 1
+        assert len(pdf_text_cache._extract_locks) == 0
+        remove_pdf_text_cache(path)
+
+    # Threads arriving while others still hold or wait for a path's lock share that lock
+    holding, overlaps = [], []
+
+    def hold(delay):
+        time.sleep(delay)
+        with pdf_text_cache._extract_locks.hold('drawing.pkl'):
+            holding.append(1)
+            overlaps.append(len(holding))
+            time.sleep(0.02)
+            holding.pop()
+    threads = [threading.Thread(target=hold, args=(i * 0.01,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlaps) == 1 and len(pdf_text_cache._extract_locks) == 0
+
+
+if __name__ == '__main__':
+    test_pdf_text_extracted_once()
+    test_classify_file_reads_first_pages_only()
+    test_concurrent_readers_extract_once()
+    print("✅ PDF text cache tests passed")
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Tests for price book parsing, indexing and the compiled index cache
+"""
+
+import os
+import json
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from openpyxl import Workbook
+
+from cache_utils import AnswerCache
+import pdf_drawing_analyzer
+from pdf_drawing_analyzer import PDFDrawingAnalyzer, drawing_analysis_path
+from price_index import DRAWING, PRICE_BOOK, CompactPriceIndex, MergedPriceIndex, PriceIndexCache, build_data_index, build_price_index, find_option_record, find_prices_for_sku, quote_lines
+import price_parser
+from price_parser import _read_excel_two_pass, _read_xlsx_single_pass, load_sheets, parse_data_file, parse_workbook, sheet_cache_path
+from test_pdf_text_cache import write_pdf
+
+PRICE_BOOK_CSV = """Price Book,,,
+SKU,763 Elite Cherry,543 Prime Maple,Base
+W3030,"$1,250.00",980,410
+B24,700,$612.50,30
+W 1842,"1,005",815,25000
+NOTE,call,for,pricing
+"""
+
+
+def write_price_book(directory, name='SKU Pricing.csv', content=PRICE_BOOK_CSV):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def test_build_data_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        df = parse_data_file(path, 'SKU Pricing.csv')
+        data_index = build_data_index({'book': df}, {'book': 'SKU Pricing.csv'})
+
+        assert set(data_index) == {'W3030', 'B24', 'W1842'}
+        assert data_index['W3030'][0]['source'] == 'SKU Pricing.csv > Row 1'
+
+        prices = find_prices_for_sku('w3030', data_index)
+        assert [p['price'] for p in prices] == [410.0, 980.0, 1250.0]
+        assert prices[0]['material'] == 'BASE / STANDARD'
+
+        # Out-of-range prices (30, 25000) are dropped
+        assert [p['price'] for p in find_prices_for_sku('B24', data_index)] == [612.5, 700.0]
+        assert [p['price'] for p in find_prices_for_sku('W1842', data_index)] == [815.0, 1005.0]
+
+
+def test_build_data_index_option_pricing():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp, 'Option Pricing.csv', "OPTION,DESCRIPTION,PRICING\nMI,Matching Interior,20% Over List Price\nFE12,Finished End,125\n")
+        df = parse_data_file(path, 'Option Pricing.csv')
+        data_index = build_data_index({'options': df}, {'options': 'Option Pricing.csv'})
+
+        assert data_index['MI'] == [{
+            'sku': 'MI',
+            'source': 'Option Pricing.csv > Row 1',
+            'option_pricing': '20% Over List Price'
+        }]
+        assert find_prices_for_sku('FE12', data_index)[0]['material'] == 'PRICING'
+
+
+def test_single_pass_xlsx_matches_pandas():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Price Book.xlsx')
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['Price Book 2024'])
+        ws.append([])
+        ws.append(['SKU', '763 Elite Cherry', None, 'Base'])
+        ws.append(['W3030', 1250.0, 'call', 410])
+        ws.append(['B24', 612.5])
+        ws.append([None, None, None, None, 'stray'])
+        wb.save(path)
+
+        df = _read_xlsx_single_pass(path)
+        pd.testing.assert_frame_equal(df, _read_excel_two_pass(path))
+        assert list(df.columns[:2]) == ['SKU', '763 Elite Cherry']
+        assert df['763 Elite Cherry'].tolist() == [1250, 612.5, '']
+
+        parsed = parse_data_file(path, 'Price Book.xlsx')
+        assert list(parsed.columns) == ['SKU', '763 Elite Cherry', '', 'Base', '']
+        assert parsed['SKU'].tolist() == ['W3030', 'B24', '']
+
+
+def test_sheet_cache_sidecar():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        cache = PriceIndexCache(snapshots=False)
+        assert cache.add_file(path, 'SKU Pricing.csv')
+        sidecar = sheet_cache_path(path)
+        assert os.path.exists(sidecar)
+
+        # Later reads come from the sidecar, not the original file
+        parse_workbook_impl = price_parser.parse_workbook
+        price_parser.parse_workbook = None
+        try:
+            sheets = load_sheets(path, 'SKU Pricing.csv')
+            assert PriceIndexCache(snapshots=False).get_index(path, 'SKU Pricing.csv').find_prices('B24')[0]['price'] == 612.5
+        finally:
+            price_parser.parse_workbook = parse_workbook_impl
+        pd.testing.assert_frame_equal(sheets['SKU Pricing'], parse_workbook(path, 'SKU Pricing.csv')['SKU Pricing'])
+
+        # A parser version bump regenerates the sidecar and removes the stale one
+        parser_version = price_parser.PARSER_VERSION
+        price_parser.PARSER_VERSION = parser_version + '-next'
+        try:
+            load_sheets(path, 'SKU Pricing.csv')
+            assert os.path.exists(sheet_cache_path(path)) and not os.path.exists(sidecar)
+        finally:
+            price_parser.PARSER_VERSION = parser_version
+
+        load_sheets(path, 'SKU Pricing.csv')
+        cache.drop_file(path)
+        assert not os.path.exists(sidecar)
+
+
+def test_multi_sheet_workbook_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Vendor Book.xlsx')
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Cabinets'
+        ws.append(['SKU', '543 Prime Maple', 'Base'])
+        ws.append(['W3030', 980, 410])
+        options = wb.create_sheet('Options')
+        options.append(['Construction Options'])
+        options.append(['OPTION', 'DESCRIPTION', 'PRICING'])
+        options.append(['MI', 'Matching Interior', '20% Over List Price'])
+        options.append(['FE12', 'Finished End', 125])
+        options.append(['W3030', 'Duplicate listing', 410])
+        wb.create_sheet('Notes')
+        wb.save(path)
+
+        sheets = parse_workbook(path, 'Vendor Book.xlsx', parallel=False)
+        assert list(sheets) == ['Cabinets', 'Options', 'Notes']
+        assert list(sheets['Options'].columns) == ['OPTION', 'DESCRIPTION', 'PRICING']
+        assert sheets['Notes'].empty
+
+        price_index = PriceIndexCache(snapshots=False).get_index(path, 'Vendor Book.xlsx')
+        assert price_index.find_prices('FE12')[0]['source'] == 'Vendor Book.xlsx > Options > Row 2'
+        assert price_index.option_record('MI')['source'] == 'Vendor Book.xlsx > Options > Row 1'
+        # Equal prices keep sheet order
+        assert [p['source'] for p in price_index.find_prices('W3030')] == [
+            'Vendor Book.xlsx > Cabinets > Row 1', 'Vendor Book.xlsx > Options > Row 3', 'Vendor Book.xlsx > Cabinets > Row 1']
+        assert price_index.price_table(['FE12'])['label'].tolist() == ['Vendor Book.xlsx > Options']
+
+
+def test_compact_index_matches_dict_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        book = parse_data_file(write_price_book(tmp), 'SKU Pricing.csv')
+        options = parse_data_file(write_price_book(tmp, 'Option Pricing.csv', "OPTION,PRICING\nMI,20% Over List Price\n"), 'Option Pricing.csv')
+
+        data_index = build_data_index({'book': book, 'options': options}, {'book': 'SKU Pricing.csv', 'options': 'Option Pricing.csv'})
+        merged = MergedPriceIndex([
+            CompactPriceIndex.from_frame(book, 'SKU Pricing.csv'),
+            CompactPriceIndex.from_frame(options, 'Option Pricing.csv')
+        ])
+
+        for sku in ['W3030', 'b24', 'W 1842', 'NOTE']:
+            assert find_prices_for_sku(sku, merged) == find_prices_for_sku(sku, data_index)
+        assert find_option_record('MI', merged) == find_option_record('MI', data_index)
+
+        relabeled = merged.segments[0].relabeled('Copy.csv')
+        assert relabeled.prices is merged.segments[0].prices
+        assert relabeled.find_prices('B24')[0]['source'] == 'Copy.csv > Row 2'
+
+
+def test_option_record_is_first_row_like_dict_index():
+    # Priced MI rows before, between and after option rows, over two sheets
+    sheets = [
+        pd.DataFrame([['MI', '', 120, 80], ['W3030', 400, 90, 60], ['MI', '20% Over List Price', 75, 95]],
+                     columns=['OPTION', 'PRICING', 'Elite Cherry', 'Base']),
+        pd.DataFrame([['MI', '15%', 300, None], ['MI', None, 55, 60], ['W3030', 'call', 70, None]],
+                     columns=['OPTION', 'PRICING', 'Elite Cherry', 'Base'])
+    ]
+    for frames in ([sheets[0], sheets[1]], [sheets[1], sheets[0]], [sheets[0].iloc[1:]], [sheets[1].iloc[1:]]):
+        data_index = build_data_index({i: df for i, df in enumerate(frames)}, {i: f'{i}.csv' for i in range(len(frames))})
+        merged = MergedPriceIndex([CompactPriceIndex.from_frame(df, f'{i}.csv') for i, df in enumerate(frames)])
+        for sku in ['MI', 'W3030']:
+            expected, record = find_option_record(sku, data_index), find_option_record(sku, merged)
+            assert (record['source'], record.get('option_pricing')) == (expected['source'], expected.get('option_pricing'))
+
+
+def test_price_index_cache_reuses_compiled_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        cache = PriceIndexCache()
+
+        first = cache.get_index(path, 'SKU Pricing.csv')
+        second = cache.get_index(path, 'SKU Pricing.csv')
+        assert first is second
+        assert cache.stats()['hits'] == 1
+
+        # Changed content gets a new key and is re-parsed
+        write_price_book(tmp, content=PRICE_BOOK_CSV.replace('410', '415'))
+        os.utime(path, ns=(0, 10 ** 18))
+        third = cache.get_index(path, 'SKU Pricing.csv')
+        assert third is not first
+        assert find_prices_for_sku('W3030', third)[0]['price'] == 415.0
+
+
+def test_price_index_cache_builds_missing_files_in_pool():
+    default_workers = price_parser.MAX_PARSE_WORKERS
+    price_parser.configure_parse_pool(2)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for n in range(3):
+                name = f'Catalog {n}.csv'
+                files.append((write_price_book(tmp, name, f"SKU,Base\nW30{n}0,{100 + n}\nB24,700\n"), name))
+            files.append((write_price_book(tmp, 'broken.xlsx', 'not a workbook'), 'broken.xlsx'))
+
+            cache = PriceIndexCache(snapshots=False)
+            indexes = cache.get_indexes(files)
+            assert indexes[-1] is None
+            assert [price_index.find_prices(f'W30{n}0')[0]['source'] for n, price_index in enumerate(indexes[:3])] == [
+                'Catalog 0.csv > Row 1', 'Catalog 1.csv > Row 1', 'Catalog 2.csv > Row 1']
+            assert cache.stats()['entries'] == 3
+
+            view = cache.view(files)
+            assert len(view.segments) == 3
+            assert [p['source'] for p in view.find_prices('B24')] == ['Catalog 0.csv > Row 2']
+            assert cache.stats()['hits'] == 3
+
+            # Built serially (a single miss, or no usable pool), a failing book is skipped the same way
+            def build(file_path, label, parallel=True):
+                if label == 'Catalog 1.csv':
+                    raise ValueError('unreadable')
+                return build_price_index(file_path, label, parallel)
+
+            cache = PriceIndexCache(snapshots=False)
+            with mock.patch('price_index.build_price_index', build), mock.patch('price_index.run_in_parse_pool', return_value=None):
+                assert [price_index is None for price_index in cache.get_indexes(files[:3])] == [False, True, False]
+                assert cache.view(files[1:2]).segments == []
+    finally:
+        price_parser.configure_parse_pool(default_workers)
+        price_parser.shutdown_parse_pool()
+
+
+def test_price_index_cache_respects_memory_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PriceIndexCache(max_bytes=1)
+        path = write_price_book(tmp)
+        assert cache.get_index(path, 'SKU Pricing.csv')
+        assert cache.stats()['entries'] == 0
+
+
+def test_price_index_snapshot_shared_by_cold_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        warm = PriceIndexCache()
+        expected = find_prices_for_sku('W3030', warm.get_index(path, 'SKU Pricing.csv'))
+
+        # A fresh process-level cache maps the snapshot instead of parsing the file
+        cold = PriceIndexCache()
+        snapshot = cold.get_index(path, 'SKU Pricing.csv')
+        assert isinstance(snapshot.prices, np.memmap)
+        assert find_prices_for_sku('W3030', snapshot) == expected
+
+        cold.drop_file(path)
+        assert not os.path.exists(cold.snapshot_path(path, cold.cache_key(path)))
+
+
+def test_price_index_segments_added_and_dropped():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PriceIndexCache()
+        book = write_price_book(tmp)
+        extra = write_price_book(tmp, 'Accessories.csv', "SKU,Base\nFE12,95\n")
+
+        assert cache.add_file(book, 'SKU Pricing.csv')
+        view = cache.view([(book, 'SKU Pricing.csv')])
+        assert 'FE12' not in view
+
+        # Adding a file only parses that file; the earlier segment is reused
+        assert cache.add_file(extra, 'Accessories.csv')
+        misses = cache.stats()['misses']
+        view = cache.view([(book, 'SKU Pricing.csv'), (extra, 'Accessories.csv')])
+        assert cache.stats()['misses'] == misses
+        assert find_prices_for_sku('FE12', view)[0]['price'] == 95.0
+
+        # Dropping a segment leaves existing views queryable
+        cache.drop_file(extra)
+        assert cache.stats()['entries'] == 1
+        assert find_prices_for_sku('FE12', view)[0]['price'] == 95.0
+
+
+def test_quote_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        view = PriceIndexCache().view([(write_price_book(tmp), 'SKU Pricing.csv')])
+        priced_lines, totals = quote_lines([
+            {'sku': 'w3030', 'material': 'Prime Maple', 'qty': 2},
+            {'sku': 'B24'},
+            {'sku': 'B24', 'material': 'walnut'},
+            {'sku': 'Z999', 'qty': 1},
+            {'sku': 'B24', 'qty': 'two'}
+        ], view)
+
+        assert [line['status'] for line in priced_lines] == ['ok', 'ok', 'material_not_found', 'sku_not_found', 'invalid_qty']
+        assert priced_lines[0]['unit_price'] == 980.0 and priced_lines[0]['extended_price'] == 1960.0
+        assert priced_lines[1]['unit_price'] == 612.5  # no material -> cheapest option
+        assert priced_lines[1]['source'] == 'SKU Pricing.csv > Row 2'
+        assert totals == {'lines': 5, 'priced_lines': 2, 'missing_lines': 3, 'quantity': 3.0, 'subtotal': 2572.5}
+
+        # Only finite quantities above 0 are priced, and the lines stay valid JSON
+        priced_lines, totals = quote_lines([{'sku': 'B24', 'qty': qty} for qty in (-3, 0, float('inf'), '-inf', 'nan', 0.5)], view)
+        assert [line['status'] for line in priced_lines] == ['invalid_qty'] * 5 + ['ok']
+        assert [line['qty'] for line in priced_lines] == [-3.0, 0.0, None, None, None, 0.5]
+        assert totals == {'lines': 6, 'priced_lines': 1, 'missing_lines': 5, 'quantity': 0.5, 'subtotal': 306.25}
+        json.dumps(priced_lines, allow_nan=False)
+
+
+def test_answer_cache_keyed_by_file_fingerprint():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_price_book(tmp)
+        cache = PriceIndexCache(snapshots=False)
+        answers = AnswerCache()
+        calls = []
+
+        def answer(question):
+            files = [(path, 'SKU Pricing.csv')]
+            return answers.get_or_compute('pricing', question, cache.fingerprint(files),
+                                          lambda: calls.append(question) or cache.view(files).find_prices('B24')[0]['price'])
+
+        assert answer('Cheapest B24') == 612.5
+        assert answer('  cheapest b24 ') == 612.5
+        assert len(calls) == 1
+
+        # Any change to the file's content changes the fingerprint
+        write_price_book(tmp, content=PRICE_BOOK_CSV.replace('$612.50', '$600.00'))
+        os.utime(path, ns=(1, 1))
+        assert answer('cheapest B24') == 600.0
+        assert answers.stats()['hits'] == 1 and answers.stats()['misses'] == 2
+
+
+def test_price_index_warm_start_restores_recent_books():
+    with tempfile.TemporaryDirectory() as tmp:
+        book = write_price_book(tmp)
+        extra = write_price_book(tmp, 'Accessories.csv', "SKU,Base\nFE12,95\n")
+        old = write_price_book(tmp, 'Old Book.csv', "SKU,Base\nB30,700\n")
+        cache = PriceIndexCache()
+        for path, label in [(old, 'Old Book.csv'), (extra, 'Accessories.csv'), (book, 'SKU Pricing.csv')]:
+            cache.view([(path, label)])
+        assert [entry['file'] for entry in PriceIndexCache.read_manifest(tmp)] == ['SKU Pricing.csv', 'Accessories.csv', 'Old Book.csv']
+
+        # A new process restores the most recently used books from their snapshots
+        restarted = PriceIndexCache()
+        restarted.warm_start(tmp, limit=2, background=False)
+        assert restarted.warm_status == {'status': 'done', 'total': 2, 'restored': 2, 'failed': 0}
+        assert restarted.stats()['entries'] == 2
+        misses = restarted.stats()['misses']
+        view = restarted.view([(book, 'SKU Pricing.csv'), (extra, 'Accessories.csv')])
+        assert restarted.stats()['misses'] == misses
+        assert find_prices_for_sku('FE12', view)[0]['price'] == 95.0
+
+        # Deleted files are skipped
+        os.remove(extra)
+        restarted = PriceIndexCache()
+        restarted.warm_start(tmp, limit=2, background=False)
+        assert restarted.warm_status['restored'] == 2 and restarted.stats()['entries'] == 2
+
+
+def test_price_index_warm_start_restores_recent_drawings():
+    with tempfile.TemporaryDirectory() as tmp:
+        book = write_price_book(tmp)
+        drawing = write_pdf(tmp, [['KITCHEN', 'W3030 BUTT', '31 1/2"']], 'Kitchen.pdf')
+        cache = PriceIndexCache()
+        cache.view([(book, 'SKU Pricing.csv')])
+        pdf_drawing_analyzer.load_drawing_analysis(drawing)
+        cache.note_drawing_used(drawing, 'Kitchen.pdf')
+        entries = PriceIndexCache.read_manifest(tmp)
+        assert [(entry['file'], entry['kind']) for entry in entries] == [('Kitchen.pdf', DRAWING), ('SKU Pricing.csv', PRICE_BOOK)]
+
+        # A new process restores the drawing's analysis from its sidecar alongside the price book
+        pdf_drawing_analyzer._analyses.clear()
+        restarted = PriceIndexCache()
+        with mock.patch.object(PDFDrawingAnalyzer, 'analyze', side_effect=AssertionError('re-analyzed')):
+            restarted.warm_start(tmp, background=False)
+            assert restarted.warm_status == {'status': 'done', 'total': 2, 'restored': 2, 'failed': 0}
+            assert pdf_drawing_analyzer._analyses.get(drawing_analysis_path(drawing)).report['sku_counts'] == {'W3030 BUTT': 1}
+        assert restarted.stats()['entries'] == 1
+        pdf_drawing_analyzer._analyses.clear()
+
+
+def test_price_index_warm_start_runs_in_each_serving_process():
+    with tempfile.TemporaryDirectory() as tmp:
+        book = write_price_book(tmp)
+        PriceIndexCache().view([(book, 'SKU Pricing.csv')])
+
+        app = Flask(__name__)
+        app.config.update(UPLOAD_FOLDER=tmp, WARM_START_MODE='blocking')
+        app.add_url_rule('/ping', 'ping', lambda: 'ok')
+        cache = PriceIndexCache()
+        cache.init_app(app)
+
+        # Nothing is loaded in the process that imported the app (it may fork the workers)
+        assert cache.warm_status['status'] == 'idle' and cache.stats()['entries'] == 0
+        client = app.test_client()
+        client.get('/ping')
+        assert cache.warm_status['status'] == 'done' and cache.stats()['entries'] == 1
+        client.get('/ping')
+        assert cache.warm_status['total'] == 1
+
+        # A forked worker (different pid) starts its own warm start
+        cache._warm_pid = -1
+        cache.clear()
+        client.get('/ping')
+        assert cache._warm_pid == os.getpid() and cache.stats()['entries'] == 1
+
+    # A parse pool inherited through fork is replaced rather than used
+    pool = price_parser.get_parse_pool()
+    price_parser._parse_pool_pid = -1
+    try:
+        assert price_parser.get_parse_pool() is not pool
+    finally:
+        pool.shutdown()
+        price_parser.shutdown_parse_pool()
+
+
+if __name__ == '__main__':
+    test_build_data_index()
+    test_build_data_index_option_pricing()
+    test_option_record_is_first_row_like_dict_index()
+    test_single_pass_xlsx_matches_pandas()
+    test_multi_sheet_workbook_index()
+    test_sheet_cache_sidecar()
+    test_compact_index_matches_dict_index()
+    test_price_index_cache_reuses_compiled_index()
+    test_price_index_cache_builds_missing_files_in_pool()
+    test_price_index_cache_respects_memory_budget()
+    test_price_index_snapshot_shared_by_cold_cache()
+    test_price_index_segments_added_and_dropped()
+    test_price_index_warm_start_restores_recent_books()
+    test_price_index_warm_start_restores_recent_drawings()
+    test_price_index_warm_start_runs_in_each_serving_process()
+    test_quote_lines()
+    test_answer_cache_keyed_by_file_fingerprint()
+    print("✅ Price index tests passed")
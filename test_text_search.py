@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for the PDF inverted line index
+"""
+
+import os
+import tempfile
+import threading
+from unittest import mock
+
+import pandas as pd
+from openpyxl import Workbook
+
+import text_search
+from pdf_text_cache import PdfText, remove_pdf_text_cache
+from test_pdf_text_cache import write_pdf
+from price_parser import remove_sheet_cache
+from test_price_index import write_price_book
+from text_search import CellIndex, LineIndex, cell_index_path, line_index_path, load_cell_index, load_line_index, search_pdf
+
+
+def make_index(pages):
+    return LineIndex.from_pdf_text(PdfText(['\n'.join(lines) + '\n' for lines in pages], [[] for _ in pages]))
+
+
+def test_line_index_ranking():
+    index = make_index([
+        ['DOOR STYLE: FROSTED GLASS', 'W1842 WALL CABINET', 'Glass doors are frosted'],
+        ['', 'W1842 frosted glass insert', 'B24 BASE CABINET', 'Hinges: soft close'],
+    ])
+    assert len(index) == 6
+
+    # Phrase matches rank first, then lines with more (and rarer) terms
+    total, matches = index.search('what is the price of frosted glass?')
+    assert total == 3
+    assert [(match['page'], match['text']) for match in matches] == [
+        (1, 'DOOR STYLE: FROSTED GLASS'), (2, 'W1842 frosted glass insert'), (1, 'Glass doors are frosted')
+    ]
+    assert matches[0]['score'] > matches[2]['score']
+
+    # Terms may match tokens they prefix, and results are limited
+    total, matches = index.search('w18', limit=1)
+    assert total == 2 and [match['line'] for match in matches] == [2]
+    assert index.search('ZZ99') == (0, []) and index.search('?') == (0, [])
+    # Stopwords only count when nothing else is asked
+    assert index.search('the')[0] == 0
+
+
+def test_line_index_persisted():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_pdf(tmp, [['KITCHEN LAYOUT', 'W3030 frosted'], ['FROSTED glass B24']])
+        total, matches = search_pdf(path, 'frosted')
+        assert total == 2 and matches[1]['page'] == 2
+        assert os.path.exists(line_index_path(path))
+
+        # A fresh process reads the sidecar instead of rebuilding
+        text_search._indexes.clear()
+        assert load_line_index(path).lines == ['KITCHEN LAYOUT', 'W3030 frosted', 'FROSTED glass B24']
+
+        remove_pdf_text_cache(path)
+        assert not os.path.exists(line_index_path(path))
+
+
+def test_index_builds_do_not_block_other_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        slow_path = write_pdf(tmp, [['SLOW SPEC BOOK']], 'slow.pdf')
+        book = write_price_book(tmp)
+        release, started = threading.Event(), threading.Event()
+        load_pdf_text = text_search.load_pdf_text
+
+        def slow_load(file_path):
+            started.set()
+            release.wait(10)
+            return load_pdf_text(file_path)
+
+        with mock.patch.object(text_search, 'load_pdf_text', slow_load):
+            builder = threading.Thread(target=load_line_index, args=(slow_path,))
+            builder.start()
+            assert started.wait(10)
+            # Another file's index builds while the slow PDF's build is still in flight
+            assert load_cell_index(book, 'SKU Pricing.csv').search('W3030')
+            assert builder.is_alive()
+            release.set()
+            builder.join(10)
+        assert load_line_index(slow_path).lines == ['SLOW SPEC BOOK']
+        assert len(text_search._build_locks) == 0
+
+
+def test_cell_index_search():
+    sheets = {
+        'Wall': pd.DataFrame({'SKU': ['W3030', 'W3036', 'B24'], 'Description': ['Wall cabinet', '', 'Base (frosted)'], 'Price': [980.0, 1010.5, 612.5]}),
+        'Notes': pd.DataFrame({'Note': ['w3030 ships flat', None]}),
+    }
+    index = CellIndex.from_sheets(sheets)
+
+    found = index.search('W30')
+    assert [(match['sheet'], match['column'], len(match['rows'])) for match in found] == [('Wall', 'SKU', 2), ('Notes', 'Note', 1)]
+    assert found[0]['rows'][0] == {'SKU': 'W3030', 'Description': 'Wall cabinet', 'Price': 980.0}
+
+    # Numbers match as displayed, short and punctuated questions match literally
+    assert index.search('12.5')[0]['rows'][0]['SKU'] == 'B24'
+    assert [match['column'] for match in index.search('a')] == ['Description', 'Note']
+    assert index.search('(frosted)')[0]['rows'][0]['SKU'] == 'B24'
+    assert index.search('zz99') == [] and index.search('none') == []
+    assert len(index.search('w', max_rows=1)[0]['rows']) == 1
+
+
+def test_cell_index_persisted():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Book.xlsx')
+        workbook = Workbook()
+        for row in [['SKU', 'Prime Maple'], ['W3030', 980], ['B24', 612.5]]:
+            workbook.active.append(row)
+        workbook.save(path)
+        assert load_cell_index(path, 'Book.xlsx').search('B24')[0]['rows'][0]['Prime Maple'] == 612.5
+        assert os.path.exists(cell_index_path(path))
+
+        text_search._indexes.clear()
+        assert load_cell_index(path, 'Book.xlsx').search('W3030')
+        remove_sheet_cache(path)
+        assert not os.path.exists(cell_index_path(path))
+        assert load_cell_index(write_price_book(tmp, 'broken.xlsx', 'not a workbook'), 'broken.xlsx') is None
+
+
+if __name__ == '__main__':
+    test_line_index_ranking()
+    test_line_index_persisted()
+    test_index_builds_do_not_block_other_files()
+    test_cell_index_search()
+    test_cell_index_persisted()
+    print("✅ Text search tests passed")
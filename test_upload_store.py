@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for content-addressed upload storage
+"""
+
+import io
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from unittest import mock
+
+from werkzeug.datastructures import FileStorage
+
+import cache_utils
+import upload_store
+from cache_utils import file_content_hash
+from upload_store import link_upload, save_upload, storing_upload, upload_lock
+
+
+def upload(content, filename):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+def test_uploads_stored_once_per_content():
+    with tempfile.TemporaryDirectory() as tmp:
+        content = b'SKU,Base\nB24,300\n' * 1000
+        content_hash = hashlib.sha256(content).hexdigest()
+
+        name, size, created = save_upload(upload(content, 'Catalog.CSV'), tmp)
+        assert (name, size, created) == (f'{content_hash}.csv', len(content), True)
+
+        # The same content under another name is not stored again
+        assert save_upload(upload(content, 'Copy.csv'), tmp) == (name, len(content), False)
+        assert save_upload(upload(b'other', 'Copy.csv'), tmp)[0] != name
+        assert sorted(os.listdir(tmp)) == sorted([name, f'{hashlib.sha256(b"other").hexdigest()}.csv'])
+
+        # The hash computed while streaming is reused
+        with mock.patch.object(cache_utils.hashlib, 'sha256') as sha256:
+            assert file_content_hash(os.path.join(tmp, name)) == content_hash
+            assert not sha256.called
+
+        alias = link_upload(tmp, name, '123_Catalog.csv')
+        assert open(alias, 'rb').read() == content
+        os.remove(os.path.join(tmp, name))
+        assert open(alias, 'rb').read() == content
+
+
+def test_delete_waits_for_new_reference():
+    with tempfile.TemporaryDirectory() as tmp:
+        content = b'SKU,Base\nB24,300\n'
+        name = save_upload(upload(content, 'Catalog.csv'), tmp)[0]
+        references = set()  # the other projects' ProjectFile rows for the stored upload
+        stored = threading.Event()
+
+        def delete_project():
+            # What deleting the first project does with its (so far only) reference
+            stored.wait(10)
+            with upload_lock(name):
+                if not references:
+                    os.remove(os.path.join(tmp, name))
+
+        deleter = threading.Thread(target=delete_project)
+        deleter.start()
+        # Another project uploads the same content; the delete waits until its reference is recorded
+        with storing_upload(upload(content, 'Again.csv'), tmp) as (stored_name, _, created):
+            assert stored_name == name and not created
+            stored.set()
+            time.sleep(0.2)
+            references.add('project 2')
+        deleter.join(10)
+        assert os.path.exists(os.path.join(tmp, name))
+        assert len(upload_store._upload_locks) == 0
+
+
+if __name__ == '__main__':
+    test_uploads_stored_once_per_content()
+    test_delete_waits_for_new_reference()
+    print("✅ Upload store tests passed")
@@ -0,0 +1,316 @@
+"""
+Text search for /api/ask
+Persisted search indexes built once per file: an inverted line index (token -> line postings
+with positions) over PDF text, and a trigram index over the cells of parsed workbooks
+"""
+
+import os
+import re
+import sys
+import math
+import bisect
+from collections import defaultdict
+
+import numpy as np
+
+from cache_utils import BudgetedLRUCache, KeyedLocks, read_sidecar, write_sidecar
+from pdf_text_cache import PDF_TEXT_CACHE_DIR, PDF_TEXT_VERSION, load_pdf_text, pdf_text_cache_path
+from price_parser import PARSER_VERSION, SHEET_CACHE_DIR, load_sheets, sheet_cache_path
+
+# Bump whenever tokenization or an index layout changes so indexes are rebuilt
+LINE_INDEX_VERSION = '1'
+CELL_INDEX_VERSION = '1'
+DEFAULT_SEARCH_INDEX_MEMORY_BYTES = 128 * 1024 * 1024
+DEFAULT_MAX_RESULTS = 20
+# Matching rows returned per (sheet, column) by cell searches
+DEFAULT_MAX_ROWS = 5
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# Question words that would otherwise match most lines of a spec book
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how',
+    'i', 'in', 'is', 'it', 'me', 'much', 'of', 'on', 'or', 'show', 'tell', 'that', 'the', 'there',
+    'this', 'to', 'what', 'when', 'where', 'which', 'who', 'why', 'with'
+])
+
+_indexes = BudgetedLRUCache(DEFAULT_SEARCH_INDEX_MEMORY_BYTES)
+# Per index path, so building one file's index never blocks lookups or builds for others
+_build_locks = KeyedLocks()
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LineIndex:
+    """
+    Inverted index over the non-empty lines of a PDF.
+    postings[token] is an (n, 2) int32 array of (line id, token position in the line),
+    sorted by line; pages[line id] is the line's 1-based page number.
+    """
+
+    __slots__ = ('lines', 'pages', 'postings', 'vocabulary')
+
+    def __init__(self, lines, pages, postings):
+        self.lines = lines
+        self.pages = pages
+        self.postings = postings
+        self.vocabulary = sorted(postings)  # for prefix matches (e.g. "W18" -> "w1842")
+
+    @classmethod
+    def from_pdf_text(cls, pdf_text):
+        lines, pages = [], []
+        postings = defaultdict(list)
+        for page_number, page in enumerate(pdf_text.pages, start=1):
+            for line in page.splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                line_id = len(lines)
+                lines.append(line)
+                pages.append(page_number)
+                for position, token in enumerate(tokenize(line)):
+                    postings[token].append((line_id, position))
+        return cls(lines, np.array(pages, dtype=np.int32),
+                   {token: np.array(entries, dtype=np.int32) for token, entries in postings.items()})
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def nbytes(self):
+        return (sum(sys.getsizeof(line) for line in self.lines) + self.pages.nbytes
+                + sum(sys.getsizeof(token) + entries.nbytes for token, entries in self.postings.items()))
+
+    def _term_postings(self, term):
+        """Postings of a term, or of every token it prefixes when it is not a token itself."""
+        entries = self.postings.get(term)
+        if entries is not None:
+            return entries
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + '\uffff')
+        if start == end:
+            return None
+        return np.concatenate([self.postings[token] for token in self.vocabulary[start:end]])
+
+    def _phrase_lines(self, term_offsets):
+        """Lines containing the terms at the same relative positions, given [(term, offset in the question)]."""
+        starts = None
+        for term, offset in term_offsets:
+            entries = self._term_postings(term).astype(np.int64)
+            # (line id, phrase start position) packed into one integer per posting; the start
+            # is biased by 2**31 as it is negative when the term can't start the phrase
+            term_starts = np.unique((entries[:, 0] << 32) + (entries[:, 1] - offset + (1 << 31)))
+            starts = term_starts if starts is None else np.intersect1d(starts, term_starts, assume_unique=True)
+            if not len(starts):
+                break
+        return np.unique(starts >> 32)
+
+    def search(self, query, limit=DEFAULT_MAX_RESULTS):
+        """
+        Ranked matching lines for a question: lines containing the question's terms as a phrase
+        first, then lines matching more of its terms, rarer terms weighing more.
+        Returns (total matching lines, [{'page', 'line', 'text', 'score'}] up to limit).
+        """
+        terms = tokenize(query)
+        content_terms = list(dict.fromkeys(term for term in terms if term not in STOPWORDS)) or list(dict.fromkeys(terms))
+        if not content_terms:
+            return 0, []
+
+        scores = np.zeros(len(self.lines))
+        matched_terms = np.zeros(len(self.lines), dtype=np.int32)
+        found_terms = set()
+        for term in content_terms:
+            entries = self._term_postings(term)
+            if entries is None:
+                continue
+            found_terms.add(term)
+            line_ids = np.unique(entries[:, 0])
+            scores[line_ids] += math.log(1 + len(self.lines) / len(line_ids))
+            matched_terms[line_ids] += 1
+
+        # The question's known terms as a phrase ("price of frosted glass" -> "frosted glass")
+        in_phrase = np.zeros(len(self.lines), dtype=bool)
+        phrase = [(term, offset) for offset, term in enumerate(terms) if term in found_terms]
+        if len(phrase) > 1:
+            in_phrase[self._phrase_lines(phrase)] = True
+            scores[in_phrase] += len(content_terms)
+
+        # Phrase lines first, then more terms, rarer terms and earlier lines
+        candidates = np.flatnonzero(matched_terms)
+        ranked = candidates[np.lexsort((candidates, -scores[candidates], -matched_terms[candidates], ~in_phrase[candidates]))]
+        return len(candidates), [
+            {
+                'page': int(self.pages[line_id]),
+                'line': int(line_id) + 1,
+                'text': self.lines[line_id],
+                'score': round(float(scores[line_id]), 3)
+            }
+            for line_id in ranked[:limit]
+        ]
+
+
+def line_index_path(file_path):
+    # Lives next to (and is removed with) the PDF's text in the PDF text cache
+    content_hash = os.path.basename(pdf_text_cache_path(file_path)).split('-v')[0]
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), PDF_TEXT_CACHE_DIR,
+                        f"{content_hash}-lines-v{PDF_TEXT_VERSION}.{LINE_INDEX_VERSION}.pkl")
+
+
+def load_line_index(file_path):
+    """The PDF's LineIndex from memory or its sidecar, building (and persisting) it on first use."""
+    path = line_index_path(file_path)
+    line_index = _indexes.get(path)
+    if line_index is not None:
+        return line_index
+
+    with _build_locks.hold(path):
+        line_index = _indexes.get(path)
+        if line_index is None:
+            cached = read_sidecar(path)
+            if cached is not None:
+                line_index = LineIndex(*cached)
+        if line_index is None:
+            line_index = LineIndex.from_pdf_text(load_pdf_text(file_path))
+            content_hash = os.path.basename(path).split('-lines-')[0]
+            write_sidecar(path, (line_index.lines, line_index.pages, line_index.postings), f"{content_hash}-lines-*.pkl")
+        _indexes.put(path, line_index, line_index.nbytes)
+    return line_index
+
+
+def search_pdf(file_path, query, limit=DEFAULT_MAX_RESULTS):
+    """LineIndex.search over a PDF's persisted line index."""
+    return load_line_index(file_path).search(query, limit)
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CellIndex:
+    """
+    Substring search over every cell of a workbook's parsed sheets.
+    Each distinct lowercased cell string (texts) is indexed by its trigrams; the cells are
+    listed in sheet, column, row order as (sheet id, column id, row, text id) arrays, and
+    rows keeps every sheet's values so matching rows come back without loading the sheets.
+    """
+
+    __slots__ = ('sheets', 'columns', 'rows', 'texts', 'cell_sheets', 'cell_columns', 'cell_rows', 'cell_texts', 'trigrams')
+
+    def __init__(self, sheets, columns, rows, texts, cell_sheets, cell_columns, cell_rows, cell_texts, trigrams):
+        self.sheets = sheets
+        self.columns = columns
+        self.rows = rows
+        self.texts = texts
+        self.cell_sheets = cell_sheets
+        self.cell_columns = cell_columns
+        self.cell_rows = cell_rows
+        self.cell_texts = cell_texts
+        self.trigrams = trigrams
+
+    @classmethod
+    def from_sheets(cls, sheets):
+        """Indexes {sheet name: DataFrame} as load_sheets returns it."""
+        sheet_names, columns, rows = [], [], []
+        text_ids = {}
+        cells = []
+        for sheet_id, (sheet_name, df) in enumerate(sheets.items()):
+            sheet_names.append(sheet_name)
+            columns.append([str(column) for column in df.columns])
+            rows.append(df.to_dict(orient='split', index=False)['data'])
+            for column_id in range(df.shape[1]):
+                # The same strings str.contains would search; blank and NaN cells never match
+                for row, text in enumerate(df.iloc[:, column_id].astype(str).str.lower().tolist()):
+                    if isinstance(text, str) and text:
+                        cells.append((sheet_id, column_id, row, text_ids.setdefault(text, len(text_ids))))
+
+        postings = defaultdict(list)
+        for text, text_id in text_ids.items():
+            for trigram in trigrams(text):
+                postings[trigram].append(text_id)
+
+        cells = np.array(cells, dtype=np.int32).reshape(-1, 4)
+        return cls(sheet_names, columns, rows, list(text_ids), cells[:, 0].copy(), cells[:, 1].copy(), cells[:, 2].copy(),
+                   cells[:, 3].copy(), {trigram: np.array(text_ids, dtype=np.int32) for trigram, text_ids in postings.items()})
+
+    @property
+    def nbytes(self):
+        return (sum(sys.getsizeof(text) for text in self.texts)
+                + sum(entries.nbytes + 64 for entries in self.trigrams.values())
+                + 4 * self.cell_texts.nbytes
+                + 64 * sum(len(sheet_rows) * len(sheet_columns) for sheet_rows, sheet_columns in zip(self.rows, self.columns)))
+
+    def _matching_texts(self, needle):
+        if len(needle) < 3:
+            return [text_id for text_id, text in enumerate(self.texts) if needle in text]
+
+        candidates = None
+        for trigram in sorted(trigrams(needle), key=lambda trigram: len(self.trigrams.get(trigram, ()))):
+            entries = self.trigrams.get(trigram)
+            if entries is None:
+                return []
+            candidates = entries if candidates is None else np.intersect1d(candidates, entries, assume_unique=True)
+            if not len(candidates):
+                return []
+        return [text_id for text_id in candidates.tolist() if needle in self.texts[text_id]]
+
+    def search(self, question, max_rows=DEFAULT_MAX_ROWS):
+        """
+        Case-insensitive substring search for the question in every cell. Returns
+        [{'sheet', 'column', 'rows'}] for each sheet column with matches, in sheet and column
+        order, with the first max_rows matching rows as {column: value} records.
+        """
+        text_ids = self._matching_texts(question.lower())
+        if not text_ids:
+            return []
+
+        matched = np.zeros(len(self.texts), dtype=bool)
+        matched[text_ids] = True
+        cells = np.flatnonzero(matched[self.cell_texts])
+        groups = (self.cell_sheets[cells].astype(np.int64) << 32) + self.cell_columns[cells]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]).tolist()
+
+        found = []
+        for start, end in zip(starts, starts[1:] + [len(cells)]):
+            sheet_id, column_id = int(self.cell_sheets[cells[start]]), int(self.cell_columns[cells[start]])
+            columns, rows = self.columns[sheet_id], self.rows[sheet_id]
+            found.append({
+                'sheet': self.sheets[sheet_id],
+                'column': columns[column_id],
+                'rows': [dict(zip(columns, rows[row])) for row in self.cell_rows[cells[start:min(end, start + max_rows)]].tolist()]
+            })
+        return found
+
+
+def cell_index_path(file_path):
+    # Lives next to (and is removed with) the workbook's parsed-sheet sidecar
+    content_hash = os.path.basename(sheet_cache_path(file_path)).split('-v')[0]
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), SHEET_CACHE_DIR,
+                        f"{content_hash}-cells-v{PARSER_VERSION}.{CELL_INDEX_VERSION}.pkl")
+
+
+def load_cell_index(file_path, filename):
+    """
+    The workbook's CellIndex from memory or its sidecar, building (and persisting) it from
+    the parsed sheets on first use. None if the workbook can't be read.
+    """
+    path = cell_index_path(file_path)
+    cell_index = _indexes.get(path)
+    if cell_index is not None:
+        return cell_index
+
+    with _build_locks.hold(path):
+        cell_index = _indexes.get(path)
+        if cell_index is None:
+            cached = read_sidecar(path)
+            if cached is not None:
+                cell_index = CellIndex(*cached)
+        if cell_index is None:
+            sheets = load_sheets(file_path, filename)
+            if sheets is None:
+                return None
+            cell_index = CellIndex.from_sheets(sheets)
+            content_hash = os.path.basename(path).split('-cells-')[0]
+            write_sidecar(path, tuple(getattr(cell_index, name) for name in CellIndex.__slots__), f"{content_hash}-cells-*.pkl")
+        _indexes.put(path, cell_index, cell_index.nbytes)
+    return cell_index
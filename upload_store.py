@@ -0,0 +1,94 @@
+"""
+Content-addressed upload storage
+Uploads are streamed to disk while being hashed and stored once per content hash
+"""
+
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager
+
+from cache_utils import KeyedLocks, remember_content_hash
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Per stored name, so a shared upload is never removed while another request stores it again
+_upload_locks = KeyedLocks()
+
+
+def stored_upload_name(content_hash, filename):
+    """<sha256><extension>; the extension is kept because parsers dispatch on it."""
+    return f"{content_hash}{os.path.splitext(filename)[1].lower()}"
+
+
+def upload_lock(name):
+    """
+    Lock for one stored upload. Deleting an upload checks that nothing else references it
+    and removes it under this lock; storing_upload holds it until the new reference is recorded.
+    """
+    return _upload_locks.hold(name)
+
+
+def save_upload(file, upload_folder, filename=None):
+    """
+    Streams an uploaded file (werkzeug FileStorage) into upload_folder under its content
+    hash. Returns (stored name, size, created); created is False when the same content
+    was already stored, in which case the upload costs no extra disk and shares the
+    existing file's sidecars and indexes.
+    """
+    with storing_upload(file, upload_folder, filename) as stored:
+        return stored
+
+
+@contextmanager
+def storing_upload(file, upload_folder, filename=None):
+    """
+    save_upload that keeps the stored upload's lock until the block exits, so the caller
+    can record its reference (e.g. commit the ProjectFile row) before a concurrent delete
+    of the same content decides whether the file is still in use.
+    """
+    filename = filename or file.filename
+    # Dot-prefixed, so directory scans for uploaded files skip it
+    tmp_path = os.path.join(upload_folder, f".upload-{uuid.uuid4().hex}")
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                sha.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        content_hash = sha.hexdigest()
+        name = stored_upload_name(content_hash, filename)
+        path = os.path.join(upload_folder, name)
+        with upload_lock(name):
+            created = not os.path.exists(path)
+            if created:
+                os.replace(tmp_path, path)
+            remember_content_hash(path, content_hash)
+            yield name, size, created
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def link_upload(upload_folder, name, alias):
+    """
+    Makes a stored upload also reachable as alias (for lookups by the original file name)
+    with a hard link, falling back to a copy where hard links aren't supported.
+    """
+    path = os.path.join(upload_folder, name)
+    alias_path = os.path.join(upload_folder, alias)
+    if os.path.exists(alias_path):
+        os.remove(alias_path)
+    try:
+        os.link(path, alias_path)
+    except OSError as e:
+        logger.warning(f"Could not hard link {alias} to {name}, copying instead: {e}")
+        shutil.copyfile(path, alias_path)
+    return alias_path